@@ -0,0 +1,166 @@
+import os
+import time
+import queue
+import random
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from env_pool import make_worker_env
+
+# Actor processes for Agent.train_distributed. Every actor plays its own ZombieShooter(render_mode="rgb")
+# with a fixed epsilon and a local copy of the twin network. Transitions go to the learner in chunks
+# through a queue. The learner publishes its weights into shared-memory tensors, and actors copy them in
+# whenever the version counter has moved.
+
+
+def actor_epsilons(num_actors, epsilon=0.4, alpha=7):
+    # Ape-X schedule: actor i explores with epsilon ** (1 + alpha * i / (N - 1)).
+    if num_actors == 1:
+        return [epsilon]
+    return [epsilon ** (1 + alpha * i / (num_actors - 1)) for i in range(num_actors)]
+
+
+def actor(index, env_kwargs, model_kwargs, shared_params, lock, version, transitions, stop, epsilon,
+          step_repeat, frame_stack, max_episode_steps, sync_every, send_every, num_threads, core):
+    if core is not None:
+        os.sched_setaffinity(0, {core})
+    torch.set_num_threads(num_threads)
+
+    from model import TwinZombieNet
+    from buffer import stack_frames
+
+    env = make_worker_env(env_kwargs)
+    model = TwinZombieNet(**model_kwargs)
+    params = list(model.parameters())
+    seen = -1
+
+    def send(message):
+        # Blocks while the learner is behind, but gives up once training stops.
+        while not stop.is_set():
+            try:
+                transitions.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    state, _ = env.reset()
+    stacked_state = stack_frames(None, state, frame_stack)
+    episode_reward = 0
+    episode_steps = 0
+    steps = 0
+    chunk = []
+
+    while not stop.is_set():
+
+        if steps % sync_every == 0 and version.value != seen:
+            with lock, torch.no_grad():
+                seen = version.value
+                torch._foreach_copy_(params, shared_params)
+
+        if random.random() < epsilon:
+            action = env.action_space.sample()
+        else:
+            with torch.no_grad():
+                q_values = model(stacked_state.unsqueeze(0))[:, 0].min(dim=0).values
+                action = torch.argmax(q_values, dim=-1).item()
+
+        next_state, reward, done, _, _ = env.step(action=action, repeat=step_repeat)
+
+        chunk.append((state.numpy().astype(np.uint8), action, reward, next_state.numpy().astype(np.uint8), done))
+
+        state = next_state
+        stacked_state = stack_frames(stacked_state, next_state, frame_stack)
+
+        episode_reward += reward
+        episode_steps += 1
+        steps += 1
+
+        finished = done or episode_steps >= max_episode_steps
+
+        if len(chunk) >= send_every or finished:
+            send(("transitions", index, chunk))
+            chunk = []
+
+        if finished:
+            send(("episode", index, episode_reward, episode_steps))
+
+            state, _ = env.reset()
+            stacked_state = stack_frames(None, state, frame_stack)
+            episode_reward = 0
+            episode_steps = 0
+
+
+class ActorPool():
+
+    def __init__(self, num_actors, env_kwargs, model, model_kwargs, epsilons, step_repeat, frame_stack=1,
+                 max_episode_steps=float("inf"), sync_every=100, send_every=32, actor_threads=1, pin_cores=False):
+
+        ctx = mp.get_context("spawn")
+
+        self.num_actors = num_actors
+        self.shared_params = [param.detach().cpu().clone().share_memory_() for param in model.parameters()]
+        self.lock = ctx.Lock()
+        self.version = ctx.Value("i", 0)
+        self.transitions = ctx.Queue(maxsize=4 * num_actors)
+        self.stop = ctx.Event()
+
+        # Core 0 of the allowed set is left to the learner.
+        self.cores = sorted(os.sched_getaffinity(0)) if pin_cores else None
+
+        self.processes = []
+
+        for index in range(num_actors):
+            core = self.cores[(index + 1) % len(self.cores)] if pin_cores else None
+
+            process = ctx.Process(target=actor, daemon=True, args=(
+                index, env_kwargs, model_kwargs, self.shared_params, self.lock, self.version, self.transitions,
+                self.stop, epsilons[index], step_repeat, frame_stack, max_episode_steps, sync_every, send_every,
+                actor_threads, core))
+            process.start()
+
+            self.processes.append(process)
+
+    def learner_core(self):
+        return self.cores[0] if self.cores else None
+
+    def publish(self, model):
+        params = [param.detach().cpu() for param in model.parameters()]
+
+        with self.lock, torch.no_grad():
+            torch._foreach_copy_(self.shared_params, params)
+            self.version.value += 1
+
+    def receive(self, block):
+        # Everything queued so far; with block, waits up to a second for the first message. Raises once
+        # an actor has died, so the learner doesn't wait forever on actors that are gone.
+        for index, process in enumerate(self.processes):
+            if process.exitcode not in (None, 0):
+                raise RuntimeError(f"Actor {index} exited with code {process.exitcode}")
+
+        return self.drain(block)
+
+    def drain(self, block=False):
+        messages = []
+
+        try:
+            messages.append(self.transitions.get(timeout=1) if block else self.transitions.get_nowait())
+            while True:
+                messages.append(self.transitions.get_nowait())
+        except queue.Empty:
+            pass
+
+        return messages
+
+    def close(self):
+        self.stop.set()
+
+        # Drain so no actor stays blocked on a full queue.
+        deadline = time.time() + 5
+        while any(process.is_alive() for process in self.processes) and time.time() < deadline:
+            self.drain()
+            time.sleep(0.05)
+
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
@@ -1,5 +1,12 @@
-from model import ZombieNet, hard_update, soft_update
-from buffer import ReplayBuffer
+from model import TwinZombieNet, hard_update, soft_update, bf16_supported, compile_model
+from buffer import FrameReplayBuffer, DiskReplayBuffer, CompressedReplayBuffer, PrioritizedReplayBuffer, stack_frames
+from sampler import PrefetchSampler
+from actor_learner import ActorPool, actor_epsilons
+from learner import BackgroundLearner
+from metrics import MetricsLogger
+from profiler import profiler
+from quantize import head_networks, calibration_states, quantize_twin, script_quantized, export_quantized
+import numpy as np
 import torch
 import torch.optim as optim
 import torch.nn.functional as F
@@ -8,13 +15,13 @@ import time
 from torch.utils.tensorboard import SummaryWriter
 import random
 import os
+import threading
 from game import ZombieShooter
-from pympler import asizeof
 
 
 class Agent():
 
-    def __init__(self, env : ZombieShooter, dropout, hidden_layer, learning_rate, step_repeat, gamma):
+    def __init__(self, env : ZombieShooter, dropout, hidden_layer, learning_rate, step_repeat, gamma, frame_stack=1, replay_dir=None, compress_replay=False, prioritized_replay=False, prefetch=False, memory_size=500000, fast_train=False, torch_compile=False, quantized_acting=False, quantize_every=5000):
 
         self.env = env
 
@@ -22,39 +29,155 @@ class Agent():
 
         self.gamma = gamma
 
+        # The networks see the last frame_stack observations stacked on the channel axis.
+        self.frame_stack = frame_stack
+
         observation, info = self.env.reset()
 
+        # Batched environments (EnvPool, VecZombieShooter) return one observation per world.
+        self.batched = hasattr(env, "num_envs")
+
+        if self.batched:
+            observation = observation[0]
+
         self.device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
 
         print("Model loaded on: ", self.device)
 
-        self.memory = ReplayBuffer(max_size=500000, input_shape=observation.shape, n_actions=env.action_space.n, device=self.device)
+        # With replay_dir the buffer lives in memory-mapped files there and a restarted run picks it up again.
+        # compress_replay keeps the frames zlib-compressed in RAM instead. prioritized_replay samples
+        # transitions by TD error from uncompressed RAM storage, so it can't be combined with either.
+        if prioritized_replay and (replay_dir or compress_replay):
+            raise ValueError("prioritized_replay keeps uncompressed frames in RAM and can't be combined with replay_dir or compress_replay")
 
-        self.model_1 = ZombieNet(action_dim=env.action_space.n, hidden_dim=hidden_layer, dropout=dropout, observation_shape=observation.shape).to(self.device)
-        self.model_2 = ZombieNet(action_dim=env.action_space.n, hidden_dim=hidden_layer, dropout=dropout, observation_shape=observation.shape).to(self.device)  
-        
-        self.target_model_1 = ZombieNet(action_dim=env.action_space.n, hidden_dim=hidden_layer, dropout=dropout, observation_shape=observation.shape).to(self.device)  
-        self.target_model_2 = ZombieNet(action_dim=env.action_space.n, hidden_dim=hidden_layer, dropout=dropout, observation_shape=observation.shape).to(self.device)  
+        self.prioritized = prioritized_replay
+
+        if prioritized_replay:
+            self.memory = PrioritizedReplayBuffer(max_size=memory_size, input_shape=observation.shape, n_actions=env.action_space.n, device=self.device, frame_stack=frame_stack)
+        elif replay_dir:
+            self.memory = DiskReplayBuffer(max_size=memory_size, input_shape=observation.shape, n_actions=env.action_space.n, directory=replay_dir, device=self.device, frame_stack=frame_stack)
+        elif compress_replay:
+            self.memory = CompressedReplayBuffer(max_size=memory_size, input_shape=observation.shape, n_actions=env.action_space.n, device=self.device, frame_stack=frame_stack)
+        else:
+            self.memory = FrameReplayBuffer(max_size=memory_size, input_shape=observation.shape, n_actions=env.action_space.n, device=self.device, frame_stack=frame_stack)
+
+        observation = observation.repeat(frame_stack, 1, 1)
+
+        # Both Q networks (and both targets) live in one TwinZombieNet; forward returns (2, batch, actions).
+        # Adam is elementwise, so one optimizer over both heads is the same as one per network.
+        self.model_kwargs = dict(action_dim=env.action_space.n, hidden_dim=hidden_layer, dropout=dropout, observation_shape=tuple(observation.shape), fast=fast_train)
+
+        self.model = TwinZombieNet(**self.model_kwargs).to(self.device)
+        self.target_model = TwinZombieNet(**self.model_kwargs).to(self.device)
 
-        hard_update(self.target_model_1, self.model_1)
-        hard_update(self.target_model_2, self.model_2)
+        hard_update(self.target_model, self.model)
 
-        self.optimizer_1 = optim.Adam(self.model_1.parameters(), lr=learning_rate)
-        self.optimizer_2 = optim.Adam(self.model_2.parameters(), lr=learning_rate)
+        # fast_train: channels_last convolutions with the input scaling folded into conv1 (see TwinZombieNet)
+        # and bf16 autocast for updates where the hardware runs it natively. torch_compile also runs the
+        # updates through torch.compile, falling back to eager mode when that fails.
+        self.bf16 = fast_train and bf16_supported(self.device)
+
+        self.learn_model = self.model
+        self.learn_target_model = self.target_model
+
+        if torch_compile:
+            example = torch.zeros(2, *observation.shape, device=self.device)
+            self.learn_model = compile_model(self.model, example, self.mixed_precision)
+            self.learn_target_model = compile_model(self.target_model, example, self.mixed_precision)
+
+        self.optimizer = optim.Adam(self.model.parameters(), lr=learning_rate)
+
+        # quantized_acting: greedy actions come from an int8 copy of the heads (quantize.py), rebuilt on a
+        # background thread every quantize_every env steps once the replay buffer can calibrate it, and
+        # exported to models/dqn_int8.pt. Until then, and on GPUs, the float model acts. train_distributed's
+        # actors keep acting with their own float copies, so there it is not built at all.
+        self.quantized_acting = quantized_acting and self.device == 'cpu'
+        self.quantize_every = quantize_every
+        self.acting_model = None
+        self.quantize_thread = None
+        self.last_quantize_step = 0
 
         self.learning_rate = learning_rate
 
-        print(f"Memory Size: {asizeof.asizeof(self.memory) / (1024 * 1024 * 1024):2f} Gb")
+        # With prefetch, batches come from a PrefetchSampler thread built once the batch size is known.
+        self.prefetch = prefetch
+        self.sampler = None
+
+        # Held while the weights change, so a BackgroundLearner never steps them under a forward pass or a save.
+        self.update_lock = threading.Lock()
+
+        print(f"Memory Size: {self.memory.nbytes() / (1024 * 1024 * 1024):2f} Gb")
+
+    def mixed_precision(self):
+        return torch.autocast(device_type=self.device.split(':')[0], dtype=torch.bfloat16, enabled=self.bf16)
+
+    def stack_frames(self, stacked, frames):
+        return stack_frames(stacked, frames, self.frame_stack)
+
+    def select_actions(self, states, epsilon):
+        # Batched epsilon-greedy over the twin-Q minimum, one action per row of states.
+        with torch.no_grad():
+            if self.acting_model is not None:
+                q_values = self.acting_model(states).min(dim=0).values
+            else:
+                q_values = self.model(states.to(self.device)).min(dim=0).values
+            actions = torch.argmax(q_values, dim=-1).cpu().numpy()
+
+        explore = np.random.random(len(actions)) < epsilon
+        actions[explore] = np.random.randint(0, self.env.action_space.n, explore.sum())
+
+        return actions
 
     
-    def train(self, episodes, max_episode_steps, summary_writer_suffix, batch_size, epsilon, epsilon_decay, min_epsilon):
+    def save_checkpoint(self, metrics):
+        # The head weights are copied here and written to disk on the metrics thread.
+        with self.update_lock:
+            heads = [self.model.head_state_dict(head) for head in range(2)]
+
+        metrics.run(lambda: [torch.save(state, filename) for state, filename in zip(heads, ('models/dqn1.pt', 'models/dqn2.pt'))])
+
+    def requantize(self, total_steps, metrics):
+        # Called by the env loops; starts a rebuild unless it is too soon or the last one is still running.
+        if not self.quantized_acting or total_steps - self.last_quantize_step < self.quantize_every:
+            return
+
+        if not self.memory.can_sample(64) or (self.quantize_thread and self.quantize_thread.is_alive()):
+            return
+
+        self.last_quantize_step = total_steps
+        self.quantize_thread = threading.Thread(target=self.update_acting_model, args=(metrics,), daemon=True)
+        self.quantize_thread.start()
+
+    def wait_for_requantize(self):
+        if self.quantize_thread:
+            self.quantize_thread.join()
+
+    def update_acting_model(self, metrics):
+        # Calibrated on a fresh replay sample each time, as the activation ranges move with the weights.
+        # The env thread keeps acting with the previous model until the new one replaces it.
+        with self.update_lock:
+            nets = head_networks(self.model, self.model_kwargs)
+
+        states = calibration_states(self.memory)
+        self.acting_model = script_quantized(quantize_twin(nets, states), states[:1])
+
+        metrics.run(export_quantized, self.acting_model, 'models/dqn_int8.pt')
+
+    def train(self, episodes, max_episode_steps, summary_writer_suffix, batch_size, epsilon, epsilon_decay, min_epsilon, replay_ratio=None, metrics_every=1000):
+
+        # replay_ratio (updates per env step) moves learning onto a BackgroundLearner thread; None updates
+        # inline once per step. Metrics are summarized to TensorBoard every metrics_every env steps.
+        if self.batched:
+            return self.train_batched(episodes, max_episode_steps, summary_writer_suffix, batch_size, epsilon, epsilon_decay, min_epsilon, replay_ratio, metrics_every)
 
         summary_writer_name = f'runs/{datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}_{summary_writer_suffix}'
 
-        writer = SummaryWriter(summary_writer_name)
+        metrics = MetricsLogger(SummaryWriter(summary_writer_name), self.memory, flush_every=metrics_every)
 
         if not os.path.exists('models'):
             os.makedirs('models')
+
+        learner = BackgroundLearner(self, batch_size, metrics, replay_ratio) if replay_ratio else None
         
         total_steps = 0
 
@@ -63,90 +186,328 @@ class Agent():
             done = False
             episode_reward = 0
             state, info = self.env.reset()
+            stacked_state = self.stack_frames(None, state)
             episode_steps = 0
 
             episode_start_time = time.time()
 
             while not done and episode_steps < max_episode_steps:
 
-                if random.random() < epsilon:
-                    action = self.env.action_space.sample()
-                else:
-                    q_values_1 = self.model_1.forward(state.unsqueeze(0).to(self.device))[0]
-                    q_values_2 = self.model_2.forward(state.unsqueeze(0).to(self.device))[0]
-                    q_values = torch.min(q_values_1, q_values_2)
-                    action = torch.argmax(q_values, dim=-1).item()
+                step_start = time.perf_counter()
+
+                with profiler.scope("agent/select_action"):
+                    if random.random() < epsilon:
+                        action = self.env.action_space.sample()
+                    elif self.acting_model is not None:
+                        with torch.no_grad():
+                            q_values = self.acting_model(stacked_state.unsqueeze(0))[:, 0].min(dim=0).values
+                        action = torch.argmax(q_values, dim=-1).item()
+                    else:
+                        with self.update_lock:
+                            q_values = self.model.forward(stacked_state.unsqueeze(0).to(self.device))[:, 0].min(dim=0).values
+                        action = torch.argmax(q_values, dim=-1).item()
                 
-                next_state, reward, done, _, _ = self.env.step(action=action, repeat=self.step_repeat)
+                with profiler.scope("env/step"):
+                    next_state, reward, done, _, _ = self.env.step(action=action, repeat=self.step_repeat)
 
-                self.memory.store_transition(state, action, reward, next_state, done)
+                with profiler.scope("agent/store"):
+                    self.memory.store_transition(state, action, reward, next_state, done)
 
                 state = next_state
+                stacked_state = self.stack_frames(stacked_state, next_state)
 
                 episode_reward += reward
 
                 episode_steps += 1
                 total_steps += 1
 
-                if self.memory.can_sample(batch_size):
-                    states, actions, rewards, next_states, dones = self.memory.sample_buffer(batch_size)
-
-                    dones = dones.unsqueeze(1).float()
-
-                    # Current Q values from both models
-                    q_values_1 = self.model_1(states)
-                    q_values_2 = self.model_2(states)
-                    actions = actions.unsqueeze(1).long()
-                    qsa_b_1 = q_values_1.gather(1, actions)
-                    qsa_b_2 = q_values_2.gather(1, actions)
-
-                    # Action selection using main models. 
-                    next_actions_1 = torch.argmax(self.model_1(next_states), dim=1, keepdim=True)
-                    next_actions_2 = torch.argmax(self.model_2(next_states), dim=1, keepdim=True)
-
-                    next_q_values_1 = self.target_model_1(next_states).gather(1, next_actions_1)
-                    next_q_values_2 = self.target_model_2(next_states).gather(1, next_actions_2)
-                    
-                    # Take the minimum of the next Q values
-                    next_q_values = torch.min(next_q_values_1, next_q_values_2)
-
-                    # Compute the target value using DQN
-                    target_b = rewards.unsqueeze(1) + (1 - done) * self.gamma * next_q_values
-
-                    # Compute Loss
-                    loss_1 = F.smooth_l1_loss(qsa_b_1, target_b.detach())
-                    loss_2 = F.smooth_l1_loss(qsa_b_2, target_b.detach())
-
-                    writer.add_scalar("Loss/Model_1", loss_1.item(), total_steps)
-                    writer.add_scalar("Loss/Model_2", loss_2.item(), total_steps)
-
-                    # Backprop
-                    self.model_1.zero_grad()
-                    loss_1.backward()
-                    self.optimizer_1.step()
-                    
-                    self.model_2.zero_grad()
-                    loss_2.backward()
-                    self.optimizer_2.step()
-                    
-                    if episode_steps % 4 == 0:
-                        soft_update(self.target_model_1, self.model_1)
-                        soft_update(self.target_model_2, self.model_2)
-
-            self.model_1.save_the_model(filename='models/dqn1.pt')
-            self.model_2.save_the_model(filename='models/dqn2.pt')
-
-            writer.add_scalar('Score', episode_reward, episode)
-            writer.add_scalar('Epsilon', epsilon, episode)
+                metrics.add('Reward', reward)
+                metrics.add('Time/Env_step_ms', (time.perf_counter() - step_start) * 1000)
+
+                if learner:
+                    learner.step_done()
+                elif self.memory.can_sample(batch_size):
+                    self.learn(batch_size, metrics, total_steps, update_target=episode_steps % 4 == 0)
+
+                metrics.step(total_steps)
+                self.requantize(total_steps, metrics)
+
+            self.save_checkpoint(metrics)
+            self.memory.flush()
+
+            metrics.scalar('Score', episode_reward, episode)
+            metrics.scalar('Epsilon', epsilon, episode)
+
+            if learner:
+                learner.log(metrics, episode)
+                metrics.run(print, f"Replay ratio: {learner.achieved_ratio():.2f}, learner idle {learner.learner_idle:.1f}s, env idle {learner.env_idle:.1f}s")
 
             if epsilon > min_epsilon:
                 epsilon *= epsilon_decay
 
             episode_time = time.time() - episode_start_time
 
-            print(f"Completed episode {episode} with score {episode_reward}")
-            print(f"Episode Time: {episode_time:1f} seconds")
-            print(f"Episode Steps: {episode_steps}") 
-                    
+            metrics.run(print, f"Completed episode {episode} with score {episode_reward}\n"
+                               f"Episode Time: {episode_time:1f} seconds\n"
+                               f"Episode Steps: {episode_steps}")
+
+        if learner:
+            learner.stop()
+
+        self.wait_for_requantize()
+        metrics.close(total_steps)
+
+    def train_batched(self, episodes, max_episode_steps, summary_writer_suffix, batch_size, epsilon, epsilon_decay, min_epsilon, replay_ratio=None, metrics_every=1000):
+
+        # Every iteration steps all worlds at once, stores their transitions and runs one update.
+        summary_writer_name = f'runs/{datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}_{summary_writer_suffix}'
+
+        metrics = MetricsLogger(SummaryWriter(summary_writer_name), self.memory, flush_every=metrics_every)
+
+        if not os.path.exists('models'):
+            os.makedirs('models')
+
+        self.env.max_episode_steps = max_episode_steps
+
+        learner = BackgroundLearner(self, batch_size, metrics, replay_ratio) if replay_ratio else None
+
+        num_envs = self.env.num_envs
+
+        states, info = self.env.reset()
+        stacked_states = self.stack_frames(None, states)
+
+        episode_rewards = np.zeros(num_envs)
+        episode_steps = np.zeros(num_envs, dtype=np.int64)
+        episode_start_times = np.full(num_envs, time.time())
+
+        episode = 0
+        iterations = 0
+        total_steps = 0
+
+        while episode < episodes:
+
+            with self.update_lock, profiler.scope("agent/select_action"):
+                actions = self.select_actions(stacked_states, epsilon)
+
+            step_start = time.perf_counter()
+            with profiler.scope("env/step"):
+                next_states, rewards, dones, truncated, info = self.env.step(actions, repeat=self.step_repeat)
+            metrics.add('Time/Env_step_ms', (time.perf_counter() - step_start) * 1000)
+
+            # next_states already holds the reset frame for finished worlds.
+            final_states = next_states
+            if len(info["final_index"]):
+                final_states = next_states.clone()
+                final_states[info["final_index"]] = info["final_observation"]
+
+            with profiler.scope("agent/store"):
+                for i in range(num_envs):
+                    self.memory.store_transition(states[i], actions[i], rewards[i], final_states[i], dones[i], env_index=i)
+
+            states = next_states
+            stacked_states = self.stack_frames(stacked_states, next_states)
+
+            # Worlds that just reset start their stacks over from the reset frame.
+            if len(info["final_index"]) and self.frame_stack > 1:
+                final_index = info["final_index"]
+                stacked_states[final_index] = self.stack_frames(None, next_states[final_index])
+
+            episode_rewards += rewards
+            episode_steps += 1
+
+            iterations += 1
+            total_steps += num_envs
+
+            metrics.add('Reward', float(rewards.mean()))
+
+            if learner:
+                learner.step_done(num_envs)
+            elif self.memory.can_sample(batch_size):
+                self.learn(batch_size, metrics, total_steps, update_target=iterations % 4 == 0)
+
+            metrics.step(total_steps, num_envs)
+            self.requantize(total_steps, metrics)
+
+            for i in info["final_index"]:
+
+                self.save_checkpoint(metrics)
+                self.memory.flush()
+
+                metrics.scalar('Score', episode_rewards[i], episode)
+                metrics.scalar('Epsilon', epsilon, episode)
+
+                if learner:
+                    learner.log(metrics, episode)
+
+                if epsilon > min_epsilon:
+                    epsilon *= epsilon_decay
+
+                episode_time = time.time() - episode_start_times[i]
+
+                metrics.run(print, f"Completed episode {episode} with score {episode_rewards[i]}\n"
+                                   f"Episode Time: {episode_time:1f} seconds\n"
+                                   f"Episode Steps: {episode_steps[i]}")
+
+                episode_rewards[i] = 0
+                episode_steps[i] = 0
+                episode_start_times[i] = time.time()
+
+                episode += 1
+
+        if learner:
+            learner.stop()
+
+        self.wait_for_requantize()
+        metrics.close(total_steps)
+
+    def train_distributed(self, num_actors, env_kwargs, episodes, max_episode_steps, summary_writer_suffix, batch_size,
+                          epsilon=0.4, epsilon_alpha=7, publish_every=100, actor_threads=1, learner_threads=None,
+                          pin_cores=False):
+
+        # num_actors ActorPool processes play and send transitions; this process only stores and learns,
+        # publishing its weights to the actors every publish_every updates. Each actor keeps a fixed
+        # epsilon from the Ape-X schedule instead of decaying one. Returns (env steps/s, updates/s).
+        summary_writer_name = f'runs/{datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}_{summary_writer_suffix}'
+
+        metrics = MetricsLogger(SummaryWriter(summary_writer_name), self.memory)
+
+        if not os.path.exists('models'):
+            os.makedirs('models')
+
+        epsilons = actor_epsilons(num_actors, epsilon, epsilon_alpha)
+
+        pool = ActorPool(num_actors, env_kwargs, self.model, self.model_kwargs, epsilons, self.step_repeat,
+                         frame_stack=self.frame_stack, max_episode_steps=max_episode_steps,
+                         actor_threads=actor_threads, pin_cores=pin_cores)
+
+        if pin_cores:
+            os.sched_setaffinity(0, {pool.learner_core()})
+        if learner_threads:
+            torch.set_num_threads(learner_threads)
+
+        episode = 0
+        env_steps = 0
+        updates = 0
+
+        start_time = time.time()
+        report_time = start_time
+
+        # The actors are stopped however the loop ends, e.g. when receive reports a dead actor.
+        try:
+            while episode < episodes:
+
+                # Wait for actors only while there is nothing to learn from.
+                for message in pool.receive(block=not self.memory.can_sample(batch_size)):
+
+                    if message[0] == "transitions":
+                        _, index, chunk = message
+
+                        for state, action, reward, next_state, done in chunk:
+                            self.memory.store_transition(state, action, reward, next_state, done, env_index=index)
+
+                        env_steps += len(chunk)
+                        metrics.step(env_steps, len(chunk))
+
+                    else:
+                        _, index, episode_reward, episode_steps = message
+
+                        self.save_checkpoint(metrics)
+                        self.memory.flush()
+
+                        metrics.scalar('Score', episode_reward, episode)
+                        metrics.scalar('Epsilon', epsilons[index], episode)
+
+                        metrics.run(print, f"Completed episode {episode} with score {episode_reward} (actor {index})\n"
+                                           f"Episode Steps: {episode_steps}")
+
+                        episode += 1
+
+                if self.memory.can_sample(batch_size):
+                    updates += 1
+                    self.learn(batch_size, metrics, env_steps, update_target=updates % 4 == 0)
+
+                    if updates % publish_every == 0:
+                        pool.publish(self.model)
+
+                if time.time() - report_time > 10:
+                    elapsed = time.time() - start_time
+                    metrics.run(print, f"{env_steps / elapsed:.1f} env steps/s, {updates / elapsed:.1f} updates/s with {num_actors} actors")
+                    report_time = time.time()
+        finally:
+            pool.close()
+
+        metrics.close(env_steps)
+
+        elapsed = time.time() - start_time
+        return env_steps / elapsed, updates / elapsed
+
+    def learn(self, batch_size, metrics, total_steps, update_target):
+
+        update_start = time.perf_counter()
+
+        if self.prefetch and self.sampler is None:
+            self.sampler = PrefetchSampler(self.memory, batch_size, device=self.device)
+
+        source = self.sampler or self.memory
+
+        with profiler.scope("agent/sample"):
+            states, actions, rewards, next_states, dones = source.sample_buffer(batch_size)
+
+        dones = dones.unsqueeze(1).float()
+
+        with profiler.scope("agent/forward"), self.mixed_precision():
+            # Current Q values from both heads in one call: (2, batch, actions), back in float32 for the loss.
+            q_values = self.learn_model(states).float()
+            actions = actions.long().view(1, -1, 1).expand(2, -1, 1)
+            qsa_b_1, qsa_b_2 = q_values.gather(2, actions)
+
+            # Action selection using main models, evaluated by the matching target heads. No gradient
+            # flows through either, so neither is recorded for backward.
+            with torch.no_grad():
+                next_actions = torch.argmax(self.learn_model(next_states), dim=2, keepdim=True)
+                next_q_values = self.learn_target_model(next_states).float().gather(2, next_actions)
+
+            # Take the minimum of the next Q values
+            next_q_values = next_q_values.min(dim=0).values
+
+            # Compute the target value using DQN
+            target_b = rewards.unsqueeze(1) + (1 - dones) * self.gamma * next_q_values
+
+            # Compute Loss
+            if self.prioritized:
+                # Importance-sampling weights undo the bias of prioritized sampling; the TD errors become the new priorities.
+                target_b = target_b.detach()
+                weights = source.weights.unsqueeze(1)
+                loss_1 = (weights * F.smooth_l1_loss(qsa_b_1, target_b, reduction='none')).mean()
+                loss_2 = (weights * F.smooth_l1_loss(qsa_b_2, target_b, reduction='none')).mean()
+
+                td_errors = ((qsa_b_1 - target_b).abs() + (qsa_b_2 - target_b).abs()) / 2
+                self.memory.update_priorities(td_errors.detach().squeeze(1).cpu().numpy(), source.batch)
+            else:
+                loss_1 = F.smooth_l1_loss(qsa_b_1, target_b.detach())
+                loss_2 = F.smooth_l1_loss(qsa_b_2, target_b.detach())
+
+        # Kept as tensors; the metrics thread reads them back in bulk.
+        metrics.add("Loss/Model_1", loss_1)
+        metrics.add("Loss/Model_2", loss_2)
+        metrics.add("Q/Model_1", qsa_b_1.detach().mean())
+        metrics.add("Q/Model_2", qsa_b_2.detach().mean())
+
+        if self.sampler:
+            metrics.add("Sampler/Stall_ms", self.sampler.last_stall * 1000)
+
+        # Backprop; the heads share no weights, so the summed loss gives each head its own gradient.
+        with profiler.scope("agent/backward"):
+            self.model.zero_grad()
+            (loss_1 + loss_2).backward()
+
+        with self.update_lock:
+            with profiler.scope("agent/optimizer"):
+                self.optimizer.step()
 
+            if update_target:
+                with profiler.scope("agent/target_update"):
+                    soft_update(self.target_model, self.model)
 
+        metrics.add("Time/Update_ms", (time.perf_counter() - update_start) * 1000)
+        metrics.count("Updates")
@@ -0,0 +1,30 @@
+import pygame
+
+# Every sprite is loaded, converted and scaled once per (path, size) and the same
+# surface is handed to every entity that asks for it. Callers must not draw onto them.
+
+_sprites = {}
+
+
+def load_sprite(path, size):
+    key = (path, size)
+
+    if key not in _sprites:
+        image = pygame.image.load(path)
+
+        # convert_alpha needs a display mode; headless users (the rasterizers) get the raw image.
+        if pygame.display.get_surface() is not None:
+            image = image.convert_alpha()
+
+        _sprites[key] = pygame.transform.scale(image, (size, size))
+
+    return _sprites[key]
+
+
+def preload_sprites(sprites):
+    for path, size in sprites:
+        load_sprite(path, size)
+
+
+def clear_sprites():
+    _sprites.clear()
@@ -0,0 +1,878 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import math
+import random
+import shutil
+import tempfile
+import pygame
+import numpy as np
+import torch
+from game import ZombieShooter
+from vec_game import VecZombieShooter
+from collision import wall_index
+from bullet import BulletSystem
+from collision import UniformGrid
+from characters import Player, Zombie, Horde
+from walls import walls_1, walls_2, walls_3
+from util import get_collision
+from model import ZombieNet, TwinZombieNet, hard_update, soft_update, bf16_supported
+import torch.nn.functional as F
+from sampler import PrefetchSampler
+from actor_learner import ActorPool, actor_epsilons
+from agent import Agent
+from metrics import MetricsLogger
+from profiler import profiler
+from quantize import head_networks, calibration_states, quantize_twin, script_quantized, quantization_report
+from buffer import ReplayBuffer, FrameReplayBuffer, DiskReplayBuffer, CompressedReplayBuffer, SumTree
+
+WINDOW_WIDTH, WINDOW_HEIGHT = 1200, 800
+WORLD_WIDTH, WORLD_HEIGHT = 1800, 1200
+FPS = 60
+
+
+def make_env(render_mode="rgb", obs_mode="screen"):
+    return ZombieShooter(window_width=WINDOW_WIDTH, window_height=WINDOW_HEIGHT,
+                         world_height=WORLD_HEIGHT, world_width=WORLD_WIDTH,
+                         fps=FPS, sound=False, render_mode=render_mode, obs_mode=obs_mode)
+
+
+def timeit(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def bench_obs(iterations=200, warmup_steps=300, seed=0):
+    random.seed(seed)
+    env = make_env()
+    env.reset()
+
+    # Play a little so zombies and bullets are on screen.
+    for step in range(warmup_steps):
+        _, _, done, _, _ = env.step(6 if step % 3 == 0 else random.randint(1, 4))
+        if done:
+            env.reset()
+
+    def screen_obs():
+        env.obs_mode = "screen"
+        env.render()
+        return env._get_obs()
+
+    def raster_obs():
+        env.obs_mode = "raster"
+        return env._get_obs()
+
+    screen_time = timeit(screen_obs, iterations)
+    raster_time = timeit(raster_obs, iterations)
+
+    # HUD text only exists on the screen path, so compare below it.
+    agreement = (screen_obs()[:, 20:] == raster_obs()[:, 20:]).float().mean().item()
+
+    print(f"screen obs (render + resize): {screen_time * 1000:.3f} ms")
+    print(f"raster obs:                   {raster_time * 1000:.3f} ms")
+    print(f"speedup:                      {screen_time / raster_time:.1f}x")
+    print(f"pixel agreement (below HUD):  {agreement * 100:.2f}%")
+
+
+def bench_vec_env(num_envs=(1, 16, 64, 256), steps=200, seed=0):
+    for n in num_envs:
+        env = VecZombieShooter(n, WINDOW_WIDTH, WINDOW_HEIGHT, WORLD_HEIGHT, WORLD_WIDTH, seed=seed)
+        env.reset()
+
+        rng = np.random.default_rng(seed)
+        actions = rng.integers(0, env.action_space.n, (steps, n))
+
+        start = time.perf_counter()
+        for step in range(steps):
+            env.step(actions[step])
+        elapsed = time.perf_counter() - start
+
+        print(f"VecZombieShooter num_envs={n:4d}: {n * steps / elapsed:8.0f} env steps/s")
+
+
+class Box():
+
+    def __init__(self, x, y, size):
+        self.rect = pygame.Rect(x, y, size, size)
+
+
+def bench_collision(counts=(5, 10, 50, 100, 1000, 5000), seed=0):
+    # Zombie-vs-bullet hits for every zombie, as in ZombieShooter._step: each zombie takes the first
+    # bullet still touching it. A get_collision scan per zombie against BulletSystem.hit testing every
+    # pair directly and through its uniform grid, plus the grid's all-pairs query on its own.
+    for count in counts:
+        rng = random.Random(seed)
+        zombies = [Box(rng.randint(0, WORLD_WIDTH), rng.randint(0, WORLD_HEIGHT), 80) for _ in range(count)]
+        bullets = [Box(rng.randint(0, WORLD_WIDTH), rng.randint(0, WORLD_HEIGHT), 10) for _ in range(count)]
+
+        iterations = max(1, 2000 // count)
+
+        def linear():
+            alive = list(bullets)
+            claims = []
+
+            for zombie in zombies:
+                bullet = get_collision(zombie.rect, alive)
+                claims.append(bullets.index(bullet) if bullet else -1)
+
+                if bullet:
+                    alive.remove(bullet)
+
+            return claims
+
+        system = BulletSystem(WORLD_WIDTH, WORLD_HEIGHT, capacity=count)
+        boxes = np.array([tuple(zombie.rect) for zombie in zombies], dtype=np.int64)
+        bullet_boxes = np.array([tuple(bullet.rect) for bullet in bullets], dtype=np.int64)
+
+        def hit(direct_pairs):
+            system.direct_pairs = direct_pairs
+            system.x[:count], system.y[:count], system.count = bullet_boxes[:, 0], bullet_boxes[:, 1], count
+            return system.hit(boxes).tolist()
+
+        grid = UniformGrid()
+
+        def all_pairs():
+            grid.build(bullet_boxes)
+            return grid.all_pairs(boxes)
+
+        expected = linear()
+        assert hit(0) == expected and hit(math.inf) == expected
+
+        pairs = [(i, j) for i, zombie in enumerate(zombies) for j, bullet in enumerate(bullets) if zombie.rect.colliderect(bullet.rect)]
+        assert list(zip(*(ids.tolist() for ids in all_pairs()))) == pairs
+
+        linear_time = timeit(linear, iterations)
+        direct_time = timeit(lambda: hit(math.inf), iterations)
+        grid_time = timeit(lambda: hit(0), iterations)
+        pairs_time = timeit(all_pairs, iterations)
+
+        print(f"collision zombies=bullets={count:5d}: linear {linear_time * 1000:10.3f} ms, all pairs {direct_time * 1000:10.3f} ms, "
+              f"grid {grid_time * 1000:8.3f} ms (all_pairs query {pairs_time * 1000:8.3f} ms)")
+
+
+def bench_horde(counts=(5, 50, 500, 5000), seed=0):
+    # Zombie.move_toward_player per object vs one Horde.move_toward_player against walls_3.
+    walls = wall_index(walls_3)
+
+    for count in counts:
+        random.seed(seed)
+        horde = Horde(WORLD_WIDTH, WORLD_HEIGHT, size=80)
+        for _ in range(count):
+            horde.spawn(speed=random.randint(1, 4))
+
+        zombies = []
+        for x, y, speed in zip(horde.x[:count], horde.y[:count], horde.speed[:count]):
+            zombie = Zombie(WORLD_WIDTH, WORLD_HEIGHT, size=80, speed=speed)
+            zombie.x, zombie.y = x, y
+            zombies.append(zombie)
+
+        iterations = max(1, 5000 // count)
+        player_x, player_y = WORLD_WIDTH // 2, WORLD_HEIGHT // 2
+
+        def per_object():
+            for zombie in zombies:
+                zombie.move_toward_player(player_x, player_y, walls)
+
+        def horde_update():
+            horde.move_toward_player(player_x, player_y, walls.boxes)
+
+        per_object_time = timeit(per_object, iterations)
+        horde_time = timeit(horde_update, iterations)
+
+        identical = all(zombie.x == x and zombie.y == y for zombie, x, y in zip(zombies, horde.x, horde.y))
+
+        print(f"zombie steering count={count:5d}: per object {per_object_time * 1000:9.3f} ms, "
+              f"horde {horde_time * 1000:7.3f} ms, identical={identical}")
+
+
+def record_transitions(steps, seed=0):
+    # (state, action, reward, next_state, done) from random play with raster observations.
+    random.seed(seed)
+    env = make_env(obs_mode="raster")
+    state, _ = env.reset()
+
+    transitions = []
+    for _ in range(steps):
+        action = env.action_space.sample()
+        next_state, reward, done, _, _ = env.step(action)
+        transitions.append((state, action, reward, next_state, done))
+        state = env.reset()[0] if done else next_state
+
+    return env, transitions
+
+
+def bench_replay(capacity=5000, frame_stacks=(1, 4), batch_size=64, iterations=200, seed=0):
+    env, transitions = record_transitions(capacity, seed)
+    shape = transitions[0][0].shape
+
+    buffers = [("ReplayBuffer", ReplayBuffer(capacity, shape, env.action_space.n))]
+    for frame_stack in frame_stacks:
+        buffers.append((f"FrameReplayBuffer k={frame_stack}", FrameReplayBuffer(capacity, shape, env.action_space.n, frame_stack=frame_stack)))
+
+    for name, memory in buffers:
+        for transition in transitions:
+            memory.store_transition(*transition)
+
+        nbytes = memory.nbytes()
+        sample_time = timeit(lambda: memory.sample_buffer(batch_size), iterations)
+
+        print(f"{name:24s} capacity={capacity}: {nbytes / 2 ** 20:8.1f} MiB, "
+              f"{nbytes / capacity / 1024:5.1f} KiB/transition, sample {sample_time * 1000:6.3f} ms")
+
+
+def drop_page_cache(directory):
+    # Evicts unmapped files from the OS page cache so the next reads go to disk.
+    for name in os.listdir(directory):
+        fd = os.open(os.path.join(directory, name), os.O_RDONLY)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.close(fd)
+
+
+def bench_disk_replay(capacities=(10000, 50000, 100000), batch_size=64, iterations=200, seed=0):
+    env, transitions = record_transitions(2000, seed)
+    shape = transitions[0][0].shape
+
+    for capacity in capacities:
+        directory = tempfile.mkdtemp(prefix="replay_")
+
+        ram = FrameReplayBuffer(capacity, shape, env.action_space.n)
+        disk = DiskReplayBuffer(capacity, shape, env.action_space.n, directory=directory)
+
+        for i in range(capacity):
+            transition = transitions[i % len(transitions)]
+            ram.store_transition(*transition)
+            disk.store_transition(*transition)
+
+        ram_time = timeit(lambda: ram.sample_buffer(batch_size), iterations)
+        cached_time = timeit(lambda: disk.sample_buffer(batch_size), iterations)
+
+        # Reopen the files after evicting them: mapped pages would stay cached.
+        cold_time = None
+        if hasattr(os, "posix_fadvise"):
+            disk.flush()
+            del disk
+            drop_page_cache(directory)
+            disk = DiskReplayBuffer(capacity, shape, env.action_space.n, directory=directory)
+            cold_time = timeit(lambda: disk.sample_buffer(batch_size), 1)
+
+        cold = f"{cold_time * 1000:7.3f} ms" if cold_time is not None else "n/a"
+        print(f"replay capacity={capacity:7d} ({disk.nbytes() / 2 ** 30:5.2f} GiB): RAM {ram_time * 1000:7.3f} ms, "
+              f"memmap cached {cached_time * 1000:7.3f} ms, memmap cold {cold}")
+
+        del ram, disk
+        shutil.rmtree(directory)
+
+
+def bench_compressed_replay(capacity=20000, batch_size=64, iterations=200, projected=5000000, seed=0):
+    env, transitions = record_transitions(2000, seed)
+    shape = transitions[0][0].shape
+
+    for name, memory in [("FrameReplayBuffer", FrameReplayBuffer(capacity, shape, env.action_space.n)),
+                         ("CompressedReplayBuffer", CompressedReplayBuffer(capacity, shape, env.action_space.n))]:
+
+        start = time.perf_counter()
+        for i in range(capacity):
+            memory.store_transition(*transitions[i % len(transitions)])
+        store_time = time.perf_counter() - start
+
+        # Let the background compressor catch up before measuring size and sampling.
+        memory.flush()
+
+        sample_time = timeit(lambda: memory.sample_buffer(batch_size), iterations)
+        per_transition = memory.nbytes() / capacity
+
+        print(f"{name:22s} capacity={capacity}: {per_transition / 1024:6.2f} KiB/transition, "
+              f"{projected / 1e6:.0f}M transitions ~ {per_transition * projected / 2 ** 30:6.2f} GiB, "
+              f"store {capacity / store_time:7.0f}/s, sample {batch_size / sample_time:7.0f} transitions/s")
+
+        if isinstance(memory, CompressedReplayBuffer):
+            raw = memory.frame_ctr * np.prod(shape)
+            print(f"{'':22s} frame compression ratio {raw / memory.blob_bytes:.1f}x "
+                  f"({memory.blob_bytes / memory.frame_ctr:.0f} bytes/frame)")
+
+
+def bench_sum_tree(capacity=500000, batch_size=64, iterations=2000, seed=0):
+    # Index selection cost of prioritized vs uniform replay at the agent's buffer size.
+    np.random.seed(seed)
+    tree = SumTree(capacity)
+    tree.update(np.arange(capacity), np.random.random(capacity))
+
+    priorities = np.random.random(batch_size)
+
+    uniform_time = timeit(lambda: np.random.choice(capacity, batch_size), iterations)
+    sample_time = timeit(lambda: tree.sample(batch_size), iterations)
+    update_time = timeit(lambda: tree.update(tree.sample(batch_size), priorities), iterations) - sample_time
+    insert_time = timeit(lambda: tree.update_one(np.random.randint(capacity), 1.0), iterations)
+
+    print(f"sum tree capacity={capacity}, batch={batch_size}: uniform choice {uniform_time * 1e6:6.1f} us, "
+          f"prioritized sample {sample_time * 1e6:6.1f} us, batch update {update_time * 1e6:6.1f} us, "
+          f"single insert {insert_time * 1e6:5.1f} us")
+
+
+def bench_prefetch(capacity=5000, batch_size=64, iterations=100, seed=0):
+    # Learner updates/s with sampling inline vs on the PrefetchSampler thread.
+    torch.manual_seed(seed)
+    env, transitions = record_transitions(capacity, seed)
+    shape = transitions[0][0].shape
+
+    memory = FrameReplayBuffer(capacity, shape, env.action_space.n)
+    for transition in transitions:
+        memory.store_transition(*transition)
+
+    model = ZombieNet(action_dim=env.action_space.n, observation_shape=shape)
+    optimizer = torch.optim.Adam(model.parameters())
+
+    def update(source):
+        states, actions, rewards, next_states, dones = source.sample_buffer(batch_size)
+        loss = model(states).gather(1, actions.long().unsqueeze(1)).mean() - model(next_states).mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+    sampler = PrefetchSampler(memory, batch_size)
+
+    inline_time = timeit(lambda: update(memory), iterations)
+    prefetch_time = timeit(lambda: update(sampler), iterations)
+
+    print(f"learner batch={batch_size}: inline sampling {1 / inline_time:6.1f} updates/s, "
+          f"prefetch {1 / prefetch_time:6.1f} updates/s, mean stall {sampler.mean_stall() * 1000:.3f} ms")
+
+
+class SeparateTwinQ():
+
+    # The update Agent.learn ran before TwinZombieNet: four ZombieNets, two Adams, six forward passes,
+    # two backward passes and a per-parameter Python loop for the Polyak update.
+
+    def __init__(self, action_dim, hidden_dim, observation_shape, gamma=0.99):
+        make = lambda: ZombieNet(action_dim=action_dim, hidden_dim=hidden_dim, observation_shape=observation_shape)
+        self.model_1, self.model_2, self.target_model_1, self.target_model_2 = make(), make(), make(), make()
+        self.target_model_1.load_state_dict(self.model_1.state_dict())
+        self.target_model_2.load_state_dict(self.model_2.state_dict())
+        self.optimizer_1 = torch.optim.Adam(self.model_1.parameters(), lr=0.0001)
+        self.optimizer_2 = torch.optim.Adam(self.model_2.parameters(), lr=0.0001)
+        self.gamma = gamma
+
+    def soft_update(self, target, source, tau=0.005):
+        for target_param, param in zip(target.parameters(), source.parameters()):
+            target_param.data.copy_(target_param.data * (1.0 - tau) + param.data * tau)
+
+    def update(self, states, actions, rewards, next_states, dones):
+        actions = actions.unsqueeze(1).long()
+        qsa_b_1 = self.model_1(states).gather(1, actions)
+        qsa_b_2 = self.model_2(states).gather(1, actions)
+
+        next_actions_1 = torch.argmax(self.model_1(next_states), dim=1, keepdim=True)
+        next_actions_2 = torch.argmax(self.model_2(next_states), dim=1, keepdim=True)
+        next_q_values = torch.min(self.target_model_1(next_states).gather(1, next_actions_1),
+                                  self.target_model_2(next_states).gather(1, next_actions_2))
+
+        target_b = rewards.unsqueeze(1) + (1 - dones.unsqueeze(1).float()) * self.gamma * next_q_values
+
+        loss_1 = F.smooth_l1_loss(qsa_b_1, target_b.detach())
+        loss_2 = F.smooth_l1_loss(qsa_b_2, target_b.detach())
+
+        self.model_1.zero_grad()
+        loss_1.backward()
+        self.optimizer_1.step()
+        self.model_2.zero_grad()
+        loss_2.backward()
+        self.optimizer_2.step()
+
+        self.soft_update(self.target_model_1, self.model_1)
+        self.soft_update(self.target_model_2, self.model_2)
+
+
+class FusedTwinQ():
+
+    # The same update through TwinZombieNet, as Agent.learn runs it now.
+
+    def __init__(self, action_dim, hidden_dim, observation_shape, gamma=0.99):
+        self.model = TwinZombieNet(action_dim=action_dim, hidden_dim=hidden_dim, observation_shape=observation_shape)
+        self.target_model = TwinZombieNet(action_dim=action_dim, hidden_dim=hidden_dim, observation_shape=observation_shape)
+        hard_update(self.target_model, self.model)
+        self.optimizer = torch.optim.Adam(self.model.parameters(), lr=0.0001)
+        self.gamma = gamma
+
+    def update(self, states, actions, rewards, next_states, dones):
+        actions = actions.long().view(1, -1, 1).expand(2, -1, 1)
+        qsa_b_1, qsa_b_2 = self.model(states).gather(2, actions)
+
+        with torch.no_grad():
+            next_actions = torch.argmax(self.model(next_states), dim=2, keepdim=True)
+            next_q_values = self.target_model(next_states).gather(2, next_actions).min(dim=0).values
+
+        target_b = rewards.unsqueeze(1) + (1 - dones.unsqueeze(1).float()) * self.gamma * next_q_values
+
+        loss_1 = F.smooth_l1_loss(qsa_b_1, target_b.detach())
+        loss_2 = F.smooth_l1_loss(qsa_b_2, target_b.detach())
+
+        self.model.zero_grad()
+        (loss_1 + loss_2).backward()
+        self.optimizer.step()
+
+        soft_update(self.target_model, self.model)
+
+
+def bench_twin_q(batch_size=64, hidden_dim=1024, iterations=20, seed=0):
+    # Update steps/s of the separate and fused twin-Q updates on the same batch (dropout off).
+    torch.manual_seed(seed)
+    shape, action_dim = (1, 128, 128), 6
+
+    states = torch.randint(0, 256, (batch_size, *shape)).float()
+    next_states = torch.randint(0, 256, (batch_size, *shape)).float()
+    actions = torch.randint(0, action_dim, (batch_size,)).float()
+    rewards = torch.randn(batch_size)
+    dones = torch.rand(batch_size) < 0.1
+
+    separate = SeparateTwinQ(action_dim, hidden_dim, shape)
+    fused = FusedTwinQ(action_dim, hidden_dim, shape)
+
+    # Start the fused heads from the separate networks' weights and check a few updates agree.
+    for head, (model, target) in enumerate([(separate.model_1, separate.target_model_1),
+                                            (separate.model_2, separate.target_model_2)]):
+        fused.model.load_head_state_dict(head, model.state_dict())
+        fused.target_model.load_head_state_dict(head, target.state_dict())
+
+    for _ in range(3):
+        separate.update(states, actions, rewards, next_states, dones)
+        fused.update(states, actions, rewards, next_states, dones)
+
+    difference = max((fused.model.head_state_dict(0)[name] - param).abs().max().item()
+                     for name, param in separate.model_1.state_dict().items())
+
+    separate_time = timeit(lambda: separate.update(states, actions, rewards, next_states, dones), iterations)
+    fused_time = timeit(lambda: fused.update(states, actions, rewards, next_states, dones), iterations)
+
+    print(f"twin-Q update batch={batch_size}: separate {1 / separate_time:6.2f} updates/s, "
+          f"fused {1 / fused_time:6.2f} updates/s, max weight difference after 3 updates {difference:.2e}")
+
+
+class NullWriter():
+    def add_scalar(self, *args):
+        pass
+
+    def flush(self):
+        pass
+
+
+def bench_actor_learner(actor_counts=(1, 2, 4), seconds=30, batch_size=64, pin_cores=True):
+    # Env steps/s arriving from the actors and learner updates/s, as in Agent.train_distributed.
+    env_kwargs = dict(window_width=WINDOW_WIDTH, window_height=WINDOW_HEIGHT,
+                      world_height=WORLD_HEIGHT, world_width=WORLD_WIDTH, fps=FPS, sound=False)
+
+    for num_actors in actor_counts:
+        agent = Agent(make_env(), dropout=0.2, hidden_layer=1024, learning_rate=0.0001, step_repeat=4,
+                      gamma=0.99, memory_size=20000)
+
+        pool = ActorPool(num_actors, env_kwargs, agent.model, agent.model_kwargs, actor_epsilons(num_actors), 4,
+                         pin_cores=pin_cores)
+
+        metrics = MetricsLogger(NullWriter())
+
+        env_steps = 0
+        updates = 0
+        start = time.perf_counter()
+
+        while time.perf_counter() - start < seconds:
+            for message in pool.receive(block=not agent.memory.can_sample(batch_size)):
+                if message[0] == "transitions":
+                    for transition in message[2]:
+                        agent.memory.store_transition(*transition, env_index=message[1])
+                    env_steps += len(message[2])
+
+            if agent.memory.can_sample(batch_size):
+                agent.learn(batch_size, metrics, env_steps, update_target=updates % 4 == 0)
+                updates += 1
+
+                if updates % 100 == 0:
+                    pool.publish(agent.model)
+
+        elapsed = time.perf_counter() - start
+        pool.close()
+        metrics.close()
+
+        print(f"actor-learner actors={num_actors} ({os.cpu_count()} cores): {env_steps / elapsed:7.1f} env steps/s, "
+              f"{updates / elapsed:6.2f} updates/s")
+
+
+def bench_metrics(iterations=20000):
+    # Cost per logged loss: .item() plus a SummaryWriter write, against a MetricsLogger ring append.
+    from torch.utils.tensorboard import SummaryWriter
+
+    directory = tempfile.mkdtemp()
+    loss = torch.tensor(0.5)
+
+    writer = SummaryWriter(os.path.join(directory, "inline"))
+    inline_time = timeit(lambda: writer.add_scalar("Loss", loss.item(), 0), iterations)
+    writer.close()
+
+    metrics = MetricsLogger(SummaryWriter(os.path.join(directory, "batched")))
+    batched_time = timeit(lambda: metrics.add("Loss", loss), iterations)
+    metrics.close(0)
+
+    shutil.rmtree(directory)
+
+    print(f"metrics per value: item + add_scalar {inline_time * 1e6:6.2f} us, ring buffer {batched_time * 1e6:6.2f} us")
+
+
+def bench_profiler(steps=300, seed=0):
+    # ZombieShooter.step with the profiler off and on, then the per-phase table from the profiled run.
+    def run():
+        random.seed(seed)
+        env = make_env()
+        env.reset()
+        start = time.perf_counter()
+        for _ in range(steps):
+            env.step(random.randrange(7))
+        return (time.perf_counter() - start) / steps
+
+    profiler.enable(False)
+    off_time = run()
+
+    profiler.enable()
+    on_time = run()
+    profiler.enable(False)
+
+    print(f"profiler: step {off_time * 1000:.3f} ms off, {on_time * 1000:.3f} ms on")
+    print(profiler.summary())
+
+
+def bench_fast_train(batch_size=64, iterations=20, capacity=2000, seed=0):
+    # Agent.learn updates/s in the default float32 eager mode against fast_train (channels_last, folded input
+    # scaling, bf16 autocast where supported) with and without torch.compile, plus how far the fast
+    # model's Q values drift from the float32 ones for the same weights.
+    env, transitions = record_transitions(capacity, seed)
+    metrics = MetricsLogger(NullWriter())
+
+    modes = [("float32 eager", {}), ("fast_train", {"fast_train": True}),
+             ("fast_train + compile", {"fast_train": True, "torch_compile": True})]
+
+    agents = {}
+    for name, options in modes:
+        seed_everything(seed)
+        agent = Agent(env, dropout=0.2, hidden_layer=1024, learning_rate=0.0001, step_repeat=4, gamma=0.99,
+                      memory_size=capacity, **options)
+
+        for transition in transitions:
+            agent.memory.store_transition(*transition)
+
+        update_time = measure(lambda: agent.learn(batch_size, metrics, 0, update_target=True), iterations, 1)
+        print(f"learn {name:22s} batch={batch_size}: {1 / update_time:6.2f} updates/s")
+
+        agents[name] = agent
+
+    # Same weights in both, dropout off: the relative error the fast path adds to the Q values.
+    reference, fast = agents["float32 eager"], agents["fast_train"]
+    fast.model.load_state_dict(reference.model.state_dict())
+    reference.model.eval()
+    fast.model.eval()
+
+    states = reference.memory.sample_buffer(batch_size)[0]
+    with torch.no_grad():
+        expected = reference.model(states)
+        with fast.mixed_precision():
+            actual = fast.model(states).float()
+
+    error = ((actual - expected).abs().max() / expected.abs().max()).item()
+    agreement = (actual.min(0).values.argmax(-1) == expected.min(0).values.argmax(-1)).float().mean().item()
+
+    print(f"fast_train (bf16 {'on' if fast.bf16 else 'off'}): max Q error {error:.2e} of max |Q|, "
+          f"greedy action agreement {agreement:.1%}")
+
+    metrics.close()
+
+
+def bench_quantized(capacity=2000, seed=0):
+    # Batch-1 action selection latency and greedy action agreement of the int8 twin-Q model against the
+    # float one, calibrated and evaluated on separate replay samples.
+    env, transitions = record_transitions(capacity, seed)
+
+    seed_everything(seed)
+    agent = Agent(env, dropout=0.2, hidden_layer=1024, learning_rate=0.0001, step_repeat=4, gamma=0.99,
+                  memory_size=capacity)
+
+    for transition in transitions:
+        agent.memory.store_transition(*transition)
+
+    agent.model.eval()
+    states = calibration_states(agent.memory)
+    quantized = quantize_twin(head_networks(agent.model, agent.model_kwargs), states)
+
+    quantization_report(agent.model, script_quantized(quantized, states[:1]), calibration_states(agent.memory, count=256))
+
+
+# The bench_* functions above print one-off comparisons. The suite below measures the same hot paths
+# as named results, (value, unit) pairs that are written to JSON and compared run against run. Units
+# ending in "/s" are rates (higher is better); the rest are latencies (lower is better).
+
+LEVEL_WALLS = {1: walls_1, 2: walls_2, 3: walls_3}
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def measure(fn, iterations, repeats):
+    # Median seconds per call over repeats timed runs, after one untimed call.
+    fn()
+    return statistics.median(timeit(fn, iterations) for _ in range(repeats))
+
+
+def populate(env, zombies, bullets):
+    # Tops the scene back up to the requested zombie and bullet counts.
+    while len(env.zombies) < zombies:
+        env.zombies.spawn(speed=env.rng.randint(1, 3), rng=env.rng)
+
+    while len(env.bullets) < bullets:
+        env.bullets.fire(env.rng.randint(0, WORLD_WIDTH), env.rng.randint(0, WORLD_HEIGHT),
+                         env.rng.choice(("up", "down", "left", "right")))
+
+
+def setup_level(env, level, zombies, bullets, seed):
+    # A level's walls with fixed crowd sizes; the player cannot die and the level never ends.
+    seed_everything(seed)
+    env.reset(seed=seed)
+    env.set_walls(LEVEL_WALLS[level])
+    env.player = Player(world_height=env.world_height, world_width=env.world_width, walls=env.wall_index,
+                        navigation=env.player_navigation, rng=env.rng)
+    env.player.health = 10 ** 9
+    env.level_goal = 10 ** 9
+    env.max_zombie_count = zombies
+    populate(env, zombies, bullets)
+
+
+def suite_sim(seed=0, repeats=3, steps=50, levels=(1, 2, 3), zombie_counts=(5, 50), bullet_counts=(0, 50)):
+    # ZombieShooter.step (4 frames each) in rgb mode and in human mode on the dummy video driver.
+    results = {}
+
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+
+    for render_mode in ("rgb", "human"):
+        env = make_env(render_mode=render_mode)
+        # Unthrottled, so human mode is not held to FPS by clock.tick.
+        env.fps = 0
+
+        for level in levels:
+            for zombies in zombie_counts:
+                for bullets in bullet_counts:
+                    times = []
+
+                    for repeat in range(repeats):
+                        setup_level(env, level, zombies, bullets, seed + repeat)
+
+                        elapsed = 0
+                        for _ in range(steps):
+                            populate(env, zombies, bullets)
+                            action = random.randrange(env.action_space.n)
+
+                            start = time.perf_counter()
+                            env.step(action)
+                            elapsed += time.perf_counter() - start
+
+                        times.append(elapsed / steps)
+
+                    name = f"sim/{render_mode}/level={level}/zombies={zombies}/bullets={bullets}"
+                    results[name] = (1 / statistics.median(times), "steps/s")
+
+    return results
+
+
+def suite_obs(seed=0, repeats=3, iterations=100, zombies=50, bullets=50):
+    # ZombieShooter._get_obs on its own: the screen path reads back an already rendered frame.
+    results = {}
+
+    env = make_env()
+    setup_level(env, 3, zombies, bullets, seed)
+
+    for _ in range(20):
+        populate(env, zombies, bullets)
+        env.step(random.randrange(env.action_space.n))
+
+    env.render()
+
+    for obs_mode in ("screen", "raster"):
+        env.obs_mode = obs_mode
+        results[f"obs/{obs_mode}"] = (measure(env._get_obs, iterations, repeats) * 1e6, "us")
+
+    return results
+
+
+def suite_replay(seed=0, repeats=3, capacities=(1000, 10000, 50000), batch_sizes=(32, 64, 256), iterations=100):
+    # store_transition and sample_buffer for the original ReplayBuffer and the FrameReplayBuffer the agent uses.
+    results = {}
+
+    env, transitions = record_transitions(1000, seed)
+    shape = transitions[0][0].shape
+
+    for name, buffer_class in (("ReplayBuffer", ReplayBuffer), ("FrameReplayBuffer", FrameReplayBuffer)):
+        for capacity in capacities:
+            seed_everything(seed)
+            memory = buffer_class(capacity, shape, env.action_space.n)
+
+            # Filling the buffer once times every store, including the first pass over fresh pages.
+            start = time.perf_counter()
+            for i in range(capacity):
+                memory.store_transition(*transitions[i % len(transitions)])
+            results[f"replay/{name}/capacity={capacity}/store"] = ((time.perf_counter() - start) / capacity * 1e6, "us")
+
+            for batch_size in batch_sizes:
+                sample_time = measure(lambda: memory.sample_buffer(batch_size), iterations, repeats)
+                results[f"replay/{name}/capacity={capacity}/sample/batch={batch_size}"] = (sample_time * 1000, "ms")
+
+            del memory
+
+    return results
+
+
+def suite_model(seed=0, repeats=3, batch_sizes=(1, 64), hidden_dim=1024, iterations=20):
+    # Inference (eval, no grad) and training forward + backward latency of ZombieNet and TwinZombieNet.
+    results = {}
+
+    for name, model_class in (("ZombieNet", ZombieNet), ("TwinZombieNet", TwinZombieNet)):
+        seed_everything(seed)
+        model = model_class(7, hidden_dim=hidden_dim, dropout=0.2, observation_shape=(1, 128, 128))
+
+        for batch_size in batch_sizes:
+            x = torch.randint(0, 256, (batch_size, 1, 128, 128)).float()
+
+            def forward():
+                with torch.no_grad():
+                    model(x)
+
+            def forward_backward():
+                model.zero_grad()
+                model(x).sum().backward()
+
+            model.eval()
+            results[f"model/{name}/forward/batch={batch_size}"] = (measure(forward, iterations, repeats) * 1000, "ms")
+
+            model.train()
+            results[f"model/{name}/forward_backward/batch={batch_size}"] = (measure(forward_backward, iterations, repeats) * 1000, "ms")
+
+    return results
+
+
+SUITES = {"sim": suite_sim, "obs": suite_obs, "replay": suite_replay, "model": suite_model}
+
+
+def run_legacy():
+    bench_obs()
+    bench_vec_env()
+    bench_collision()
+    bench_horde()
+    bench_replay()
+    bench_disk_replay()
+    bench_compressed_replay()
+    bench_sum_tree()
+    bench_prefetch()
+    bench_twin_q()
+    bench_actor_learner()
+    bench_metrics()
+    bench_profiler()
+    bench_fast_train()
+    bench_quantized()
+
+
+def run_suites(names, seed, repeats):
+    results = {}
+
+    for name in names:
+        print(f"Running {name} suite")
+        for result, (value, unit) in SUITES[name](seed=seed, repeats=repeats).items():
+            results[result] = {"value": value, "unit": unit}
+            print(f"  {result:60s} {value:12.3f} {unit}")
+
+    return {
+        "meta": {
+            "seed": seed,
+            "repeats": repeats,
+            "suites": names,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads()
+        },
+        "results": results
+    }
+
+
+def compare_results(baseline, current, threshold):
+    # Prints every result both runs share and returns the names that got slower by more than threshold.
+    regressions = []
+
+    print(f"{'result':60s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+
+        old, new = baseline["results"][name]["value"], result["value"]
+
+        # Positive means faster, whichever way the unit points.
+        if result["unit"].endswith("/s"):
+            change = new / old - 1
+        else:
+            change = old / new - 1
+
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+
+        print(f"{name:60s} {old:12.3f} {new:12.3f} {change:+8.1%}{flag}")
+
+    print(f"{len(regressions)} regression(s) beyond {threshold:.0%}")
+
+    return regressions
+
+
+def load_results(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ZombieShooter benchmarks")
+    parser.add_argument("--suite", nargs="+", choices=[*SUITES, "legacy"], default=list(SUITES),
+                        help="suites to run; legacy runs the printed bench_* comparisons")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per result; the median is kept")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare this run against a JSON results file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="compare two JSON results files without running anything")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown (fraction) that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare_results(load_results(args.compare[0]), load_results(args.compare[1]), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    if "legacy" in args.suite:
+        run_legacy()
+
+    names = [name for name in args.suite if name in SUITES]
+    if not names:
+        sys.exit(0)
+
+    current = run_suites(names, args.seed, args.repeats)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.baseline:
+        regressions = compare_results(load_results(args.baseline), current, args.threshold)
+        sys.exit(1 if regressions else 0)
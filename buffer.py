@@ -1,6 +1,25 @@
+import os
+import json
+import zlib
+import queue
+import threading
 import numpy as np
 import torch
 
+
+def stack_frames(stacked, frames, frame_stack):
+    # The acting-side counterpart of FrameReplayBuffer.stack: drops the oldest frame of each stack
+    # and appends the new one; stacked=None starts fresh stacks by repeating frames.
+    if frame_stack == 1:
+        return frames
+
+    if stacked is None:
+        return torch.cat([frames] * frame_stack, dim=-3)
+
+    channels = frames.shape[-3]
+    return torch.cat([stacked[..., channels:, :, :], frames], dim=-3)
+
+
 class ReplayBuffer():
 
     def __init__(self, max_size, input_shape, n_actions, device='cpu'):
@@ -14,6 +33,9 @@ class ReplayBuffer():
 
         self.device = device
 
+    def nbytes(self):
+        arrays = (self.state_memory, self.next_state_memory, self.action_memory, self.reward_memory, self.terminal_memory)
+        return sum(array.nbytes for array in arrays)
     
     def can_sample(self, batch_size):
         if self.mem_ctr > (batch_size * 5):
@@ -51,3 +73,448 @@ class ReplayBuffer():
 
         return states, actions, rewards, next_states, dones
 
+
+
+class FrameReplayBuffer():
+
+    # Stores every observation frame once in a ring and keeps only frame ids per transition, so
+    # next_state at step t and state at step t + 1 share storage. Each frame also remembers the
+    # previous frame of its episode, which lets sample_buffer stack the last frame_stack frames
+    # without storing them again. Episode starts are padded by repeating their first frame.
+
+    def __init__(self, max_size, input_shape, n_actions, device='cpu', frame_stack=1, frame_capacity=None):
+        self.mem_size = max_size
+        self.mem_ctr = 0
+        self.frame_stack = frame_stack
+
+        # Episode starts cost an extra frame, so the oldest few transitions may lose their state
+        # frame before they are overwritten; sampling skips them.
+        self.frame_capacity = frame_capacity or max_size
+        self.frame_ctr = 0
+        self.frame_memory = self.allocate("frame_memory", (self.frame_capacity, *input_shape), np.uint8)
+        self.prev_frame = self.allocate("prev_frame", (self.frame_capacity,), np.int64, fill=-1)
+
+        self.state_frame = self.allocate("state_frame", (self.mem_size,), np.int64)
+        self.next_state_frame = self.allocate("next_state_frame", (self.mem_size,), np.int64)
+        self.action_memory = self.allocate("action_memory", (self.mem_size,), np.float32)
+        self.reward_memory = self.allocate("reward_memory", (self.mem_size,), np.float32)
+        self.terminal_memory = self.allocate("terminal_memory", (self.mem_size,), bool)
+
+        # (id, frame) of the latest frame of every stream (env_index); cleared by a terminal transition.
+        self.last_frame = {}
+
+        self.frame_shape = tuple(input_shape)
+        self.stacked_shape = (frame_stack * input_shape[0], *input_shape[1:])
+
+        # Stores and samples may come from different threads (see sampler.PrefetchSampler).
+        self.lock = threading.RLock()
+
+        # Indices and importance-sampling weights (None when uniform) of the last sample_buffer batch.
+        self.batch = None
+        self.weights = None
+
+        self.device = device
+
+    def allocate(self, name, shape, dtype, fill=0):
+        return np.full(shape, fill, dtype=dtype) if fill else np.zeros(shape, dtype=dtype)
+
+    def flush(self):
+        # Nothing to persist for an in-memory buffer.
+        pass
+
+    def nbytes(self):
+        arrays = (self.frame_memory, self.prev_frame, self.state_frame, self.next_state_frame,
+                  self.action_memory, self.reward_memory, self.terminal_memory)
+        return sum(array.nbytes for array in arrays)
+
+    def can_sample(self, batch_size):
+        return self.mem_ctr > (batch_size * 5)
+
+    def write_frame(self, frame_id, frame):
+        self.frame_memory[frame_id % self.frame_capacity] = frame
+
+    def read_frames(self, frame_ids, out=None):
+        # mode="clip" lets np.take write straight into out (ids are already in range).
+        return np.take(self.frame_memory, frame_ids % self.frame_capacity, axis=0, out=out, mode="clip")
+
+    def add_frame(self, frame, prev):
+        frame_id = self.frame_ctr
+
+        self.write_frame(frame_id, frame)
+        self.prev_frame[frame_id % self.frame_capacity] = prev
+
+        self.frame_ctr += 1
+        return frame_id
+
+    def is_live(self, frame_ids):
+        return (frame_ids >= 0) & (frame_ids >= self.frame_ctr - self.frame_capacity)
+
+    def store_transition(self, state, action, reward, next_state, done, env_index=0):
+        state = np.asarray(state, dtype=np.uint8)
+        next_state = np.array(next_state, dtype=np.uint8)
+        action = torch.tensor(action).detach().cpu()
+
+        with self.lock:
+            index = self.mem_ctr % self.mem_size
+            last, last_state = self.last_frame.get(env_index, (-1, None))
+
+            # state is normally the previous next_state of the same stream; anything else starts a new episode chain.
+            if not (self.is_live(last) and np.array_equal(last_state, state)):
+                last = self.add_frame(state, -1)
+
+            next_frame = self.add_frame(next_state, last)
+
+            self.state_frame[index] = last
+            self.next_state_frame[index] = next_frame
+            self.action_memory[index] = action
+            self.reward_memory[index] = reward
+            self.terminal_memory[index] = done
+
+            if done:
+                self.last_frame.pop(env_index, None)
+            else:
+                self.last_frame[env_index] = (next_frame, next_state)
+
+            self.mem_ctr += 1
+
+    def stack(self, frame_ids, out=None):
+        # (batch, frame_stack * channels, ...) with the newest frame last, gathered in one indexing pass.
+        ids = np.empty((len(frame_ids), self.frame_stack), dtype=np.int64)
+        ids[:, -1] = frame_ids
+
+        for j in range(self.frame_stack - 1, 0, -1):
+            prev = self.prev_frame[ids[:, j] % self.frame_capacity]
+            ids[:, j - 1] = np.where(self.is_live(prev), prev, ids[:, j])
+
+        if out is not None:
+            out = out.reshape(*ids.shape, *self.frame_shape)
+
+        stacked = self.read_frames(ids, out)
+        return stacked.reshape(len(frame_ids), *self.stacked_shape)
+
+    def sample_indices(self, batch_size):
+        # (indices, importance-sampling weights or None) for one batch.
+        max_mem = min(self.mem_ctr, self.mem_size)
+        batch = np.random.choice(max_mem, batch_size)
+
+        # Redraw transitions whose state frame has already been recycled.
+        stale = ~self.is_live(self.state_frame[batch])
+        while stale.any():
+            batch[stale] = np.random.choice(max_mem, stale.sum())
+            stale = ~self.is_live(self.state_frame[batch])
+
+        return batch, None
+
+    def sample_batch(self, batch_size, frames_out=None):
+        # The raw uint8 batch as numpy arrays; frames_out, shaped (2 * batch_size, *stacked_shape), receives
+        # the states followed by the next states.
+        with self.lock:
+            batch, weights = self.sample_indices(batch_size)
+
+            # One gather for both ends of the transitions, which mostly share frames.
+            stacked = self.stack(np.concatenate([self.state_frame[batch], self.next_state_frame[batch]]), frames_out)
+            actions = self.action_memory[batch]
+            rewards = self.reward_memory[batch]
+            dones = self.terminal_memory[batch]
+
+        return batch, weights, stacked[:batch_size], actions, rewards, stacked[batch_size:], dones
+
+    def sample_states(self, batch_size, rng=None):
+        # Uniformly drawn stacked states as a float CPU tensor, e.g. for calibration. Unlike sample_buffer
+        # it leaves batch, weights, prioritized sampling state and the global NumPy RNG alone, so it is
+        # safe next to a learner thread.
+        rng = rng or np.random.default_rng()
+
+        with self.lock:
+            max_mem = min(self.mem_ctr, self.mem_size)
+            live = np.flatnonzero(self.is_live(self.state_frame[:max_mem]))
+            states = self.stack(self.state_frame[rng.choice(live, batch_size)])
+
+        return torch.tensor(states, dtype=torch.float32)
+
+    def sample_buffer(self, batch_size):
+        batch, weights, states, actions, rewards, next_states, dones = self.sample_batch(batch_size)
+
+        self.batch = batch
+        self.weights = None if weights is None else torch.tensor(weights, dtype=torch.float32).to(self.device)
+
+        states = torch.tensor(states, dtype=torch.float32).to(self.device)
+        next_states = torch.tensor(next_states, dtype=torch.float32).to(self.device)
+        actions = torch.tensor(actions, dtype=torch.float32).to(self.device)
+        rewards = torch.tensor(rewards, dtype=torch.float32).to(self.device)
+        dones = torch.tensor(dones, dtype=torch.bool).to(self.device)
+
+        return states, actions, rewards, next_states, dones
+
+
+class DiskReplayBuffer(FrameReplayBuffer):
+
+    # FrameReplayBuffer whose arrays are np.memmap files in directory, so capacity is bounded by
+    # disk instead of RAM and sampling only touches the pages of the sampled rows. header.json
+    # records mem_ctr / mem_size; opening a directory that already holds a buffer resumes it.
+
+    def __init__(self, max_size, input_shape, n_actions, directory, device='cpu', frame_stack=1,
+                 frame_capacity=None, flush_every=1000):
+        self.directory = directory
+        self.flush_every = flush_every
+
+        os.makedirs(directory, exist_ok=True)
+
+        header = self.read_header()
+        self.resumed = header is not None
+
+        if self.resumed:
+            expected = dict(mem_size=max_size, frame_capacity=frame_capacity or max_size, input_shape=list(input_shape))
+            for key, value in expected.items():
+                if header[key] != value:
+                    raise ValueError(f"Replay buffer in {directory} has {key}={header[key]}, expected {value}")
+
+        super().__init__(max_size, input_shape, n_actions, device=device, frame_stack=frame_stack, frame_capacity=frame_capacity)
+
+        self.input_shape = list(input_shape)
+
+        if self.resumed:
+            self.mem_ctr = header["mem_ctr"]
+            self.frame_ctr = header["frame_ctr"]
+            print(f"Resumed replay buffer from {directory} with {min(self.mem_ctr, self.mem_size)} transitions")
+
+    def header_path(self):
+        return os.path.join(self.directory, "header.json")
+
+    def read_header(self):
+        if not os.path.exists(self.header_path()):
+            return None
+
+        with open(self.header_path()) as f:
+            return json.load(f)
+
+    def allocate(self, name, shape, dtype, fill=0):
+        path = os.path.join(self.directory, f"{name}.dat")
+
+        if self.resumed:
+            return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+        array = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+        if fill:
+            array[:] = fill
+        return array
+
+    def store_transition(self, state, action, reward, next_state, done, env_index=0):
+        super().store_transition(state, action, reward, next_state, done, env_index)
+
+        if self.mem_ctr % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        # Data first, then the header, so a reopened buffer never counts rows that were not written.
+        for array in (self.frame_memory, self.prev_frame, self.state_frame, self.next_state_frame,
+                      self.action_memory, self.reward_memory, self.terminal_memory):
+            array.flush()
+
+        header = dict(mem_size=self.mem_size, mem_ctr=self.mem_ctr, frame_capacity=self.frame_capacity,
+                      frame_ctr=self.frame_ctr, input_shape=self.input_shape)
+
+        with open(self.header_path() + ".tmp", "w") as f:
+            json.dump(header, f)
+        os.replace(self.header_path() + ".tmp", self.header_path())
+
+
+class CompressedReplayBuffer(FrameReplayBuffer):
+
+    # FrameReplayBuffer that keeps every frame zlib-compressed. Frames are mostly flat background,
+    # so they shrink by well over an order of magnitude. store_transition only queues the raw frame;
+    # a background thread compresses it, and until then samples read the raw copy from pending. At
+    # most max_pending frames wait; beyond that store_transition blocks until the thread catches up.
+
+    def __init__(self, max_size, input_shape, n_actions, device='cpu', frame_stack=1, frame_capacity=None, level=1, max_pending=1024):
+        self.level = level
+        self.frame_shape = tuple(input_shape)
+
+        self.blobs = [None] * (frame_capacity or max_size)
+        self.blob_bytes = 0
+        self.pending = {}
+
+        # Decompressed frames of the last sample, reused between batches.
+        self.batch_frames = np.zeros((0, *input_shape), dtype=np.uint8)
+
+        super().__init__(max_size, input_shape, n_actions, device=device, frame_stack=frame_stack, frame_capacity=frame_capacity)
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        threading.Thread(target=self.compress_frames, daemon=True).start()
+
+    def allocate(self, name, shape, dtype, fill=0):
+        # Frames live in self.blobs.
+        if name == "frame_memory":
+            return None
+        return super().allocate(name, shape, dtype, fill)
+
+    def write_frame(self, frame_id, frame):
+        self.pending[frame_id] = frame.copy()
+        self.queue.put(frame_id)
+
+    def compress_frames(self):
+        # The queue is FIFO, so an older frame never lands in a slot after a newer one.
+        while True:
+            frame_id = self.queue.get()
+
+            blob = zlib.compress(self.pending[frame_id], self.level)
+
+            index = frame_id % self.frame_capacity
+            old = self.blobs[index]
+            self.blob_bytes += len(blob) - (len(old) if old else 0)
+
+            # Publish the blob before dropping the raw copy so readers always find one of them.
+            self.blobs[index] = blob
+            del self.pending[frame_id]
+
+            self.queue.task_done()
+
+    def flush(self):
+        # Waits until every stored frame is compressed.
+        self.queue.join()
+
+    def read_frames(self, frame_ids, out=None):
+        # Decompresses each distinct frame once into the reused batch array, then gathers.
+        unique, inverse = np.unique(frame_ids, return_inverse=True)
+
+        if len(self.batch_frames) < len(unique):
+            self.batch_frames = np.zeros((len(unique), *self.frame_shape), dtype=np.uint8)
+
+        for i, frame_id in enumerate(unique):
+            frame = self.pending.get(frame_id)
+
+            if frame is None:
+                blob = self.blobs[frame_id % self.frame_capacity]
+                frame = np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(self.frame_shape)
+
+            self.batch_frames[i] = frame
+
+        return np.take(self.batch_frames, inverse.reshape(frame_ids.shape), axis=0, out=out, mode="clip")
+
+    def nbytes(self):
+        arrays = (self.prev_frame, self.state_frame, self.next_state_frame,
+                  self.action_memory, self.reward_memory, self.terminal_memory, self.batch_frames)
+        pending = sum(frame.nbytes for frame in list(self.pending.values()))
+        return sum(array.nbytes for array in arrays) + self.blob_bytes + pending
+
+
+class SumTree():
+
+    # Array-based binary sum-tree over capacity priorities: node 1 is the root, node k has children
+    # 2k and 2k + 1, and the leaves start at self.leaves. Sampling and updates walk one root-to-leaf
+    # path per item, a whole batch at a time.
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+
+        self.tree = np.zeros(2 * self.leaves)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[indices + self.leaves]
+
+    def update(self, indices, priorities):
+        nodes = indices + self.leaves
+        self.tree[nodes] = priorities
+
+        # Parents are recomputed from their children, so rounding errors never accumulate.
+        # Duplicate nodes just write the same sum twice.
+        nodes = nodes // 2
+        while nodes[0] > 0:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            nodes //= 2
+
+    def update_one(self, index, priority):
+        # Scalar path for the single insert of every store_transition.
+        node = index + self.leaves
+        self.tree[node] = priority
+
+        node //= 2
+        while node > 0:
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+            node //= 2
+
+    def find(self, values):
+        # Leaf index whose prefix-sum interval contains each value.
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = values.copy()
+
+        while nodes[0] < self.leaves:
+            left = 2 * nodes
+            left_sum = self.tree[left]
+
+            # Never step into an empty subtree, even when rounding pushes a value past the total.
+            go_right = (values >= left_sum) & (self.tree[left + 1] > 0)
+            values -= np.where(go_right, left_sum, 0)
+            nodes = left + go_right
+
+        return nodes - self.leaves
+
+    def sample(self, batch_size):
+        # Stratified: one value from each of batch_size equal slices of the total.
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * self.total() / batch_size
+        return self.find(values)
+
+
+class PrioritizedReplayBuffer(FrameReplayBuffer):
+
+    # Proportional prioritized replay: transitions are drawn with probability p^alpha / sum and
+    # weighted by (N * P)^-beta, with beta annealed to 1 over beta_steps samples. New transitions get
+    # the largest priority seen so far. After learning on a batch, update_priorities(td_errors) sets
+    # the priorities of the transitions sample_buffer returned last (self.batch, weights in self.weights).
+
+    def __init__(self, max_size, input_shape, n_actions, device='cpu', frame_stack=1, frame_capacity=None,
+                 alpha=0.6, beta=0.4, beta_steps=100000, priority_epsilon=1e-6):
+        super().__init__(max_size, input_shape, n_actions, device=device, frame_stack=frame_stack, frame_capacity=frame_capacity)
+
+        self.alpha = alpha
+        self.beta_start = beta
+        self.beta_steps = beta_steps
+        self.priority_epsilon = priority_epsilon
+
+        self.tree = SumTree(max_size)
+        self.max_priority = 1.0
+        self.samples = 0
+
+    def beta(self):
+        return min(1.0, self.beta_start + (1.0 - self.beta_start) * self.samples / self.beta_steps)
+
+    def store_transition(self, state, action, reward, next_state, done, env_index=0):
+        with self.lock:
+            index = self.mem_ctr % self.mem_size
+            super().store_transition(state, action, reward, next_state, done, env_index)
+            self.tree.update_one(index, self.max_priority ** self.alpha)
+
+    def sample_indices(self, batch_size):
+        batch = self.tree.sample(batch_size)
+
+        # Transitions whose state frame has been recycled are taken out of the tree and redrawn.
+        stale = ~self.is_live(self.state_frame[batch])
+        while stale.any():
+            self.tree.update(np.unique(batch[stale]), 0)
+            batch = self.tree.sample(batch_size)
+            stale = ~self.is_live(self.state_frame[batch])
+
+        max_mem = min(self.mem_ctr, self.mem_size)
+        probabilities = self.tree.get(batch) / self.tree.total()
+        weights = (max_mem * probabilities) ** -self.beta()
+        weights /= weights.max()
+
+        self.samples += 1
+
+        return batch, weights
+
+    def update_priorities(self, td_errors, batch=None):
+        # batch defaults to the indices of the last sample_buffer call.
+        batch = self.batch if batch is None else batch
+        priorities = np.abs(td_errors) + self.priority_epsilon
+
+        with self.lock:
+            self.max_priority = max(self.max_priority, float(priorities.max()))
+            self.tree.update(batch, priorities ** self.alpha)
@@ -1,79 +1,144 @@
 import pygame
 import math
+import numpy as np
+from collision import UniformGrid
 
-class SingleBullet:
 
-    def __init__(self, x, y, direction):
-        self.x = x
-        self.y = y
-        self.direction = direction
+def to_pixels(values):
+    # Rounds like assigning floats to pygame.Rect.topleft (half away from zero).
+    return np.copysign(np.floor(np.abs(values) + 0.5), values).astype(np.int64)
 
-        #print(f"Bullet launched in direction {direction}")
 
-        self.rect = pygame.Rect(x, y, 10, 10)
+class BulletSystem:
 
-        self.bullet_speed = 10
+    # Every live bullet is one row of the position / velocity arrays; rows [0, count) are live.
+
+    direction_vectors = {
+        "up": (0, -1),
+        "down": (0, 1),
+        "left": (-1, 0),
+        "right": (1, 0)
+    }
+
+    def __init__(self, world_width, world_height, capacity=64):
+        self.world_width = world_width
+        self.world_height = world_height
 
+        self.bullet_size = 10
+        self.bullet_speed = 10
         self.bullet_color = (192, 192, 192)
 
-    
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.dx = np.zeros(capacity)
+        self.dy = np.zeros(capacity)
+
+        self.count = 0
+
+        # Rebuilt from the bullet positions by hit() once there are more than direct_pairs box-bullet pairs.
+        self.grid = UniformGrid(cell_size=100)
+        self.direct_pairs = 2500
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def fire(self, x, y, direction, angle_offset=0):
+        if self.count == len(self.x):
+            for name in ("x", "y", "dx", "dy"):
+                setattr(self, name, np.resize(getattr(self, name), 2 * self.count))
+
+        # Rotate the unit direction by the (shotgun) spread angle.
+        ux, uy = self.direction_vectors[direction]
+        angle = math.radians(angle_offset)
+        dx = ux * math.cos(angle) - uy * math.sin(angle)
+        dy = ux * math.sin(angle) + uy * math.cos(angle)
+
+        i = self.count
+        self.x[i], self.y[i] = x, y
+        self.dx[i], self.dy[i] = dx * self.bullet_speed, dy * self.bullet_speed
+
+        self.count += 1
+
+    def positions(self):
+        return to_pixels(self.x[:self.count]), to_pixels(self.y[:self.count])
+
     def move(self):
+        n = self.count
+        self.x[:n] += self.dx[:n]
+        self.y[:n] += self.dy[:n]
 
-        if self.direction == "up":
-            self.y -= self.bullet_speed
-        elif self.direction == "down":
-            self.y += self.bullet_speed
-        elif self.direction == "left":
-            self.x -= self.bullet_speed
-        elif self.direction == "right":
-            self.x += self.bullet_speed
+    def cull(self, wall_boxes):
+        # Drops bullets touching a wall or fully outside the world.
+        x, y = self.positions()
+        size = self.bullet_size
 
-        self.rect.topleft = (self.x, self.y)
+        gone = (x + size <= 0) | (x >= self.world_width) | (y + size <= 0) | (y >= self.world_height)
 
+        if len(wall_boxes):
+            wx, wy, ww, wh = (wall_boxes[:, k] for k in range(4))
+            gone |= ((x[:, None] < wx + ww) & (wx < x[:, None] + size) &
+                     (y[:, None] < wy + wh) & (wy < y[:, None] + size)).any(1)
 
-    def draw(self, screen, camera_x, camera_y):
-        pygame.draw.rect(screen, self.bullet_color, (self.rect.x - camera_x, self.rect.y - camera_y, 10, 10))
-    
+        self.remove(gone)
 
-class ShotgunBullet:
+    def hit(self, boxes):
+        # For every (x, y, w, h) box, the bullet it consumes or -1. Boxes claim bullets in order and
+        # take the first live bullet touching them, like scanning the bullet list once per box. Bullets
+        # are bucketed into self.grid, so each box is only tested against the bullets in its cells.
+        claims = np.full(len(boxes), -1, dtype=np.int64)
 
-    def __init__(self, x, y, direction, angle_offset=0):
-        self.x = x
-        self.y = y
-        self.direction = direction
-        self.angle_offset = math.radians(angle_offset)
+        if self.count == 0 or len(boxes) == 0:
+            return claims
 
-        print(f"Bullet launched in direction {direction} with angle offset {angle_offset}")
+        x, y = self.positions()
+        taken = set()
 
-        self.rect = pygame.Rect(x, y, 10, 10)
-        self.bullet_speed = 10
-        self.bullet_color = (192, 192, 192)
+        if self.count * len(boxes) <= self.direct_pairs:
+            # A few zombies and bullets, as in normal play: building the grid costs more than testing all pairs.
+            size = self.bullet_size
+            bullets = list(enumerate(zip(x.tolist(), y.tolist())))
 
-        self.dx, self.dy = self.get_movement_vector(direction, self.angle_offset)
-    
-    def get_movement_vector(self, direction, angle_offset):
+            for box, (bx, by, bw, bh) in enumerate(boxes.tolist()):
+                for bullet, (px, py) in bullets:
+                    if bx < px + size and px < bx + bw and by < py + size and py < by + bh and bullet not in taken:
+                        claims[box] = bullet
+                        taken.add(bullet)
+                        break
+        else:
+            size = np.full(self.count, self.bullet_size)
+            self.grid.build(np.stack([x, y, size, size], axis=1))
 
-        direction_angles = {
-            "up": -math.pi / 2,
-            "down": math.pi / 2,
-            "left": math.pi,
-            "right": 0
-        }
+            for box, bullet in zip(*(ids.tolist() for ids in self.grid.all_pairs(boxes))):
+                if claims[box] < 0 and bullet not in taken:
+                    claims[box] = bullet
+                    taken.add(bullet)
 
-        base_angle = direction_angles[direction]
+        if taken:
+            gone = np.zeros(self.count, dtype=bool)
+            gone[list(taken)] = True
+            self.remove(gone)
 
-        final_angle = base_angle + angle_offset
+        return claims
 
-        dx = math.cos(final_angle) * self.bullet_speed
-        dy = math.sin(final_angle) * self.bullet_speed
+    def remove(self, mask):
+        # Swap-remove compaction: holes below the new count are filled from live rows above it.
+        n = self.count
+        keep = n - int(mask[:n].sum())
 
-        return dx, dy
-    
-    def move(self):
-        self.x += self.dx
-        self.y += self.dy
-        self.rect.topleft = (self.x, self.y)
+        if keep == n:
+            return
+
+        holes = np.flatnonzero(mask[:keep])
+        donors = keep + np.flatnonzero(~mask[keep:n])
+
+        for array in (self.x, self.y, self.dx, self.dy):
+            array[holes] = array[donors]
+
+        self.count = keep
 
     def draw(self, screen, camera_x, camera_y):
-        pygame.draw.rect(screen, self.bullet_color,
-                         (self.rect.x - camera_x, self.rect.y - camera_y, 10, 10))
\ No newline at end of file
+        for x, y in zip(*self.positions()):
+            pygame.draw.rect(screen, self.bullet_color, (x - camera_x, y - camera_y, self.bullet_size, self.bullet_size))
@@ -1,11 +1,15 @@
 import random
 import pygame
 import math
+import numpy as np
 from util import *
+from assets import load_sprite
+from bullet import to_pixels
 
 class Player:
 
-    def __init__(self, world_width, world_height, walls):
+    # rng: the env's random.Random (or the random module) for every random draw.
+    def __init__(self, world_width, world_height, walls, navigation=None, rng=random):
         
         self.size = 50
         self.speed = 5
@@ -15,13 +19,17 @@ class Player:
         self.x = world_width // 2
         self.y = world_height // 2
 
+        # With a navigation grid, step straight to the closest free spot instead of random-walking.
+        if navigation is not None and walls.any_hit(pygame.Rect(self.x, self.y, self.size, self.size)):
+            self.x, self.y = navigation.nearest_free_position(self.x, self.y)
+
         while True:
 
             self.rect = pygame.Rect(self.x, self.y, self.size, self.size)
             
-            if check_collision(self.rect, walls):
-                self.x += random.randint(-5, 5)
-                self.y += random.randint(-5, 5)
+            if walls.any_hit(self.rect):
+                self.x += rng.randint(-5, 5)
+                self.y += rng.randint(-5, 5)
             else:
                 break
 
@@ -33,8 +41,7 @@ class Player:
         self.images = {}
 
         for direction in ('up', 'down', 'left', 'right'):
-            image = pygame.image.load(f'images/player_{direction}.png')
-            self.images[direction] = pygame.transform.scale(image, (self.size, self.size))
+            self.images[direction] = load_sprite(f'images/player_{direction}.png', self.size)
         
         self.direction = "up"
     
@@ -44,19 +51,18 @@ class Player:
     
 class Zombie:
 
-    def __init__(self, world_width, world_height, size=50, speed=1):
+    def __init__(self, world_width, world_height, size=50, speed=1, rng=random):
         self.size = size
         self.world_width = world_width
         self.world_height = world_height
         self.speed = speed
 
-        self.x, self.y = self.spawn()
+        self.x, self.y = self.spawn(rng)
 
         self.images = {}
 
         for direction in ('up', 'down', 'left', 'right'):
-            image = pygame.image.load(f'images/zombie_{direction}.png')
-            self.images[direction] = pygame.transform.scale(image, (self.size, self.size))
+            self.images[direction] = load_sprite(f'images/zombie_{direction}.png', self.size)
 
         self.direction = "up"
 
@@ -64,15 +70,15 @@ class Zombie:
         self.rect.center = (self.x, self.y)
 
     
-    def spawn(self):
+    def spawn(self, rng=random):
         spawn_positions = [
-            (random.randint(0, self.world_width - self.size), 0), # Top edge
-            (random.randint(0, self.world_width - self.size), self.world_height - self.size), # Bottom edge
-            (0, random.randint(0, self.world_height - self.size)), # Left edge
-            (self.world_width - self.size, random.randint(0, self.world_height - self.size)) 
+            (rng.randint(0, self.world_width - self.size), 0), # Top edge
+            (rng.randint(0, self.world_width - self.size), self.world_height - self.size), # Bottom edge
+            (0, rng.randint(0, self.world_height - self.size)), # Left edge
+            (self.world_width - self.size, rng.randint(0, self.world_height - self.size)) 
         ]
 
-        return random.choice(spawn_positions)
+        return rng.choice(spawn_positions)
     
 
     def move_toward_player(self, player_x, player_y, walls):
@@ -87,7 +93,7 @@ class Zombie:
         # Try horizontal movement first
         new_x = self.x + dx * self.speed
         new_rect = pygame.Rect(new_x, self.y, self.size, self.size)
-        can_move_x = not check_collision(new_rect, walls)
+        can_move_x = not walls.any_hit(new_rect)
 
         if can_move_x:
             self.x = new_x
@@ -95,13 +101,13 @@ class Zombie:
             # Increase speed along y-axis if horizontal movement is blocked. 
             new_y = self.y + dy * self.speed * 1.5
             new_rect = pygame.Rect(self.x, new_y, self.size, self.size)
-            if not(check_collision(new_rect, walls)):
+            if not(walls.any_hit(new_rect)):
                 self.y = new_y
         
         # Try vertical movement next
         new_y = self.y + dy * self.speed
         new_rect = pygame.Rect(self.x, new_y, self.size, self.size)
-        can_move_y = not check_collision(new_rect, walls)
+        can_move_y = not walls.any_hit(new_rect)
 
         if can_move_y:
             self.y = new_y
@@ -109,7 +115,7 @@ class Zombie:
             # Increase speed along x-axis if vertical movement is blocked. 
             new_x = self.x + dx * self.speed * 1.5
             new_rect = pygame.Rect(new_x, self.y, self.size, self.size)
-            if not check_collision(new_rect, walls):
+            if not walls.any_hit(new_rect):
                 self.x = new_x
 
         # Update position and direction.
@@ -129,3 +135,131 @@ class Zombie:
     
     def draw(self, screen, camera_x, camera_y):
         screen.blit(self.images[self.direction], (self.x - camera_x, self.y - camera_y))
+
+
+class Horde:
+
+    # Every zombie is one row of the position / speed / direction arrays; rows [0, count) are live
+    # and stay in spawn order. move_toward_player steers the whole horde with the same rules
+    # (and the same float math) as Zombie.move_toward_player.
+
+    directions = ('up', 'down', 'left', 'right')
+
+    def __init__(self, world_width, world_height, size=80, capacity=16):
+        self.size = size
+        self.world_width = world_width
+        self.world_height = world_height
+
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.speed = np.zeros(capacity)
+        self.direction = np.zeros(capacity, dtype=np.int64)
+
+        # Zombie.rect: centred on the spawn point until the first move, then rounded from (x, y).
+        self.rect_x = np.zeros(capacity, dtype=np.int64)
+        self.rect_y = np.zeros(capacity, dtype=np.int64)
+
+        self.count = 0
+
+        self.images = {direction: load_sprite(f'images/zombie_{direction}.png', size) for direction in self.directions}
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def spawn(self, speed, navigation=None, rng=random):
+        if self.count == len(self.x):
+            for name in ("x", "y", "speed", "direction", "rect_x", "rect_y"):
+                setattr(self, name, np.resize(getattr(self, name), 2 * self.count))
+
+        if navigation is not None:
+            x, y = navigation.sample_edge_position(rng)
+        else:
+            spawn_positions = [
+                (rng.randint(0, self.world_width - self.size), 0), # Top edge
+                (rng.randint(0, self.world_width - self.size), self.world_height - self.size), # Bottom edge
+                (0, rng.randint(0, self.world_height - self.size)), # Left edge
+                (self.world_width - self.size, rng.randint(0, self.world_height - self.size)) 
+            ]
+
+            x, y = rng.choice(spawn_positions)
+
+        i = self.count
+        self.x[i], self.y[i] = x, y
+        self.speed[i] = speed
+        self.direction[i] = 0
+        self.rect_x[i], self.rect_y[i] = x - self.size // 2, y - self.size // 2
+
+        self.count += 1
+
+    def boxes(self):
+        n = self.count
+        return np.stack([self.rect_x[:n], self.rect_y[:n], np.full(n, self.size), np.full(n, self.size)], axis=1)
+
+    def remove(self, mask):
+        # Order-preserving compaction, so later queries still see zombies in spawn order.
+        keep = ~mask[:self.count]
+
+        for array in (self.x, self.y, self.speed, self.direction, self.rect_x, self.rect_y):
+            kept = array[:self.count][keep]
+            array[:len(kept)] = kept
+
+        self.count = int(keep.sum())
+
+    def blocked(self, x, y, wall_boxes):
+        # pygame.Rect truncates float coordinates.
+        x, y = np.trunc(x)[:, None], np.trunc(y)[:, None]
+        wx, wy, ww, wh = (wall_boxes[:, k] for k in range(4))
+
+        return ((x < wx + ww) & (wx < x + self.size) & (y < wy + wh) & (wy < y + self.size)).any(1)
+
+    def move_toward_player(self, player_x, player_y, wall_boxes, navigation=None):
+        n = self.count
+        x, y, speed = self.x[:n], self.y[:n], self.speed[:n]
+
+        dx, dy = player_x - x, player_y - y
+
+        # np.hypot can differ from math.hypot in the last bit, and steering has to match Zombie exactly.
+        distance = np.fromiter(map(math.hypot, dx, dy), dtype=np.float64, count=n)
+        distance[distance == 0] = 1
+
+        dx, dy = dx / distance, dy / distance
+
+        # Follow the flow field where it covers the zombie, otherwise head straight for the player.
+        if navigation is not None:
+            flow_x, flow_y, has_flow = navigation.flow(x, y)
+            dx = np.where(has_flow, flow_x, dx)
+            dy = np.where(has_flow, flow_y, dy)
+
+        # Try horizontal movement first, sliding faster along y when blocked.
+        new_x = x + dx * speed
+        can_move_x = ~self.blocked(new_x, y, wall_boxes)
+        slide_y = y + dy * speed * 1.5
+        can_slide_y = ~can_move_x & ~self.blocked(x, slide_y, wall_boxes)
+        x = np.where(can_move_x, new_x, x)
+        y = np.where(can_slide_y, slide_y, y)
+
+        # Then vertical movement, sliding faster along x when blocked.
+        new_y = y + dy * speed
+        can_move_y = ~self.blocked(x, new_y, wall_boxes)
+        slide_x = x + dx * speed * 1.5
+        can_slide_x = ~can_move_y & ~self.blocked(slide_x, y, wall_boxes)
+        y = np.where(can_move_y, new_y, y)
+        x = np.where(can_slide_x, slide_x, x)
+
+        self.x[:n], self.y[:n] = x, y
+        self.rect_x[:n], self.rect_y[:n] = to_pixels(x), to_pixels(y)
+
+        # up, down, left, right
+        self.direction[:n] = np.where(np.abs(dx) > np.abs(dy), np.where(dx > 0, 3, 2), np.where(dy > 0, 1, 0))
+
+    def entries(self):
+        for i in range(self.count):
+            yield self.x[i], self.y[i], self.directions[self.direction[i]]
+
+    def draw(self, screen, camera_x, camera_y):
+        for x, y, direction in self.entries():
+            screen.blit(self.images[direction], (x - camera_x, y - camera_y))
+
@@ -0,0 +1,163 @@
+import numpy as np
+from collections import defaultdict
+
+# Uniform-grid spatial hash for pygame.Rect collision queries. Items are bucketed by every
+# grid cell their rect touches, so a query only tests the items sharing a cell with it.
+# Queries answer in insertion order, which keeps "first hit" identical to util.get_collision.
+# SpatialHash indexes fixed rects (walls); UniformGrid is its array counterpart for moving boxes
+# (bullets), rebuilt from NumPy arrays every frame.
+
+
+class SpatialHash():
+
+    def __init__(self, cell_size=100):
+        self.cell_size = cell_size
+        self.clear()
+
+    def clear(self):
+        self.cells = defaultdict(list)
+        self.items = []
+        self.rects = []
+
+    def insert(self, item, rect=None):
+        rect = item.rect if rect is None else rect
+
+        i = len(self.items)
+        self.items.append(item)
+        self.rects.append(rect)
+
+        for cell in self._cells(rect):
+            self.cells[cell].append(i)
+
+    def any_hit(self, rect):
+        return self.first_hit(rect) is not None
+
+    def first_hit(self, rect):
+        hits = self._hits(rect)
+        return self.items[min(hits)] if hits else None
+
+    def _cells(self, rect):
+        size = self.cell_size
+
+        # Rects with no area never collide, so they are not bucketed.
+        if rect.width <= 0 or rect.height <= 0:
+            return []
+
+        x0, x1 = rect.left // size, (rect.right - 1) // size
+        y0, y1 = rect.top // size, (rect.bottom - 1) // size
+
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def _hits(self, rect):
+        hits = set()
+
+        for cell in self._cells(rect):
+            for i in self.cells.get(cell, ()):
+                if i not in hits and rect.colliderect(self.rects[i]):
+                    hits.add(i)
+
+        return hits
+
+
+# Cell coordinates are packed into one int64 key; the offset keeps boxes slightly outside the world valid.
+CELL_OFFSET = 1 << 20
+CELL_STRIDE = 1 << 21
+
+
+def cell_keys(boxes, cell_size):
+    # (box index, cell key) for every grid cell each (x, y, w, h) box touches.
+    x, y, w, h = boxes.T
+    x0, y0 = x // cell_size, y // cell_size
+    nx = (x + w - 1) // cell_size - x0 + 1
+    ny = (y + h - 1) // cell_size - y0 + 1
+
+    # Box i covers nx[i] * ny[i] cells; k numbers them within the box.
+    counts = nx * ny
+    ids = np.repeat(np.arange(len(boxes)), counts)
+    k = np.arange(len(ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+    dx, dy = np.divmod(k, ny[ids])
+
+    return ids, (x0[ids] + dx + CELL_OFFSET) * CELL_STRIDE + y0[ids] + dy + CELL_OFFSET
+
+
+class UniformGrid():
+
+    # Boxes bucketed by cell in one sorted key array: a query box only tests the boxes in the cells
+    # it touches, so cost grows with the number of nearby pairs instead of queries x boxes.
+
+    def __init__(self, cell_size=100):
+        self.cell_size = cell_size
+        self.build(np.zeros((0, 4), dtype=np.int64))
+
+    def build(self, boxes):
+        self.boxes = boxes
+
+        ids, keys = cell_keys(boxes, self.cell_size)
+        order = np.argsort(keys, kind="stable")
+
+        self.keys = keys[order]
+        self.ids = ids[order]
+
+    def all_pairs(self, queries):
+        # (query index, box index) arrays of every overlapping pair, sorted by query, then box.
+        query_ids, keys = cell_keys(queries, self.cell_size)
+
+        lo = np.searchsorted(self.keys, keys, side="left")
+        counts = np.searchsorted(self.keys, keys, side="right") - lo
+
+        # Expand each query cell into the range of grid entries sharing its key.
+        total = int(counts.sum())
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        query_ids = np.repeat(query_ids, counts)
+        box_ids = self.ids[starts + np.arange(total)]
+
+        q, b = queries[query_ids], self.boxes[box_ids]
+        overlap = (q[:, 0] < b[:, 0] + b[:, 2]) & (b[:, 0] < q[:, 0] + q[:, 2]) & \
+            (q[:, 1] < b[:, 1] + b[:, 3]) & (b[:, 1] < q[:, 1] + q[:, 3])
+
+        # A pair sharing several cells is listed once.
+        n = max(len(self.boxes), 1)
+        pairs = np.unique(query_ids[overlap] * n + box_ids[overlap])
+
+        return np.divmod(pairs, n)
+
+    def first_hits(self, queries):
+        # For every query, the lowest-index box it overlaps, or -1.
+        hits = np.full(len(queries), -1, dtype=np.int64)
+        query_ids, box_ids = self.all_pairs(queries)
+
+        # Pairs are sorted, so the first pair of each query holds its lowest box index.
+        first = np.flatnonzero(np.r_[True, query_ids[1:] != query_ids[:-1]]) if len(query_ids) else query_ids
+        hits[query_ids[first]] = box_ids[first]
+
+        return hits
+
+    def any_hits(self, queries):
+        return self.first_hits(queries) >= 0
+
+
+class StaticIndex(SpatialHash):
+
+    # Built once from a fixed list of rects, such as a level's walls. The rects are the items.
+
+    def __init__(self, rects, cell_size=100):
+        super().__init__(cell_size)
+
+        for rect in rects:
+            self.insert(rect, rect)
+
+        # (x, y, w, h) rows for callers that test many boxes at once with NumPy.
+        self.boxes = np.array([tuple(rect) for rect in rects], dtype=np.int64).reshape(-1, 4)
+
+
+_wall_indexes = {}
+
+
+def wall_index(walls):
+    # One index per wall list; walls_1/walls_2/walls_3 are module constants, so each is built once.
+    key = id(walls)
+
+    if key not in _wall_indexes:
+        _wall_indexes[key] = (walls, StaticIndex(walls))
+
+    return _wall_indexes[key][1]
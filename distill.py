@@ -0,0 +1,218 @@
+import time
+import random
+import numpy as np
+import torch
+import torch.optim as optim
+import torch.nn.functional as F
+from game import ZombieShooter
+from model import ZombieNet, TwinZombieNet
+from buffer import FrameReplayBuffer, DiskReplayBuffer, stack_frames
+from recording import load_recordings, ENV_SETTINGS
+from quantize import latency
+
+# Policy distillation of the twin Q networks into one small ZombieNet. The teacher's policy is a
+# softmax over its twin-Q minimum at a low temperature; the student's logits are trained to match it
+# (KL divergence) on states sampled from a replay buffer. The student then acts on its own, with the
+# same argmax as the pair and a fraction of the weights.
+
+hidden_layer = 1024
+student_hidden_layer = 128
+frame_stack = 1
+step_repeat = 4
+
+# Where the distillation states come from: a training run's on-disk replay buffer (replay_dir), episodes
+# saved by test.py (recordings_file), or else collect_steps of epsilon-greedy play by the teacher.
+replay_dir = None
+recordings_file = None
+collect_steps = 20000
+collect_epsilon = 0.1
+memory_size = 500000
+
+distill_steps = 20000
+batch_size = 64
+learning_rate = 0.0005
+temperature = 0.01
+
+# Seeded evaluation episodes for the teacher / student table, played as in test.py.
+eval_episodes = 5
+eval_epsilon = 0.05
+max_episode_steps = 10000 / step_repeat
+seed = 0
+
+WINDOW_WIDTH, WINDOW_HEIGHT = 1200, 800
+WORLD_WIDTH, WORLD_HEIGHT = 1800, 1200
+FPS = 60
+
+env_kwargs = dict(window_width=WINDOW_WIDTH, window_height=WINDOW_HEIGHT,
+                  world_height=WORLD_HEIGHT, world_width=WORLD_WIDTH,
+                  fps=FPS, sound=False)
+
+
+def teacher_q_values(teacher):
+    return lambda states: teacher(states).min(dim=0).values
+
+
+def greedy_actions(q_values, states):
+    with torch.no_grad():
+        return q_values(states).argmax(-1)
+
+
+def collect_states(env, memory, q_values, steps, epsilon, device='cpu'):
+    # steps transitions of epsilon-greedy play by q_values into memory.
+    state, _ = env.reset()
+    stacked_state = stack_frames(None, state, memory.frame_stack)
+
+    for _ in range(steps):
+        if random.random() < epsilon:
+            action = env.action_space.sample()
+        else:
+            action = greedy_actions(q_values, stacked_state.unsqueeze(0).to(device)).item()
+
+        next_state, reward, done, _, _ = env.step(action, repeat=step_repeat)
+        memory.store_transition(state, action, reward, next_state, done)
+
+        if done:
+            state, _ = env.reset()
+            stacked_state = stack_frames(None, state, memory.frame_stack)
+        else:
+            state = next_state
+            stacked_state = stack_frames(stacked_state, next_state, memory.frame_stack)
+
+
+def replay_recordings(recordings, memory, env):
+    # Plays every recording back into memory, transition by transition. Its actions only reproduce the
+    # episode in an env with the recorded settings, which is also the env the student is evaluated in.
+    settings = {name: getattr(env, name) for name in ENV_SETTINGS}
+
+    for recording in recordings:
+        if recording.env_settings() != settings:
+            raise ValueError(f"Recording with seed {recording.seed} was made with {recording.env_settings()}, expected {settings}")
+
+        state, _ = env.reset(seed=recording.seed)
+
+        for action in recording.actions:
+            next_state, reward, done, _, _ = env.step(action, repeat=recording.repeat)
+            memory.store_transition(state, action, reward, next_state, done)
+            state = next_state
+
+
+def distill(teacher, student, memory, steps, batch_size=64, learning_rate=0.0005, temperature=0.01, log_every=1000):
+    teacher.eval()
+    student.train()
+
+    optimizer = optim.Adam(student.parameters(), lr=learning_rate)
+    start = time.time()
+
+    for step in range(1, steps + 1):
+        states = memory.sample_buffer(batch_size)[0]
+
+        with torch.no_grad():
+            targets = F.softmax(teacher(states).min(dim=0).values / temperature, dim=-1)
+
+        logits = student(states)
+        loss = F.kl_div(F.log_softmax(logits, dim=-1), targets, reduction='batchmean')
+
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+        if step % log_every == 0:
+            agreement = (logits.argmax(-1) == targets.argmax(-1)).float().mean().item()
+            print(f"Distill step {step}: KL {loss.item():.4f}, batch agreement {agreement:.1%}, {time.time() - start:.0f}s")
+
+    student.eval()
+
+    return student
+
+
+def evaluate(env, q_values, episodes, seed, epsilon=0.05, max_steps=2500, device='cpu', frame_stack=1):
+    # Mean score of seeded epsilon-greedy episodes; the same seeds give both models the same levels.
+    scores = []
+    random.seed(seed)
+
+    for episode in range(episodes):
+        done = False
+        episode_reward = 0
+        episode_steps = 0
+        state, _ = env.reset(seed=seed + episode)
+        stacked_state = stack_frames(None, state, frame_stack)
+
+        while not done and episode_steps < max_steps:
+            if random.random() < epsilon:
+                action = env.action_space.sample()
+            else:
+                action = greedy_actions(q_values, stacked_state.unsqueeze(0).to(device)).item()
+
+            state, reward, done, _, _ = env.step(action, repeat=step_repeat)
+            stacked_state = stack_frames(stacked_state, state, frame_stack)
+
+            episode_reward += reward
+            episode_steps += 1
+
+        scores.append(episode_reward)
+
+    return float(np.mean(scores))
+
+
+def model_bytes(model):
+    return sum(tensor.numel() * tensor.element_size() for tensor in model.state_dict().values())
+
+
+def distillation_report(env, teacher, student, states, episodes, seed, epsilon=0.05, max_steps=2500, device='cpu', frame_stack=1):
+    # Size, batch-1 latency, agreement with the teacher's greedy action on states and evaluation score.
+    teacher.eval()
+    student.eval()
+
+    teacher_actions = greedy_actions(teacher_q_values(teacher), states)
+
+    rows = []
+    for name, model, q_values in (("teacher (twin-Q)", teacher, teacher_q_values(teacher)), ("student", student, student)):
+        agreement = (greedy_actions(q_values, states) == teacher_actions).float().mean().item()
+        score = evaluate(env, q_values, episodes, seed, epsilon, max_steps, device, frame_stack)
+
+        rows.append({"model": name, "params": sum(p.numel() for p in model.parameters()),
+                     "size_mb": model_bytes(model) / 2 ** 20, "latency_ms": latency(model, states) * 1000,
+                     "agreement": agreement, "score": score})
+
+    print(f"{'model':<20}{'params':>12}{'size MB':>10}{'ms/action':>11}{'agreement':>11}{'score':>10}")
+    for row in rows:
+        print(f"{row['model']:<20}{row['params']:>12,}{row['size_mb']:>10.2f}{row['latency_ms']:>11.3f}"
+              f"{row['agreement']:>11.1%}{row['score']:>10.1f}")
+
+    return rows
+
+
+if __name__ == "__main__":
+
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+
+    env = ZombieShooter(render_mode="rgb", **env_kwargs)
+    observation, info = env.reset()
+    observation_shape = (observation.shape[0] * frame_stack, *observation.shape[1:])
+
+    teacher = TwinZombieNet(action_dim=env.action_space.n, hidden_dim=hidden_layer, observation_shape=observation_shape).to(device)
+    teacher.load_the_model()
+    teacher.eval()
+
+    if replay_dir:
+        memory = DiskReplayBuffer(max_size=memory_size, input_shape=observation.shape, n_actions=env.action_space.n,
+                                  directory=replay_dir, device=device, frame_stack=frame_stack)
+    else:
+        memory = FrameReplayBuffer(max_size=memory_size, input_shape=observation.shape, n_actions=env.action_space.n,
+                                   device=device, frame_stack=frame_stack)
+
+        if recordings_file:
+            replay_recordings(load_recordings(recordings_file), memory, env)
+        else:
+            collect_states(env, memory, teacher_q_values(teacher), collect_steps, collect_epsilon, device)
+
+    print(f"Distilling on {min(memory.mem_ctr, memory.mem_size)} transitions")
+
+    torch.manual_seed(seed)
+    student = ZombieNet(action_dim=env.action_space.n, hidden_dim=student_hidden_layer, observation_shape=observation_shape).to(device)
+
+    distill(teacher, student, memory, distill_steps, batch_size, learning_rate, temperature)
+    student.save_the_model(filename='models/student.pt')
+
+    distillation_report(env, teacher, student, memory.sample_buffer(256)[0], eval_episodes, seed,
+                        eval_epsilon, max_episode_steps, device, frame_stack)
@@ -0,0 +1,153 @@
+import os
+import signal
+import traceback
+import ctypes
+import multiprocessing as mp
+import numpy as np
+import torch
+import gymnasium as gym
+
+# K ZombieShooter(render_mode="rgb") instances, one per worker process. Each worker writes
+# its observation into its own slot of a shared uint8 array, so only rewards, flags and the
+# small info dict go through the pipes.
+
+OBS_SHAPE = (1, 128, 128)
+
+
+def make_worker_env(env_kwargs):
+    # A headless ZombieShooter for a spawned worker process (EnvPool workers and actor_learner actors).
+    # Spawned workers never inherit the parent's SDL state, so the dummy video driver is chosen before
+    # pygame is imported. SDL also installs its own SIGTERM handler, which would leave terminate() unable
+    # to stop the worker, so the default one is put back.
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+
+    from game import ZombieShooter
+
+    env = ZombieShooter(render_mode="rgb", **env_kwargs)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    return env
+
+
+def worker(index, pipe, shared_obs, env_kwargs):
+    # Replies are ("ok", result), or ("error", exception) once anything fails, after which the worker exits.
+    try:
+        env = make_worker_env(env_kwargs)
+        slot = np.frombuffer(shared_obs, dtype=np.uint8).reshape(-1, *OBS_SHAPE)[index]
+
+        while True:
+            command, data = pipe.recv()
+
+            if command == "step":
+                action, repeat = data
+                obs, reward, done, truncated, info = env.step(action, repeat=repeat)
+                slot[:] = obs.numpy()
+                pipe.send(("ok", (reward, done, truncated, info)))
+
+            elif command == "reset":
+                obs, info = env.reset()
+                slot[:] = obs.numpy()
+                pipe.send(("ok", info))
+
+            elif command == "close":
+                pipe.close()
+                break
+
+    except Exception as error:
+        error.add_note(f"Raised in EnvPool worker {index}:\n{traceback.format_exc()}")
+        pipe.send(("error", error))
+
+
+class EnvPool():
+
+    def __init__(self, num_envs, env_kwargs, max_episode_steps=None):
+        self.num_envs = num_envs
+        self.max_episode_steps = max_episode_steps
+
+        self.action_space = gym.spaces.Discrete(7)
+
+        ctx = mp.get_context("spawn")
+
+        self.shared_obs = ctx.RawArray(ctypes.c_uint8, num_envs * int(np.prod(OBS_SHAPE)))
+        self.obs = np.frombuffer(self.shared_obs, dtype=np.uint8).reshape(num_envs, *OBS_SHAPE)
+
+        self.episode_steps = np.zeros(num_envs, dtype=np.int64)
+
+        self.pipes = []
+        self.processes = []
+
+        for index in range(num_envs):
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(target=worker, args=(index, child_pipe, self.shared_obs, env_kwargs), daemon=True)
+            process.start()
+            child_pipe.close()
+
+            self.pipes.append(parent_pipe)
+            self.processes.append(process)
+
+    def reset(self):
+        infos = self._reset_workers(range(self.num_envs))
+
+        self.episode_steps[:] = 0
+
+        return torch.from_numpy(self.obs).float(), self._stack_infos(infos)
+
+    def step(self, actions, repeat=4):
+        for pipe, action in zip(self.pipes, actions):
+            pipe.send(("step", (int(action), repeat)))
+
+        results = [self._recv(pipe) for pipe in self.pipes]
+
+        rewards = np.array([result[0] for result in results], dtype=np.float32)
+        dones = np.array([result[1] for result in results], dtype=bool)
+
+        self.episode_steps += 1
+
+        truncated = np.array([result[2] for result in results], dtype=bool)
+        if self.max_episode_steps is not None:
+            truncated |= ~dones & (self.episode_steps >= self.max_episode_steps)
+
+        info = self._stack_infos([result[3] for result in results])
+
+        # Auto-reset finished workers; their last frame is kept in the info dict.
+        finished = np.flatnonzero(dones | truncated)
+        info["final_observation"] = torch.from_numpy(self.obs[finished]).float()
+        info["final_index"] = finished
+
+        if len(finished):
+            self._reset_workers(finished)
+            self.episode_steps[finished] = 0
+
+        return torch.from_numpy(self.obs).float(), rewards, dones, truncated, info
+
+    def close(self):
+        for pipe in self.pipes:
+            try:
+                pipe.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+            pipe.close()
+
+        for process in self.processes:
+            process.join(timeout=5)
+
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+    def _recv(self, pipe):
+        status, result = pipe.recv()
+
+        if status == "error":
+            raise result
+
+        return result
+
+    def _reset_workers(self, workers):
+        for index in workers:
+            self.pipes[index].send(("reset", None))
+
+        return [self._recv(self.pipes[index]) for index in workers]
+
+    def _stack_infos(self, infos):
+        return {key: np.array([info[key] for info in infos]) for key in infos[0]}
@@ -9,18 +9,25 @@ from characters import *
 import random
 from util import *
 from walls import *
+from raster import ObservationRasterizer
+from assets import load_sprite, preload_sprites
+from collision import wall_index
+from navigation import navigation_grid, FlowField
+from profiler import profiler
 import gymnasium as gym
 import os
 
+SPRITES = [(f'images/player_{direction}.png', 50) for direction in ('up', 'down', 'left', 'right')] \
+    + [(f'images/zombie_{direction}.png', 80) for direction in ('up', 'down', 'left', 'right')] \
+    + [("images/chest_closed.png", 50), ("images/chest_opened.png", 50), ("images/heart.png", 30)]
+
+
 class TreasureChest:
 
     def __init__(self, x, y):
-        self.closed_image = pygame.image.load("images/chest_closed.png").convert_alpha()
-        self.opened_image = pygame.image.load("images/chest_opened.png").convert_alpha()
-
         self.size = 50
-        self.closed_image = pygame.transform.scale(self.closed_image, (self.size, self.size))
-        self.opened_image = pygame.transform.scale(self.opened_image, (self.size, self.size))
+        self.closed_image = load_sprite("images/chest_closed.png", self.size)
+        self.opened_image = load_sprite("images/chest_opened.png", self.size)
 
         self.rect = pygame.Rect(x, y, self.size, self.size)
         self.is_opened = False
@@ -35,9 +42,8 @@ class TreasureChest:
 class HealthDrop:
 
     def __init__(self, x, y):
-        self.image = pygame.image.load("images/heart.png").convert_alpha()
         self.size = 30
-        self.image = pygame.transform.scale(self.image, (self.size, self.size))
+        self.image = load_sprite("images/heart.png", self.size)
 
         self.x = x
         self.y = y
@@ -50,7 +56,7 @@ class HealthDrop:
 
 class ZombieShooter():
 
-    def __init__(self, window_width, window_height, world_height, world_width, fps, sound=False, render_mode="human"): 
+    def __init__(self, window_width, window_height, world_height, world_width, fps, sound=False, render_mode="human", obs_mode="screen", zombie_pathing="direct", seed=None): 
         
         self.window_width = window_width
         self.window_height = window_height
@@ -74,20 +80,39 @@ class ZombieShooter():
             os.environ["SDL_VIDEODRIVER"] = "dummy"
         else:
             raise Exception("Invalid render mode")
+
+        if obs_mode not in ("screen", "raster"):
+            raise Exception("Invalid observation mode")
+
+        self.obs_mode = obs_mode
+
+        if zombie_pathing not in ("direct", "flow_field"):
+            raise Exception("Invalid zombie pathing")
+
+        self.zombie_pathing = zombie_pathing
+
+        # Every random draw of the simulation comes from self.rng. Without a seed it is the global random
+        # module, as before; with one (here or in reset) the env gets its own random.Random.
+        self.rng = random.Random(seed) if seed is not None else random
         
         pygame.init()
         self.screen = pygame.display.set_mode((window_width, window_height))
 
         pygame.display.set_caption("Zombie Shooter")
 
+        # Decode every sprite up front so spawning never touches the disk.
+        preload_sprites(SPRITES)
+
         self.font = pygame.font.SysFont(None, 36)
 
         self.clock = pygame.time.Clock()
         self.fps = fps
 
-        self.walls = walls_1
+        self.set_walls(walls_1)
 
-        self.player = Player(world_height=self.world_height, world_width=self.world_width, walls=self.walls)
+        self.player = Player(world_height=self.world_height, world_width=self.world_width, walls=self.wall_index, navigation=self.player_navigation, rng=self.rng)
+        self.bullets = BulletSystem(world_width=self.world_width, world_height=self.world_height)
+        self.zombies = Horde(world_width=self.world_width, world_height=self.world_height, size=80)
 
         self.background_color = (181, 101, 29)
         self.wall_color = (1, 50, 32)
@@ -95,6 +120,15 @@ class ZombieShooter():
 
         self.announcement_font = pygame.font.SysFont(None, 100)
 
+        # Banner drawn over the next announcement_frames rendered frames (human mode only).
+        self.announcement = None
+        self.announcement_frames = 0
+
+        self.rasterizer = ObservationRasterizer(window_width, window_height,
+                                                background_color=self.background_color,
+                                                wall_color=self.wall_color,
+                                                border_color=self.border_color)
+
         self.reset()
 
 
@@ -120,13 +154,16 @@ class ZombieShooter():
             self.vocals_1.play()
 
 
-    def reset(self):
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng = random.Random(seed)
+
         self.done = False
         self.level = 1
         self.level_goal = 5
         self.max_zombie_count = 5
-        self.walls = walls_1
-        self.player = Player(world_height=self.world_height, world_width=self.world_width, walls=self.walls)
+        self.set_walls(walls_1)
+        self.player = Player(world_height=self.world_height, world_width=self.world_width, walls=self.wall_index, navigation=self.player_navigation, rng=self.rng)
         self.player.health = 5
         self.max_zombie_count = 5
         self.zombie_top_speed = 1
@@ -136,11 +173,33 @@ class ZombieShooter():
         self.out_of_ammo_message_displayed = False
         self.gun_type = "single"
 
-        self.bullets = []
-        self.zombies = []
+        self.bullets.clear()
+        self.zombies.clear()
+
+        # A chest or heart left over from the last episode would make the next one depend on it.
+        self.treasure_chest = None
+        self.health_drop = None
+
+        # Nor may the last episode's "You Died" banner cover the first frames of this one.
+        self.announcement = None
+        self.announcement_frames = 0
+
+        if self.human or self.obs_mode == "screen":
+            self.render()
 
         return self._get_obs(), self._get_info()
 
+    def set_walls(self, walls):
+        self.walls = walls
+        self.wall_index = wall_index(walls)
+
+        if self.zombie_pathing == "flow_field":
+            self.zombie_navigation = FlowField(navigation_grid(walls, self.world_width, self.world_height, agent_size=80))
+            self.player_navigation = navigation_grid(walls, self.world_width, self.world_height, agent_size=50)
+        else:
+            self.zombie_navigation = None
+            self.player_navigation = None
+
     def play_walking_sound(self):
 
         if self.sound:
@@ -153,38 +212,31 @@ class ZombieShooter():
         self.level += 1
 
         if self.level > 3:
-            next_level_surface = self.announcement_font.render("You Won!", True, (255, 0, 0))
+            self.announce("You Won!", seconds=4)
         else:
-            next_level_surface = self.announcement_font.render(f'Starting level {self.level}', True, (255, 0, 0))
+            self.announce(f'Starting level {self.level}', seconds=4)
 
-        next_level_rect = next_level_surface.get_rect(center=(self.window_width // 2, self.window_height // 2))
-
-        self.zombies = []
-        self.bullets = []
+        self.zombies.clear()
+        self.bullets.clear()
 
         if self.level == 2:
             if self.sound:
                 self.vocals_2.play()
-            self.walls = walls_2
+            self.set_walls(walls_2)
             self.level_goal = 15
         elif self.level == 3:
             if self.sound:
                 self.vocals_3.play()
-            self.walls = walls_3
+            self.set_walls(walls_3)
             self.level_goal = 30
-        
-        self.screen.blit(next_level_surface, next_level_rect)
 
-        x, y = random.randint(50, self.world_width - 50), random.randint(50, self.world_height - 50)
+        x, y = self.rng.randint(50, self.world_width - 50), self.rng.randint(50, self.world_height - 50)
         self.treasure_chest = TreasureChest(x, y)
 
         self.zombie_top_speed += 1
         self.max_zombie_count += 2
 
-        self.player = Player(world_height=self.world_height, world_width=self.world_width, walls=self.walls)
-
-        pygame.display.flip()
-        pygame.time.wait(4000)
+        self.player = Player(world_height=self.world_height, world_width=self.world_width, walls=self.wall_index, navigation=self.player_navigation, rng=self.rng)
 
         if self.level > 3:
             self.done = True
@@ -193,22 +245,13 @@ class ZombieShooter():
 
     def game_over(self):
 
-        game_over_surface = self.announcement_font.render('You Died', True, (255, 0, 0)) # Red text
-
-        game_over_rect = game_over_surface.get_rect(center=(self.window_width // 2, self.window_height // 2))
-
-        self.screen.blit(game_over_surface, game_over_rect)
-
-        pygame.display.flip()
+        self.announce('You Died', seconds=2)
 
         self.done = True
 
         if self.sound:
             self.zombie_snarl.play()
 
-        if(self.human):
-            pygame.time.wait(2000)
-
 
         
         # Quit the game. 
@@ -216,6 +259,13 @@ class ZombieShooter():
         # sys.exit()
 
 
+    def announce(self, text, seconds):
+        # Shown by render() for the next seconds * fps frames while the game keeps running.
+        # Nobody watches rgb mode, so there the banner is never even rendered.
+        if self.human:
+            self.announcement = self.announcement_font.render(text, True, (255, 0, 0)) # Red text
+            self.announcement_frames = int(seconds * self.fps)
+
     def fill_background(self):
 
         self.screen.fill(self.background_color)
@@ -244,8 +294,7 @@ class ZombieShooter():
 
 
     def fire_single_bullet(self):
-        bullet = SingleBullet(self.player.x, self.player.y, self.player.direction)
-        self.bullets.append(bullet)
+        self.bullets.fire(self.player.x, self.player.y, self.player.direction)
 
         if self.sound: 
             self.shotgun_blast.play()
@@ -259,8 +308,7 @@ class ZombieShooter():
             ]
         
             for direction, angle_offset in directions:
-                bullet = ShotgunBullet(self.player.x, self.player.y, direction, angle_offset)
-                self.bullets.append(bullet)
+                self.bullets.fire(self.player.x, self.player.y, direction, angle_offset)
         
             self.shotgun_ammo -= 1
             
@@ -285,6 +333,9 @@ class ZombieShooter():
     
     def _get_obs(self):
 
+        if self.obs_mode == "raster":
+            return torch.from_numpy(self.rasterizer.draw(self)).float().unsqueeze(0)
+
         screen_array = pygame.surfarray.pixels3d(self.screen)
 
         screen_array = np.transpose(screen_array, (1, 0, 2))
@@ -316,7 +367,9 @@ class ZombieShooter():
                 
                 self.clock.tick(10) # slow down and prevent busy waiting
 
-    def step(self, action, repeat=4):
+    def step(self, action, repeat=4, observe=True):
+        # observe=False skips the rgb-mode render and the observation (returned as None); neither changes
+        # the game state, so a replay can fast-forward through steps nobody looks at.
         total_reward = 0
 
         for i in range(repeat):
@@ -327,10 +380,23 @@ class ZombieShooter():
             if action == 5 or action == 6:
                 action = 0
 
+            # A human watching needs every frame, the agent only sees the last one.
+            if self.human:
+                self.render()
+
             if done:
                 break
 
-        return self._get_obs(), total_reward, done, truncated, self._get_info()
+        if not observe:
+            return None, total_reward, done, truncated, self._get_info()
+
+        if not self.human and self.obs_mode == "screen":
+            self.render()
+
+        with profiler.scope("env/get_obs"):
+            observation = self._get_obs()
+
+        return observation, total_reward, done, truncated, self._get_info()
 
 
     def _step(self, action):
@@ -365,114 +431,94 @@ class ZombieShooter():
 
         player_moved = False
 
-        if len(self.zombies) < self.max_zombie_count and random.randint(1, 100) < 3:
-            self.zombies.append(Zombie(world_height=self.world_height, world_width=self.world_width, size=80, speed=random.randint(1, self.zombie_top_speed)))
+        with profiler.scope("env/spawn"):
+            if len(self.zombies) < self.max_zombie_count and self.rng.randint(1, 100) < 3:
+                self.zombies.spawn(speed=self.rng.randint(1, self.zombie_top_speed), navigation=self.zombie_navigation, rng=self.rng)
         
 
-        new_player_x = self.player.x
+        with profiler.scope("env/player_movement"):
+            new_player_x = self.player.x
 
-        if left: # Left
-            new_player_x -= self.player.speed
-            self.player.direction = "left"
-        if right: # Right
-            new_player_x += self.player.speed
-            self.player.direction = "right"
+            if left: # Left
+                new_player_x -= self.player.speed
+                self.player.direction = "left"
+            if right: # Right
+                new_player_x += self.player.speed
+                self.player.direction = "right"
 
-        new_player_rect = pygame.Rect(new_player_x, self.player.y, self.player.size, self.player.size)
+            new_player_rect = pygame.Rect(new_player_x, self.player.y, self.player.size, self.player.size)
 
-        collision = check_collision(new_player_rect, self.walls)
+            collision = self.wall_index.any_hit(new_player_rect)
 
-        if not collision \
-            and self.player.x != new_player_x \
-            and (0 <= new_player_x <= self.world_width - self.player.size):
+            if not collision \
+                and self.player.x != new_player_x \
+                and (0 <= new_player_x <= self.world_width - self.player.size):
 
-            self.player.x = new_player_x
+                self.player.x = new_player_x
 
-            self.play_walking_sound()
+                self.play_walking_sound()
 
-        new_player_y = self.player.y
+            new_player_y = self.player.y
 
-        if up: # Up
-            new_player_y -= self.player.speed
-            self.player.direction = "up"
-        if down: # Down
-            new_player_y += self.player.speed
-            self.player.direction = "down"
+            if up: # Up
+                new_player_y -= self.player.speed
+                self.player.direction = "up"
+            if down: # Down
+                new_player_y += self.player.speed
+                self.player.direction = "down"
         
-        new_player_rect = pygame.Rect(self.player.x, new_player_y, self.player.size, self.player.size)
+            new_player_rect = pygame.Rect(self.player.x, new_player_y, self.player.size, self.player.size)
 
-        collision = check_collision(new_player_rect, self.walls)
+            collision = self.wall_index.any_hit(new_player_rect)
 
-        if not collision \
-           and self.player.y != new_player_y \
-           and (0 <= new_player_y <= self.world_height - self.player.size):
-            self.player.y = new_player_y
-            self.play_walking_sound() 
+            if not collision \
+               and self.player.y != new_player_y \
+               and (0 <= new_player_y <= self.world_height - self.player.size):
+                self.player.y = new_player_y
+                self.play_walking_sound() 
         
-        self.player.rect = pygame.Rect(self.player.x, self.player.y, self.player.size, self.player.size)
+            self.player.rect = pygame.Rect(self.player.x, self.player.y, self.player.size, self.player.size)
 
-        collision = False
+        with profiler.scope("env/bullet_collisions"):
+            zombie_boxes = self.zombies.boxes()
+            killed = self.bullets.hit(zombie_boxes) >= 0
 
-        camera_x = self.player.x - self.window_width // 2
-        camera_y = self.player.y - self.window_height // 2
-
-        camera_x = max(0, min(camera_x, self.world_width - self.window_width))
-        camera_y = max(0, min(camera_y, self.world_height - self.window_height))
-
-        self.zombies_temp = []
-
-        for zombie in self.zombies:
-            if check_collision(zombie.rect, self.bullets):
-                bullet = get_collision(zombie.rect, self.bullets)
+            # Zombie i's rect is zombie_boxes[i], so walking killed zombies in order keeps drop rolls in order.
+            for x, y, _, _ in zombie_boxes[killed]:
                 self.player.score += 1
                 reward += 1
-                self.bullets.remove(bullet)
 
                 if self.sound:
                     self.zombie_hit.play()
 
-                if random.randint(1, 100) <= 20:
-                    self.health_drop = HealthDrop(zombie.rect.x, zombie.rect.y)
+                if self.rng.randint(1, 100) <= 20:
+                    self.health_drop = HealthDrop(x, y)
 
-            
-            elif check_collision(zombie.rect, [self.player.rect]):
+            player_rect = self.player.rect
+            zx, zy = zombie_boxes[:, 0], zombie_boxes[:, 1]
+            bitten = ~killed & (zx < player_rect.right) & (player_rect.x < zx + self.zombies.size) \
+                & (zy < player_rect.bottom) & (player_rect.y < zy + self.zombies.size)
+
+            for _ in range(int(bitten.sum())):
                 self.player.health -= 1
                 reward -= 1
                 if self.sound:
                     self.zombie_bite.play()
-            else:
-                self.zombies_temp.append(zombie)
-            
-        self.zombies = self.zombies_temp
-
-        for zombie in self.zombies:
-            zombie.move_toward_player(self.player.x, self.player.y, self.walls)
-
-        self.fill_background()
-
-        for bullet in self.bullets:
-            bullet.move()
-            bullet.draw(self.screen, camera_x, camera_y)
-
-            if check_collision(bullet.rect, self.walls):
-                self.bullets.remove(bullet) 
 
-        self.player.draw(self.screen, camera_x, camera_y)
+            self.zombies.remove(killed | bitten)
 
-        for zombie in self.zombies:
-            zombie.draw(self.screen, camera_x, camera_y)
+        with profiler.scope("env/zombie_steering"):
+            if self.zombie_navigation:
+                # Aim the field at the zombie-sized box centred on the player.
+                offset = (self.player.size - self.zombies.size) // 2
+                self.zombie_navigation.update(self.player.x + offset, self.player.y + offset)
 
-        if self.health_drop:
-            self.health_drop.draw(self.screen, camera_x, camera_y) 
+            self.zombies.move_toward_player(self.player.x, self.player.y, self.wall_index.boxes, navigation=self.zombie_navigation)
 
-        pygame.draw.rect(self.screen, self.border_color, (0 - camera_x, 0 - camera_y, self.world_width, self.world_height), 5)
+        with profiler.scope("env/bullet_move"):
+            self.bullets.move()
+            self.bullets.cull(self.wall_index.boxes)
 
-        for wall in self.walls:
-            pygame.draw.rect(self.screen, self.wall_color, (wall.x - camera_x, wall.y - camera_y, wall.width, wall.height))
-
-        if self.treasure_chest:
-            self.treasure_chest.draw(self.screen, camera_x, camera_y)
-        
         if self.treasure_chest and self.player.rect.colliderect(self.treasure_chest):
             if not self.treasure_chest.is_opened:
                 self.treasure_chest.is_opened = True
@@ -486,18 +532,56 @@ class ZombieShooter():
             #print("Heart collected!")
             self.health_drop = None
 
-
-        pygame.display.flip() # Updates the display
-
         if self.player.health <= 0:
             self.game_over()
 
-        if self.human:
-            self.clock.tick(self.fps)
-        else:
-            self.clock.tick()
-
         if(self.level_goal <= self.player.score):
             self.start_next_level()
 
-        return reward, self.done, truncated
\ No newline at end of file
+        return reward, self.done, truncated
+
+    def get_camera(self):
+
+        camera_x = self.player.x - self.window_width // 2
+        camera_y = self.player.y - self.window_height // 2
+
+        camera_x = max(0, min(camera_x, self.world_width - self.window_width))
+        camera_y = max(0, min(camera_y, self.world_height - self.window_height))
+
+        return camera_x, camera_y
+
+    def render(self):
+
+        camera_x, camera_y = self.get_camera()
+
+        with profiler.scope("render/fill_background"):
+            self.fill_background()
+
+        with profiler.scope("render/blit"):
+            self.bullets.draw(self.screen, camera_x, camera_y)
+
+            self.player.draw(self.screen, camera_x, camera_y)
+
+            self.zombies.draw(self.screen, camera_x, camera_y)
+
+            if self.health_drop:
+                self.health_drop.draw(self.screen, camera_x, camera_y) 
+
+            pygame.draw.rect(self.screen, self.border_color, (0 - camera_x, 0 - camera_y, self.world_width, self.world_height), 5)
+
+            for wall in self.walls:
+                pygame.draw.rect(self.screen, self.wall_color, (wall.x - camera_x, wall.y - camera_y, wall.width, wall.height))
+
+            if self.treasure_chest:
+                self.treasure_chest.draw(self.screen, camera_x, camera_y)
+
+        if self.announcement_frames > 0:
+            announcement_rect = self.announcement.get_rect(center=(self.window_width // 2, self.window_height // 2))
+            self.screen.blit(self.announcement, announcement_rect)
+            self.announcement_frames -= 1
+
+        # The rgb mode only reads the surface back in _get_obs, so there is nothing to present.
+        if self.human:
+            with profiler.scope("render/flip"):
+                pygame.display.flip() # Updates the display
+                self.clock.tick(self.fps)
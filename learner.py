@@ -0,0 +1,89 @@
+import time
+import threading
+
+# Runs Agent.learn on a background thread while the main thread steps the environment. Updates are
+# held at replay_ratio per env step (counted once the buffer can be sampled): the learner waits when it
+# is ahead, and the env waits when the learner falls more than max_lag updates behind. Both waits are
+# timed, so the idle time of each side can be logged.
+
+
+class BackgroundLearner():
+
+    def __init__(self, agent, batch_size, metrics, replay_ratio=1.0, max_lag=16):
+        self.agent = agent
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.replay_ratio = replay_ratio
+        self.max_lag = max_lag
+
+        self.condition = threading.Condition()
+        self.running = True
+        self.error = None
+
+        self.env_steps = 0
+        self.updates = 0
+
+        self.learner_idle = 0.0
+        self.env_idle = 0.0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def step_done(self, steps=1):
+        # Called by the env thread after every env.step with the number of transitions it stored.
+        with self.condition:
+            if self.error:
+                raise self.error
+
+            if self.agent.memory.can_sample(self.batch_size):
+                self.env_steps += steps
+                self.condition.notify_all()
+
+            start = time.perf_counter()
+            while self.running and self.updates < self.replay_ratio * self.env_steps - self.max_lag:
+                self.condition.wait()
+            self.env_idle += time.perf_counter() - start
+
+    def run(self):
+        while True:
+            with self.condition:
+                start = time.perf_counter()
+                while self.running and self.updates >= self.replay_ratio * self.env_steps:
+                    self.condition.wait()
+                self.learner_idle += time.perf_counter() - start
+
+                if not self.running:
+                    return
+
+            try:
+                self.agent.learn(self.batch_size, self.metrics, self.env_steps, update_target=self.updates % 4 == 0)
+            except Exception as error:
+                # Surfaces in the env thread on its next step_done instead of leaving it waiting.
+                with self.condition:
+                    self.error = error
+                    self.running = False
+                    self.condition.notify_all()
+                return
+
+            with self.condition:
+                self.updates += 1
+                self.condition.notify_all()
+
+    def achieved_ratio(self):
+        return self.updates / max(self.env_steps, 1)
+
+    def log(self, metrics, step):
+        metrics.scalar('Learner/Replay_ratio', self.achieved_ratio(), step)
+        metrics.scalar('Learner/Learner_idle_sec', self.learner_idle, step)
+        metrics.scalar('Learner/Env_idle_sec', self.env_idle, step)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+        self.thread.join()
+
+        # An update that failed after the env thread's last step_done would otherwise go unnoticed.
+        if self.error:
+            raise self.error
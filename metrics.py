@@ -0,0 +1,146 @@
+import time
+import queue
+import threading
+import numpy as np
+import torch
+
+# Training metrics without per-step syncs or writes. Values go into fixed-size ring buffers: host
+# numbers into numpy arrays, tensors into a tensor on their own device (no .item()). Every flush_every
+# env steps the rings are drained and a background thread reduces each one to mean / min / max / p95
+# and writes them to the SummaryWriter, along with env steps/s, updates/s and the replay fill level.
+# Episode prints and checkpoint saves can be handed to the same thread with run().
+
+
+class MetricRing():
+
+    # The last capacity values of one series.
+
+    def __init__(self, capacity, like):
+        if torch.is_tensor(like):
+            self.values = torch.zeros(capacity, dtype=torch.float32, device=like.device)
+        else:
+            self.values = np.zeros(capacity, dtype=np.float32)
+
+        self.count = 0
+
+    def append(self, value):
+        if torch.is_tensor(value):
+            value = value.detach()
+
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    def drain(self):
+        # A copy of the filled part; tensor copies are queued on the device, not waited for.
+        n = min(self.count, len(self.values))
+        values = self.values[:n].clone() if torch.is_tensor(self.values) else self.values[:n].copy()
+        self.count = 0
+        return values
+
+
+def summarize(values):
+    if torch.is_tensor(values):
+        values = values.cpu().numpy()
+
+    return {"mean": values.mean(), "min": values.min(), "max": values.max(), "p95": np.percentile(values, 95)}
+
+
+class MetricsLogger():
+
+    def __init__(self, writer, memory=None, flush_every=1000, capacity=4096):
+        self.writer = writer
+        self.memory = memory
+        self.flush_every = flush_every
+        self.capacity = capacity
+
+        self.lock = threading.Lock()
+        self.series = {}
+        self.counters = {"Env_steps": 0, "Updates": 0}
+
+        self.last_flush_step = 0
+        self.last_flush_time = time.perf_counter()
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run_worker, daemon=True)
+        self.thread.start()
+
+    def add(self, name, value):
+        # value: a number or a scalar tensor, which stays on its device until the flush.
+        with self.lock:
+            if name not in self.series:
+                self.series[name] = MetricRing(self.capacity, value)
+
+            self.series[name].append(value)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def scalar(self, name, value, step):
+        # One value written as is, e.g. an episode score.
+        self.queue.put(("scalar", name, value, step))
+
+    def run(self, fn, *args):
+        # Runs fn(*args) on the writer thread, after everything queued before it.
+        self.queue.put(("call", fn, args))
+
+    def step(self, total_steps, steps=1):
+        # Called by the env loop after every env step with the number of transitions it added.
+        self.count("Env_steps", steps)
+
+        if total_steps - self.last_flush_step >= self.flush_every:
+            self.flush(total_steps)
+
+    def flush(self, total_steps):
+        now = time.perf_counter()
+        elapsed = max(now - self.last_flush_time, 1e-9)
+
+        with self.lock:
+            series = {name: ring.drain() for name, ring in self.series.items() if ring.count}
+            rates = {name: value / elapsed for name, value in self.counters.items()}
+            self.counters = {name: 0 for name in self.counters}
+
+        if self.memory is not None:
+            fill = min(self.memory.mem_ctr, self.memory.mem_size) / self.memory.mem_size
+            self.scalar("Replay/Fill", fill, total_steps)
+
+        self.queue.put(("summary", series, rates, total_steps))
+
+        self.last_flush_step = total_steps
+        self.last_flush_time = now
+
+    def run_worker(self):
+        while True:
+            item = self.queue.get()
+
+            try:
+                if item is None:
+                    return
+                elif item[0] == "scalar":
+                    _, name, value, step = item
+                    self.writer.add_scalar(name, value, step)
+                elif item[0] == "call":
+                    _, fn, args = item
+                    fn(*args)
+                else:
+                    _, series, rates, step = item
+
+                    for name, values in series.items():
+                        for stat, value in summarize(values).items():
+                            self.writer.add_scalar(f"{name}/{stat}", value, step)
+
+                    for name, rate in rates.items():
+                        self.writer.add_scalar(f"Throughput/{name}_per_sec", rate, step)
+            except Exception as error:
+                print(f"Metrics thread error: {error!r}")
+            finally:
+                self.queue.task_done()
+
+    def close(self, total_steps=None):
+        # Writes out what is left and waits for the writer thread.
+        if total_steps is not None:
+            self.flush(total_steps)
+
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.flush()
@@ -13,7 +13,7 @@ class ZombieNet(nn.Module):
         super(ZombieNet, self).__init__()
 
         # Convolutional Layers 
-        self.conv1 = nn.Conv2d(in_channels=1, out_channels=8, kernel_size=4, stride=2)
+        self.conv1 = nn.Conv2d(in_channels=observation_shape[0], out_channels=8, kernel_size=4, stride=2)
         self.conv2 = nn.Conv2d(in_channels=8, out_channels=16, kernel_size=4, stride=2)
         self.conv3 = nn.Conv2d(in_channels=16, out_channels=32, kernel_size=3, stride=2)
         self.conv4 = nn.Conv2d(in_channels=32, out_channels=64, kernel_size=3, stride=2)
@@ -67,12 +67,12 @@ class ZombieNet(nn.Module):
         x = F.relu(self.fc1(x))
 
         if self.dropout > 0:
-            x = F.dropout(x, p=self.dropout)
+            x = F.dropout(x, p=self.dropout, training=self.training)
         
         x = F.relu(self.fc2(x))
         
         if self.dropout > 0:
-            x = F.dropout(x, p=self.dropout)
+            x = F.dropout(x, p=self.dropout, training=self.training)
 
         x = F.relu(self.fc3(x))
 
@@ -91,11 +91,172 @@ class ZombieNet(nn.Module):
             print(f"No weights file found at {filename}")
 
 
+class StackedLinear(nn.Module):
+    # heads independent Linear layers applied to (heads, batch, in_features) with one batched matmul.
+    # The weights are stored (heads, in_features, out_features), nn.Linear's transpose, so neither
+    # pass has to make a transposed copy of them.
+    def __init__(self, heads, in_features, out_features):
+        super(StackedLinear, self).__init__()
+
+        self.weight = nn.Parameter(torch.empty(heads, in_features, out_features))
+        self.bias = nn.Parameter(torch.zeros(heads, 1, out_features))
+
+        for weight in self.weight:
+            nn.init.xavier_normal_(weight)
+
+    def forward(self, x):
+        return torch.baddbmm(self.bias, x, self.weight)
+
+
+class TwinZombieNet(nn.Module):
+    # Two ZombieNets evaluated in one call, so forward(x) returns (2, batch, action_dim). Both heads
+    # read the same input, so conv1 is one convolution with both heads' filters; the later
+    # convolutions are grouped (one group per head) and the fully connected layers are stacked.
+    heads = 2
+
+    # fast=True stores the convolutions channels_last and folds the input's / 255 into conv1's weights
+    # (scaling 16 filters per call instead of every input pixel). The parameters and checkpoints are the same.
+    def __init__(self, action_dim, hidden_dim=1024, dropout = 0, observation_shape=None, fast=False):
+        super(TwinZombieNet, self).__init__()
+
+        self.fast = fast
+
+        in_channels = observation_shape[0]
+        heads = self.heads
+
+        self.conv1 = nn.Conv2d(in_channels=in_channels, out_channels=heads * 8, kernel_size=4, stride=2)
+        self.conv2 = nn.Conv2d(in_channels=heads * 8, out_channels=heads * 16, kernel_size=4, stride=2, groups=heads)
+        self.conv3 = nn.Conv2d(in_channels=heads * 16, out_channels=heads * 32, kernel_size=3, stride=2, groups=heads)
+        self.conv4 = nn.Conv2d(in_channels=heads * 32, out_channels=heads * 64, kernel_size=3, stride=2, groups=heads)
+
+        self.pool = nn.MaxPool2d(kernel_size=2, stride=2)
+
+        for conv in (self.conv1, self.conv2, self.conv3, self.conv4):
+            nn.init.kaiming_normal_(conv.weight, nonlinearity='relu')
+            nn.init.constant_(conv.bias, 0)
+
+        conv_output_size = self.features(torch.zeros(1, *observation_shape)).shape[-1]
+
+        self.fc1 = StackedLinear(heads, conv_output_size, hidden_dim)
+        self.fc2 = StackedLinear(heads, hidden_dim, hidden_dim)
+        self.fc3 = StackedLinear(heads, hidden_dim, hidden_dim)
+        self.output = StackedLinear(heads, hidden_dim, action_dim)
+
+        self.dropout = dropout
+
+        if fast:
+            self.to(memory_format=torch.channels_last)
+
+    def features(self, x):
+        # (heads, batch, conv_output_size)
+        if self.fast:
+            x = x.contiguous(memory_format=torch.channels_last)
+            x = F.conv2d(x, self.conv1.weight / 255, self.conv1.bias, stride=self.conv1.stride)
+        else:
+            x = self.conv1(x)
+
+        x = self.pool(F.relu(x))
+        x = F.relu(self.conv2(x))
+        x = self.pool(F.relu(self.conv3(x)))
+        x = F.relu(self.conv4(x))
+
+        return x.reshape(x.size(0), self.heads, -1).transpose(0, 1)
+
+    def forward(self, x):
+        if not self.fast:
+            x = x / 255
+
+        x = F.relu(self.fc1(self.features(x)))
+
+        if self.dropout > 0:
+            x = F.dropout(x, p=self.dropout, training=self.training)
+
+        x = F.relu(self.fc2(x))
+
+        if self.dropout > 0:
+            x = F.dropout(x, p=self.dropout, training=self.training)
+
+        x = F.relu(self.fc3(x))
+
+        return self.output(x)
+
+    def head_state_dict(self, head):
+        # The weights of one head as a ZombieNet state dict.
+        state = {}
+
+        for name, param in self.state_dict().items():
+            layer, kind = name.split(".")
+
+            if layer.startswith("conv"):
+                size = param.shape[0] // self.heads
+                state[name] = param[head * size:(head + 1) * size].clone()
+            else:
+                state[name] = param[head].T.contiguous() if kind == "weight" else param[head, 0].clone()
+
+        return state
+
+    def load_head_state_dict(self, head, state):
+        params = self.state_dict()
+
+        with torch.no_grad():
+            for name, value in state.items():
+                layer, kind = name.split(".")
+
+                if layer.startswith("conv"):
+                    size = value.shape[0]
+                    params[name][head * size:(head + 1) * size] = value
+                else:
+                    params[name][head] = value.T if kind == "weight" else value.unsqueeze(0)
+
+    def save_the_model(self, filenames=('models/dqn1.pt', 'models/dqn2.pt')):
+        # One ZombieNet checkpoint per head, so test.py can load them as before.
+        for head, filename in enumerate(filenames):
+            torch.save(self.head_state_dict(head), filename)
+
+    def load_the_model(self, filenames=('models/dqn1.pt', 'models/dqn2.pt')):
+        try:
+            for head, filename in enumerate(filenames):
+                self.load_head_state_dict(head, torch.load(filename))
+            print(f"Loaded weights from filenames {filenames}")
+        except FileNotFoundError:
+            print(f"No weights file found at {filenames}")
+
+
+# Fused Polyak / copy updates: one foreach kernel per parameter list instead of a Python loop.
+
 def soft_update(target, source, tau=0.005):
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.data.copy_(target_param.data * (1.0 - tau) + param.data * tau)
+    with torch.no_grad():
+        torch._foreach_lerp_(list(target.parameters()), list(source.parameters()), tau)
 
 def hard_update(target, source):
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.data.copy_(param.data)
+    with torch.no_grad():
+        torch._foreach_copy_(list(target.parameters()), list(source.parameters()))
+
+
+def bf16_supported(device):
+    # Whether bf16 autocast runs natively here (on CPU: oneDNN with AVX512-BF16 or AMX).
+    if device.startswith('cuda'):
+        return torch.cuda.is_bf16_supported()
+
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def compile_model(model, example, autocast):
+    # torch.compile(model), or model itself when compiling does not work here. Compilation only happens on
+    # the first call, so the compiled model runs one forward and backward on example before it is trusted.
+    try:
+        compiled = torch.compile(model)
+
+        with autocast():
+            compiled(example).float().sum().backward()
+
+        model.zero_grad()
+        return compiled
+    except Exception as error:
+        model.zero_grad()
+        print(f"torch.compile unavailable, training eagerly: {error!r}")
+        return model
 
@@ -0,0 +1,159 @@
+import random
+import numpy as np
+
+# Flow-field navigation for a level. The walls are rasterized once into a configuration-space
+# grid (cell (i, j) is free when an agent whose top-left corner sits at (j, i) * cell_size
+# touches no wall), which every env in the process shares. Each env keeps its own FlowField over
+# it: a BFS distance field toward the player's cell, shared by all of that env's zombies and
+# recomputed only when its player moves to another cell, so steering a zombie is one array lookup.
+
+# Neighbour offsets (row, col); diagonals are only taken when both orthogonal cells are free.
+NEIGHBOURS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+class NavigationGrid():
+
+    def __init__(self, walls, world_width, world_height, agent_size, cell_size=20):
+        self.agent_size = agent_size
+        self.cell_size = cell_size
+
+        self.cols = (world_width - agent_size) // cell_size + 1
+        self.rows = (world_height - agent_size) // cell_size + 1
+
+        xs = np.arange(self.cols) * cell_size
+        ys = np.arange(self.rows) * cell_size
+
+        blocked = np.zeros((self.rows, self.cols), dtype=bool)
+
+        for wall in walls:
+            blocked |= (ys[:, None] < wall.bottom) & (wall.y < ys[:, None] + agent_size) \
+                & (xs[None, :] < wall.right) & (wall.x < xs[None, :] + agent_size)
+
+        self.free = ~blocked
+
+        # Free spawn positions along the top, bottom, left and right edges.
+        self.edge_positions = [
+            [(x, 0) for x in xs[self.free[0]]],
+            [(x, world_height - agent_size) for x in xs[self.free[-1]]],
+            [(0, y) for y in ys[self.free[:, 0]]],
+            [(world_width - agent_size, y) for y in ys[self.free[:, -1]]]
+        ]
+
+        free_rows, free_cols = np.nonzero(self.free)
+        self.free_positions = np.stack([free_cols * cell_size, free_rows * cell_size], axis=1)
+
+    def cell_of(self, x, y):
+        col = np.clip(np.rint(np.asarray(x) / self.cell_size).astype(np.int64), 0, self.cols - 1)
+        row = np.clip(np.rint(np.asarray(y) / self.cell_size).astype(np.int64), 0, self.rows - 1)
+        return row, col
+
+    def sample_edge_position(self, rng=random):
+        # Like Zombie.spawn: pick an edge, then a free spot along it.
+        edges = [positions for positions in self.edge_positions if positions]
+        x, y = rng.choice(rng.choice(edges))
+        return int(x), int(y)
+
+    def nearest_free_position(self, x, y):
+        distance = np.abs(self.free_positions[:, 0] - x) + np.abs(self.free_positions[:, 1] - y)
+        x, y = self.free_positions[np.argmin(distance)]
+        return int(x), int(y)
+
+
+class FlowField():
+
+    # The per-env, per-target part of navigation over a shared NavigationGrid.
+
+    def __init__(self, grid):
+        self.grid = grid
+
+        self.target = None
+        self.distance = np.full((grid.rows, grid.cols), np.inf)
+        self.flow_x = np.zeros((grid.rows, grid.cols))
+        self.flow_y = np.zeros((grid.rows, grid.cols))
+
+    def update(self, x, y):
+        # x, y: top-left of an agent-sized box centred on the target.
+        row, col = self.grid.cell_of(x, y)
+        target = (int(row), int(col))
+
+        if target != self.target:
+            self.target = target
+            self.flood(target)
+
+    def flood(self, target):
+        # BFS as a wavefront: every pass grows the frontier by one 4-connected step at once.
+        rows, cols = self.grid.rows, self.grid.cols
+
+        distance = np.full((rows, cols), np.inf)
+        distance[target] = 0
+
+        free = self.grid.free
+        frontier = np.zeros_like(free)
+        frontier[target] = True
+        visited = frontier.copy()
+
+        step = 0
+        while frontier.any():
+            step += 1
+
+            grown = np.zeros_like(frontier)
+            grown[1:] |= frontier[:-1]
+            grown[:-1] |= frontier[1:]
+            grown[:, 1:] |= frontier[:, :-1]
+            grown[:, :-1] |= frontier[:, 1:]
+            grown &= free & ~visited
+
+            distance[grown] = step
+            visited |= grown
+            frontier = grown
+
+        self.distance = distance
+
+        # Each cell points at its lowest-distance neighbour.
+        padded = np.pad(distance, 1, constant_values=np.inf)
+        padded_free = np.pad(free, 1, constant_values=False)
+
+        best = distance.copy()
+        flow_x = np.zeros((rows, cols))
+        flow_y = np.zeros((rows, cols))
+
+        for dr, dc in NEIGHBOURS:
+            neighbour = padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+
+            if dr and dc:
+                passable = padded_free[1 + dr:1 + dr + rows, 1:1 + cols] & padded_free[1:1 + rows, 1 + dc:1 + dc + cols]
+                neighbour = np.where(passable, neighbour, np.inf)
+
+            better = neighbour < best
+            best = np.where(better, neighbour, best)
+            flow_x = np.where(better, dc / np.hypot(dr, dc), flow_x)
+            flow_y = np.where(better, dr / np.hypot(dr, dc), flow_y)
+
+        self.flow_x = flow_x
+        self.flow_y = flow_y
+
+    def flow(self, x, y):
+        # Unit step directions for agents at (x, y), and whether the field covers them. Agents in
+        # the target cell, or in cells the field cannot reach, should head straight for the player.
+        row, col = self.grid.cell_of(x, y)
+        distance = self.distance[row, col]
+        has_flow = (distance > 0) & (distance < np.inf)
+
+        return self.flow_x[row, col], self.flow_y[row, col], has_flow
+
+    def sample_edge_position(self, rng=random):
+        return self.grid.sample_edge_position(rng)
+
+
+_grids = {}
+
+
+def navigation_grid(walls, world_width, world_height, agent_size, cell_size=20):
+    # One grid per wall list and agent size, built the first time a level asks for it. Only the static
+    # grid is cached; wrap it in a FlowField per env to steer towards a target.
+    key = (id(walls), world_width, world_height, agent_size, cell_size)
+
+    if key not in _grids:
+        _grids[key] = (walls, NavigationGrid(walls, world_width, world_height, agent_size, cell_size))
+
+    return _grids[key][1]
@@ -0,0 +1,135 @@
+import os
+import math
+import json
+import threading
+import time
+from collections import defaultdict
+
+# Named timing scopes for the env and training hot paths:
+#
+#     with profiler.scope("env/spawn"):
+#         ...
+#
+# Off by default, when scope() hands back one shared no-op context manager. Once enabled, every scope
+# adds its duration to a log-scale histogram (8 buckets per doubling) and, up to max_events, keeps the
+# event itself for a Chrome trace (chrome://tracing or ui.perfetto.dev).
+
+BUCKETS_PER_OCTAVE = 8
+
+
+class NullScope():
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SCOPE = NullScope()
+
+
+class Scope():
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns() - self.start)
+        return False
+
+
+class ScopeStats():
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0
+        self.min = math.inf
+        self.max = 0
+        self.histogram = defaultdict(int)
+
+    def add(self, duration):
+        self.calls += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        self.histogram[int(math.log2(max(duration, 1)) * BUCKETS_PER_OCTAVE)] += 1
+
+    def percentile(self, q):
+        # Upper edge of the bucket holding the q-th percentile, clamped to the observed range.
+        target = q / 100 * self.calls
+        seen = 0
+
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= target:
+                return min(max(2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE), self.min), self.max)
+
+        return self.max
+
+
+class Profiler():
+
+    def __init__(self, max_events=200000):
+        self.enabled = False
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stats = defaultdict(ScopeStats)
+        self.events = []
+        self.start = time.perf_counter_ns()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+        if enabled:
+            self.reset()
+
+    def scope(self, name):
+        if not self.enabled:
+            return NULL_SCOPE
+
+        return Scope(self, name)
+
+    def record(self, name, start, duration):
+        with self.lock:
+            self.stats[name].add(duration)
+
+            if len(self.events) < self.max_events:
+                self.events.append((name, start, duration, threading.get_ident()))
+
+    def summary(self):
+        # One row per scope, slowest total first. Nested scopes also count towards their parents, so the
+        # shares of a scope and its children overlap.
+        wall = max(time.perf_counter_ns() - self.start, 1)
+
+        lines = [f"{'scope':<28}{'calls':>10}{'total ms':>12}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}{'max us':>10}{'share':>8}"]
+
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].total):
+            lines.append(f"{name:<28}{stats.calls:>10}{stats.total / 1e6:>12.1f}{stats.total / stats.calls / 1e3:>10.1f}"
+                         f"{stats.percentile(50) / 1e3:>10.1f}{stats.percentile(95) / 1e3:>10.1f}"
+                         f"{stats.max / 1e3:>10.1f}{stats.total / wall:>8.1%}")
+
+        return "\n".join(lines)
+
+    def dump_trace(self, filename):
+        # Complete ("X") events in microseconds, one track per thread.
+        pid = os.getpid()
+
+        with self.lock:
+            events = [{"name": name, "ph": "X", "ts": (start - self.start) / 1e3, "dur": duration / 1e3,
+                       "pid": pid, "tid": tid} for name, start, duration, tid in self.events]
+
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# The one profiler every module times into.
+profiler = Profiler()
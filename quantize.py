@@ -0,0 +1,164 @@
+import copy
+import time
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.ao.quantization import QuantStub, DeQuantStub, fuse_modules, get_default_qconfig, prepare, convert, quantize_dynamic
+from model import ZombieNet
+
+# Int8 export of the twin-Q networks for action selection. Each head becomes a ZombieNet whose convolutions
+# are statically quantized (activation ranges calibrated on replay states) and whose Linear layers are
+# dynamically quantized. The input's / 255 is folded into conv1, so the raw 0-255 pixels are what gets
+# quantized, which an 8-bit scale represents exactly.
+
+
+class QuantizableZombieNet(nn.Module):
+
+    # An eval-only copy of a ZombieNet with module ReLUs (so conv + ReLU can be fused) and quant / dequant
+    # stubs around the convolutions.
+
+    def __init__(self, net):
+        super(QuantizableZombieNet, self).__init__()
+
+        self.quant = QuantStub()
+        self.dequant = DeQuantStub()
+
+        self.conv1 = copy.deepcopy(net.conv1)
+        self.conv2 = copy.deepcopy(net.conv2)
+        self.conv3 = copy.deepcopy(net.conv3)
+        self.conv4 = copy.deepcopy(net.conv4)
+
+        with torch.no_grad():
+            self.conv1.weight /= 255
+
+        self.relu1 = nn.ReLU()
+        self.relu2 = nn.ReLU()
+        self.relu3 = nn.ReLU()
+        self.relu4 = nn.ReLU()
+
+        self.pool = nn.MaxPool2d(kernel_size=2, stride=2)
+
+        self.fc1 = copy.deepcopy(net.fc1)
+        self.fc2 = copy.deepcopy(net.fc2)
+        self.fc3 = copy.deepcopy(net.fc3)
+        self.output = copy.deepcopy(net.output)
+
+    def forward(self, x):
+        x = self.quant(x)
+
+        x = self.pool(self.relu1(self.conv1(x)))
+        x = self.relu2(self.conv2(x))
+        x = self.pool(self.relu3(self.conv3(x)))
+        x = self.relu4(self.conv4(x))
+
+        x = self.dequant(x)
+        x = x.reshape(x.size(0), -1)
+
+        x = F.relu(self.fc1(x))
+        x = F.relu(self.fc2(x))
+        x = F.relu(self.fc3(x))
+
+        return self.output(x)
+
+
+class TwinQ(nn.Module):
+
+    # Two single-head networks behind TwinZombieNet's interface: forward returns (2, batch, action_dim).
+
+    def __init__(self, net_1, net_2):
+        super(TwinQ, self).__init__()
+
+        self.net_1 = net_1
+        self.net_2 = net_2
+
+    def forward(self, x):
+        return torch.stack([self.net_1(x), self.net_2(x)])
+
+
+def head_networks(model, model_kwargs):
+    # The heads of a TwinZombieNet as two float ZombieNets in eval mode.
+    kwargs = {name: value for name, value in model_kwargs.items() if name != "fast"}
+    nets = []
+
+    for head in range(model.heads):
+        net = ZombieNet(**kwargs)
+        net.load_state_dict(model.head_state_dict(head))
+        nets.append(net.cpu().eval())
+
+    return nets
+
+
+def calibration_states(memory, count=512):
+    # count states drawn from the replay buffer, on the CPU, without disturbing its sampling.
+    return memory.sample_states(count)
+
+
+def quantize_net(net, states, batch_size=64):
+    model = QuantizableZombieNet(net).eval()
+
+    fuse_modules(model, [["conv1", "relu1"], ["conv2", "relu2"], ["conv3", "relu3"], ["conv4", "relu4"]], inplace=True)
+
+    # Static quantization for the convolutions only; the Linear layers are quantized dynamically below.
+    model.qconfig = None
+    qconfig = get_default_qconfig(torch.backends.quantized.engine)
+    for name in ("quant", "conv1", "conv2", "conv3", "conv4", "dequant"):
+        getattr(model, name).qconfig = qconfig
+
+    prepare(model, inplace=True)
+
+    with torch.no_grad():
+        for batch in states.split(batch_size):
+            model(batch)
+
+    convert(model, inplace=True)
+
+    return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_twin(nets, states):
+    # An int8 TwinQ (CPU only) from the float heads, calibrated on states.
+    return TwinQ(*[quantize_net(net, states) for net in nets]).eval()
+
+
+def script_quantized(quantized, example):
+    # Traced and frozen TorchScript: drops the Python overhead of the quantized modules, which dominates
+    # a batch-1 forward pass, and saves without needing the class definitions here to load.
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(quantized, example))
+
+
+def export_quantized(scripted, filename='models/dqn_int8.pt'):
+    torch.jit.save(scripted, filename)
+
+
+def latency(model, states, iterations=200):
+    # Seconds per single-observation forward pass, as in action selection.
+    with torch.no_grad():
+        for state in states[:10]:
+            model(state.unsqueeze(0))
+
+        start = time.perf_counter()
+        for i in range(iterations):
+            model(states[i % len(states)].unsqueeze(0))
+
+    return (time.perf_counter() - start) / iterations
+
+
+def quantization_report(float_model, quantized, states):
+    # Batch-1 latency of both models and how often they pick the same greedy (twin-Q minimum) action.
+    float_model = copy.deepcopy(float_model).cpu().eval()
+
+    with torch.no_grad():
+        float_actions = float_model(states).min(dim=0).values.argmax(-1)
+        int8_actions = quantized(states).min(dim=0).values.argmax(-1)
+
+    float_time = latency(float_model, states)
+    int8_time = latency(quantized, states)
+
+    report = {"float_ms": float_time * 1000, "int8_ms": int8_time * 1000, "speedup": float_time / int8_time,
+              "agreement": (float_actions == int8_actions).float().mean().item()}
+
+    print(f"int8 twin-Q: {report['float_ms']:.3f} ms float32 -> {report['int8_ms']:.3f} ms int8 per action "
+          f"({report['speedup']:.2f}x), greedy action agreement {report['agreement']:.1%} on {len(states)} states")
+
+    return report
@@ -0,0 +1,115 @@
+import numpy as np
+import pygame
+from assets import load_sprite
+
+# Draws the camera viewport straight into a small grayscale buffer from entity state,
+# sampling every output pixel the same way cv2.resize(INTER_NEAREST) samples the full window.
+# The HUD text is not drawn.
+
+
+def to_gray(color):
+    r, g, b = color[:3]
+    return int(round(0.299 * r + 0.587 * g + 0.114 * b))
+
+
+class ObservationRasterizer():
+
+    def __init__(self, window_width, window_height, obs_size=128,
+                 background_color=(181, 101, 29), wall_color=(1, 50, 32),
+                 border_color=(255, 0, 0), bullet_color=(192, 192, 192)):
+
+        self.window_width = window_width
+        self.window_height = window_height
+        self.obs_size = obs_size
+
+        self.buffer = np.zeros((obs_size, obs_size), dtype=np.uint8)
+
+        # Window pixel that lands on each output column / row.
+        self.col_src = np.floor(np.arange(obs_size) * window_width / obs_size).astype(np.int64)
+        self.row_src = np.floor(np.arange(obs_size) * window_height / obs_size).astype(np.int64)
+
+        self.background = to_gray(background_color)
+        self.wall = to_gray(wall_color)
+        self.border = to_gray(border_color)
+        self.bullet = to_gray(bullet_color)
+
+        self.sprites = {}
+
+    def get_sprite(self, path, size):
+        key = (path, size)
+
+        if key not in self.sprites:
+            image = load_sprite(path, size)
+
+            rgb = pygame.surfarray.array3d(image).transpose(1, 0, 2).astype(np.float32)
+            gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+            alpha = pygame.surfarray.array_alpha(image).T.astype(np.float32) / 255
+
+            self.sprites[key] = (gray, alpha)
+
+        return self.sprites[key]
+
+    def span(self, src, start, length):
+        return np.searchsorted(src, start), np.searchsorted(src, start + length)
+
+    def fill_rect(self, x, y, width, height, value):
+        j0, j1 = self.span(self.col_src, int(x), int(width))
+        i0, i1 = self.span(self.row_src, int(y), int(height))
+
+        if j0 < j1 and i0 < i1:
+            self.buffer[i0:i1, j0:j1] = value
+
+    def blit(self, path, size, x, y):
+        x, y = int(x), int(y)
+
+        j0, j1 = self.span(self.col_src, x, size)
+        i0, i1 = self.span(self.row_src, y, size)
+
+        if j0 >= j1 or i0 >= i1:
+            return
+
+        gray, alpha = self.get_sprite(path, size)
+
+        rows = self.row_src[i0:i1, None] - y
+        cols = self.col_src[None, j0:j1] - x
+
+        a = alpha[rows, cols]
+        dst = self.buffer[i0:i1, j0:j1]
+        dst[:] = np.rint(a * gray[rows, cols] + (1 - a) * dst)
+
+    def draw(self, env):
+        camera_x, camera_y = env.get_camera()
+
+        self.buffer.fill(self.background)
+
+        size = env.bullets.bullet_size
+        for x, y in zip(*env.bullets.positions()):
+            self.fill_rect(x - camera_x, y - camera_y, size, size, self.bullet)
+
+        player = env.player
+        self.blit(f'images/player_{player.direction}.png', player.size, player.x - camera_x, player.y - camera_y)
+
+        size = env.zombies.size
+        for x, y, direction in env.zombies.entries():
+            self.blit(f'images/zombie_{direction}.png', size, x - camera_x, y - camera_y)
+
+        if env.health_drop:
+            drop = env.health_drop
+            self.blit("images/heart.png", drop.size, drop.x - camera_x, drop.y - camera_y)
+
+        # World border, 5 px wide and drawn inside the world rect like pygame.draw.rect does.
+        left, top = -camera_x, -camera_y
+        self.fill_rect(left, top, env.world_width, 5, self.border)
+        self.fill_rect(left, top + env.world_height - 5, env.world_width, 5, self.border)
+        self.fill_rect(left, top, 5, env.world_height, self.border)
+        self.fill_rect(left + env.world_width - 5, top, 5, env.world_height, self.border)
+
+        for wall in env.walls:
+            self.fill_rect(wall.x - camera_x, wall.y - camera_y, wall.width, wall.height, self.wall)
+
+        if env.treasure_chest:
+            chest = env.treasure_chest
+            path = "images/chest_opened.png" if chest.is_opened else "images/chest_closed.png"
+            self.blit(path, chest.size, chest.rect.x - camera_x, chest.rect.y - camera_y)
+
+        return self.buffer
@@ -0,0 +1,124 @@
+import json
+import zlib
+import base64
+import pygame
+from game import ZombieShooter
+
+# An episode of a seeded ZombieShooter is fully determined by its seed, its settings and its actions, so a
+# recording keeps just those: one byte per step. EpisodeReplayer plays one back headless and rebuilds any
+# frame or observation on demand.
+
+# The constructor arguments that change what the simulation or its observations do.
+ENV_SETTINGS = ("window_width", "window_height", "world_width", "world_height", "zombie_pathing", "obs_mode")
+
+
+class EpisodeRecording():
+
+    def __init__(self, seed, repeat, settings, actions=b""):
+        self.seed = seed
+        self.repeat = repeat
+        self.settings = settings
+        self.actions = bytearray(actions)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def env_settings(self):
+        # Recordings made before obs_mode was recorded used the env default, "screen".
+        return {"obs_mode": "screen", **self.settings}
+
+    def to_dict(self):
+        return {"seed": self.seed, "repeat": self.repeat, "settings": self.settings,
+                "actions": base64.b64encode(zlib.compress(bytes(self.actions))).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["seed"], data["repeat"], data["settings"], zlib.decompress(base64.b64decode(data["actions"])))
+
+
+class EpisodeRecorder():
+
+    # Wraps a ZombieShooter: every reset(seed) starts a new recording and every step appends its action.
+
+    def __init__(self, env, repeat=4):
+        self.env = env
+        self.repeat = repeat
+        self.recordings = []
+
+    def reset(self, seed):
+        settings = {name: getattr(self.env, name) for name in ENV_SETTINGS}
+        self.recordings.append(EpisodeRecording(seed, self.repeat, settings))
+
+        return self.env.reset(seed=seed)
+
+    def step(self, action):
+        action = int(action)
+        self.recordings[-1].actions.append(action)
+
+        return self.env.step(action, repeat=self.repeat)
+
+
+def save_recordings(filename, recordings):
+    # One JSON object per line.
+    with open(filename, "w") as f:
+        for recording in recordings:
+            f.write(json.dumps(recording.to_dict()) + "\n")
+
+
+def load_recordings(filename):
+    with open(filename) as f:
+        return [EpisodeRecording.from_dict(json.loads(line)) for line in f if line.strip()]
+
+
+class EpisodeReplayer():
+
+    # Step t means the state after the first t actions; step 0 is the state right after reset. Moving
+    # forward only simulates, and moving backward replays from the seed.
+
+    # obs_mode overrides the recorded one.
+    def __init__(self, recording, obs_mode=None, env=None):
+        self.recording = recording
+
+        if env is None:
+            settings = recording.env_settings()
+
+            if obs_mode is not None:
+                settings["obs_mode"] = obs_mode
+
+            env = ZombieShooter(fps=60, render_mode="rgb", **settings)
+
+        self.env = env
+        self.step = None
+        self.seek(0)
+
+    def seek(self, step):
+        if not 0 <= step <= len(self.recording):
+            raise IndexError(f"Step {step} is outside the recording (0 to {len(self.recording)})")
+
+        if self.step is None or step < self.step:
+            self.env.reset(seed=self.recording.seed)
+            self.step = 0
+
+        while self.step < step:
+            self.env.step(self.recording.actions[self.step], repeat=self.recording.repeat, observe=False)
+            self.step += 1
+
+    def observation(self, step):
+        self.seek(step)
+
+        if self.env.obs_mode == "screen":
+            self.env.render()
+
+        return self.env._get_obs()
+
+    def frame(self, step):
+        # The full window as an (height, width, 3) RGB array.
+        self.seek(step)
+        self.env.render()
+
+        return pygame.surfarray.array3d(self.env.screen).transpose(1, 0, 2)
+
+    def observations(self):
+        # Every observation of the episode in order, as the agent saw them.
+        for step in range(len(self.recording) + 1):
+            yield self.observation(step)
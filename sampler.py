@@ -0,0 +1,88 @@
+import time
+import queue
+import threading
+import torch
+
+# Background batch sampler for the replay buffers in buffer.py. A worker thread keeps up to depth
+# batches gathered in preallocated uint8 slots (pinned when training on CUDA); sample_buffer hands the
+# next slot to the device with a non-blocking copy and converts it to float there. The networks divide
+# by 255 themselves, so the scaling also happens on the device.
+
+
+class PrefetchSampler():
+
+    def __init__(self, memory, batch_size, device='cpu', depth=2):
+        self.memory = memory
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+
+        self.cuda = self.device.type == "cuda"
+
+        # One slot per queued batch plus the one the learner is using.
+        self.slots = [torch.empty((2 * batch_size, *memory.stacked_shape), dtype=torch.uint8, pin_memory=self.cuda)
+                      for _ in range(depth + 1)]
+
+        # CUDA events marking when each slot's copy to the device is done and it can be refilled.
+        self.copied = [None] * len(self.slots)
+
+        self.free = queue.Queue()
+        for slot in range(len(self.slots)):
+            self.free.put(slot)
+
+        self.ready = queue.Queue()
+
+        # Time the learner spent waiting for a batch, in total and for the last batch.
+        self.stall_time = 0.0
+        self.last_stall = 0.0
+        self.batches = 0
+
+        self.batch = None
+        self.weights = None
+
+        threading.Thread(target=self.prefetch, daemon=True).start()
+
+    def can_sample(self, batch_size):
+        return self.memory.can_sample(batch_size)
+
+    def prefetch(self):
+        while True:
+            slot = self.free.get()
+
+            if self.copied[slot] is not None:
+                self.copied[slot].synchronize()
+
+            while not self.memory.can_sample(self.batch_size):
+                time.sleep(0.01)
+
+            self.ready.put((slot, self.memory.sample_batch(self.batch_size, frames_out=self.slots[slot].numpy())))
+
+    def sample_buffer(self, batch_size):
+        # batch_size is fixed when the sampler is built; the argument keeps the ReplayBuffer signature.
+        start = time.perf_counter()
+        slot, (batch, weights, _, actions, rewards, _, dones) = self.ready.get()
+
+        self.last_stall = time.perf_counter() - start
+        self.stall_time += self.last_stall
+        self.batches += 1
+
+        frames = self.slots[slot].to(self.device, non_blocking=True).float()
+
+        # On the CPU .float() has already copied the slot; on CUDA wait for the copy before refilling it.
+        if self.cuda:
+            self.copied[slot] = torch.cuda.Event()
+            self.copied[slot].record()
+
+        self.free.put(slot)
+
+        states, next_states = frames[:self.batch_size], frames[self.batch_size:]
+        actions = torch.from_numpy(actions).to(self.device, non_blocking=True)
+        rewards = torch.from_numpy(rewards).to(self.device, non_blocking=True)
+        dones = torch.from_numpy(dones).to(self.device, non_blocking=True)
+
+        self.batch = batch
+        self.weights = None if weights is None else torch.from_numpy(weights).float().to(self.device, non_blocking=True)
+
+        return states, actions, rewards, next_states, dones
+
+    def mean_stall(self):
+        return self.stall_time / max(self.batches, 1)
@@ -4,6 +4,7 @@ from util import *
 from game import ZombieShooter
 from agent import Agent
 from model import ZombieNet
+from recording import EpisodeRecorder, save_recordings
 import torch
 
 episodes = 1
@@ -26,6 +27,19 @@ WINDOW_WIDTH, WINDOW_HEIGHT = 1200, 800
 WORLD_WIDTH, WORLD_HEIGHT = 1800, 1200
 FPS = 60
 
+# Episode i is played with seed + i. Each one is recorded as its seed and actions, and saved to
+# recordings_file if set, for EpisodeReplayer to play back.
+seed = 0
+recordings_file = None
+
+# Act with the int8 twin-Q model exported by training with quantized_acting (models/dqn_int8.pt) instead
+# of the float pair.
+quantized = False
+
+# Act with the distilled student network saved by distill.py (models/student.pt) instead of the pair.
+student = False
+student_hidden_layer = 128
+
 env = ZombieShooter(window_width=WINDOW_WIDTH, window_height=WINDOW_HEIGHT,
                     world_height=WORLD_HEIGHT, world_width=WORLD_WIDTH,
                     fps=FPS, sound=False, render_mode="human")
@@ -48,10 +62,21 @@ model2.load_the_model(filename='models/dqn2.pt')
 model1.eval()
 model2.eval()
 
+if quantized:
+    device = 'cpu'
+    int8_model = torch.jit.load('models/dqn_int8.pt')
+
+if student:
+    student_model = ZombieNet(action_dim=env.action_space.n, hidden_dim=student_hidden_layer, observation_shape=observation.shape).to(device)
+    student_model.load_the_model(filename='models/student.pt')
+    student_model.eval()
+
+recorder = EpisodeRecorder(env, repeat=step_repeat)
+
 for episode in range(episodes):
     done = False
     episode_reward = 0
-    state, info = env.reset()
+    state, info = recorder.reset(seed=seed + episode)
     episode_steps = 0
 
     episode_start_time = time.time()
@@ -59,6 +84,16 @@ for episode in range(episodes):
     while not done and episode_steps < max_episode_steps:
         if random.random() < epsilon:
             action = env.action_space.sample()
+        elif student:
+            with torch.no_grad():
+                q_values = student_model.forward(state.unsqueeze(0).to(device))[0]
+
+            action = torch.argmax(q_values, dim=-1, keepdim=True)
+        elif quantized:
+            with torch.no_grad():
+                q_values = int8_model(state.unsqueeze(0)).min(dim=0).values[0]
+
+            action = torch.argmax(q_values, dim=-1, keepdim=True)
         else:
             model1_q_values = model1.forward(state.unsqueeze(0).to(device))[0]
             model2_q_values = model2.forward(state.unsqueeze(0).to(device))[0]
@@ -67,7 +102,7 @@ for episode in range(episodes):
 
             action = torch.argmax(q_values, dim=-1, keepdim=True)
         
-        next_state, reward, done, truncated, info = env.step(action=action, repeat=step_repeat)
+        next_state, reward, done, truncated, info = recorder.step(action)
 
         state = next_state
 
@@ -79,4 +114,7 @@ for episode in range(episodes):
 
     print(f"Completed episode {episode} with score {episode_reward}")
     print(f"Episode Time: {episode_time:1f} seconds")
-    print(f"Episode Steps: {episode_steps}") 
\ No newline at end of file
+    print(f"Episode Steps: {episode_steps}") 
+
+if recordings_file:
+    save_recordings(recordings_file, recorder.recordings)
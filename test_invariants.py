@@ -0,0 +1,325 @@
+import math
+import random
+import numpy as np
+import pygame
+import pytest
+from buffer import FrameReplayBuffer, DiskReplayBuffer, PrioritizedReplayBuffer, SumTree
+from bullet import BulletSystem
+from characters import Zombie, Horde
+from collision import UniformGrid, wall_index
+from util import get_collision
+from walls import walls_1, walls_3
+
+# Equivalence checks behind the bench_* comparisons in benchmark.py, small enough for every change:
+#     python -m pytest -q test_invariants.py
+
+WORLD_WIDTH, WORLD_HEIGHT = 1800, 1200
+
+
+class Box():
+
+    def __init__(self, x, y, size):
+        self.rect = pygame.Rect(x, y, size, size)
+
+
+def fired_bullets(count, seed=0):
+    rng = random.Random(seed)
+    bullets = BulletSystem(WORLD_WIDTH, WORLD_HEIGHT, capacity=4)
+
+    for _ in range(count):
+        bullets.fire(rng.randint(0, WORLD_WIDTH), rng.randint(0, WORLD_HEIGHT), rng.choice(list(BulletSystem.direction_vectors)),
+                     angle_offset=rng.choice((0, -15, 15)))
+
+    return bullets
+
+
+def bullet_rows(bullets):
+    return sorted(zip(*(getattr(bullets, name)[:bullets.count].tolist() for name in ("x", "y", "dx", "dy"))))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_bullet_remove_keeps_the_live_rows(seed):
+    # Swap-remove reorders the survivors, so compare them as sorted rows.
+    bullets = fired_bullets(40, seed)
+    mask = np.random.default_rng(seed).random(40) < 0.4
+    rows = zip(*(getattr(bullets, name)[:40].tolist() for name in ("x", "y", "dx", "dy")))
+    expected = [row for row, gone in zip(rows, mask) if not gone]
+
+    bullets.remove(mask)
+
+    assert bullets.count == 40 - mask.sum()
+    assert bullet_rows(bullets) == sorted(expected)
+
+
+def test_bullet_remove_nothing_or_everything():
+    bullets = fired_bullets(10)
+    rows = bullet_rows(bullets)
+
+    bullets.remove(np.zeros(10, dtype=bool))
+    assert bullet_rows(bullets) == rows
+
+    bullets.remove(np.ones(10, dtype=bool))
+    assert bullets.count == 0
+
+
+@pytest.mark.parametrize("direct_pairs", [0, math.inf])
+@pytest.mark.parametrize("count", [10, 60])
+def test_bullet_hit_matches_a_linear_scan(count, direct_pairs):
+    # Each zombie box takes the first bullet still touching it, as get_collision over the bullet list did.
+    rng = random.Random(count)
+    zombies = [Box(rng.randint(0, 300), rng.randint(0, 200), 80) for _ in range(count)]
+    bullet_boxes = [Box(rng.randint(0, 300), rng.randint(0, 200), 10) for _ in range(count)]
+
+    alive = list(bullet_boxes)
+    expected = []
+    for zombie in zombies:
+        bullet = get_collision(zombie.rect, alive)
+        expected.append(bullet_boxes.index(bullet) if bullet else -1)
+        if bullet:
+            alive.remove(bullet)
+
+    bullets = BulletSystem(WORLD_WIDTH, WORLD_HEIGHT, capacity=count)
+    bullets.direct_pairs = direct_pairs
+    for bullet in bullet_boxes:
+        bullets.fire(bullet.rect.x, bullet.rect.y, "up")
+    positions = list(zip(*(values.tolist() for values in bullets.positions())))
+
+    claims = bullets.hit(np.array([tuple(zombie.rect) for zombie in zombies], dtype=np.int64))
+
+    assert claims.tolist() == expected
+    assert any(claim >= 0 for claim in expected)
+
+    # The claimed bullets are gone and every other bullet is still live.
+    survivors = [position for i, position in enumerate(positions) if i not in set(expected)]
+    assert sorted(zip(*(values.tolist() for values in bullets.positions()))) == sorted(survivors)
+
+
+def test_uniform_grid_all_pairs_matches_every_overlap():
+    rng = random.Random(0)
+    queries = [Box(rng.randint(0, 600), rng.randint(0, 400), 80) for _ in range(50)]
+    boxes = [Box(rng.randint(0, 600), rng.randint(0, 400), rng.choice((10, 150))) for _ in range(50)]
+
+    grid = UniformGrid(cell_size=100)
+    grid.build(np.array([tuple(box.rect) for box in boxes], dtype=np.int64))
+    query_ids, box_ids = grid.all_pairs(np.array([tuple(query.rect) for query in queries], dtype=np.int64))
+
+    expected = [(i, j) for i, query in enumerate(queries) for j, box in enumerate(boxes) if query.rect.colliderect(box.rect)]
+    assert list(zip(query_ids.tolist(), box_ids.tolist())) == expected
+
+
+@pytest.mark.parametrize("walls", [walls_1, walls_3])
+def test_horde_steers_like_zombies(walls):
+    # One Horde.move_toward_player has to leave every zombie exactly where Zombie.move_toward_player does.
+    index = wall_index(walls)
+    random.seed(0)
+
+    horde = Horde(WORLD_WIDTH, WORLD_HEIGHT, size=80)
+    for _ in range(30):
+        horde.spawn(speed=random.randint(1, 4))
+
+    zombies = []
+    for x, y, speed in zip(horde.x[:30], horde.y[:30], horde.speed[:30]):
+        zombie = Zombie(WORLD_WIDTH, WORLD_HEIGHT, size=80, speed=speed)
+        zombie.x, zombie.y = x, y
+        zombies.append(zombie)
+
+    player_x, player_y = WORLD_WIDTH // 2, WORLD_HEIGHT // 2
+
+    for _ in range(50):
+        for zombie in zombies:
+            zombie.move_toward_player(player_x, player_y, index)
+        horde.move_toward_player(player_x, player_y, index.boxes)
+
+    assert [(zombie.x, zombie.y) for zombie in zombies] == list(zip(horde.x[:30].tolist(), horde.y[:30].tolist()))
+    assert [tuple(zombie.rect) for zombie in zombies] == [tuple(box) for box in horde.boxes().tolist()]
+    assert [zombie.direction for zombie in zombies] == [direction for _, _, direction in horde.entries()]
+
+
+def labelled_frame(label):
+    # A (1, 2, 2) frame that encodes its label, so stacks can be read back as labels.
+    return np.array([[[label % 256, label // 256], [0, 0]]], dtype=np.uint8)
+
+
+def frame_labels(stacked):
+    stacked = stacked.reshape(-1, 2, 2).astype(np.int64)
+    return (stacked[:, 0, 0] + 256 * stacked[:, 0, 1]).tolist()
+
+
+def play_episodes(memory, steps, streams=2, seed=0):
+    # Interleaved random-length episodes of several streams. Every observation gets the next label the
+    # first time the buffer sees it, which is also its frame id. Returns the episode predecessor of
+    # every label (-1 at an episode start) and the (state, next_state) labels of every transition.
+    rng = random.Random(seed)
+    previous = []
+    transitions = []
+    current = [None] * streams
+
+    def observe(prev):
+        previous.append(prev)
+        return len(previous) - 1
+
+    for _ in range(steps):
+        stream = rng.randrange(streams)
+
+        if current[stream] is None:
+            current[stream] = observe(-1)
+
+        state = current[stream]
+        next_state = observe(state)
+        done = rng.random() < 0.1
+
+        memory.store_transition(labelled_frame(state), rng.randrange(4), 1.0, labelled_frame(next_state), done, env_index=stream)
+        transitions.append((state, next_state))
+
+        current[stream] = None if done else next_state
+
+    return previous, transitions
+
+
+def expected_stack(label, previous, frame_stack, oldest_live):
+    # The last frame_stack observations of the episode up to label, oldest first. Before the episode
+    # start, or once the older frames have been recycled, the oldest remaining frame is repeated.
+    stack = [label]
+    while len(stack) < frame_stack:
+        prev = previous[stack[0]]
+        stack.insert(0, prev if prev >= oldest_live else stack[0])
+    return stack
+
+
+@pytest.mark.parametrize("frame_stack", [1, 4])
+@pytest.mark.parametrize("frame_capacity", [None, 210])
+def test_frame_buffer_stacks_episode_frames(frame_stack, frame_capacity):
+    memory = FrameReplayBuffer(200, (1, 2, 2), 4, frame_stack=frame_stack, frame_capacity=frame_capacity)
+    previous, transitions = play_episodes(memory, 1000)
+
+    # One frame per transition plus one per episode start.
+    assert memory.frame_ctr == len(previous)
+
+    oldest_live = memory.frame_ctr - memory.frame_capacity
+    transitions = transitions[-memory.mem_size:]
+    live = [i for i, (state, _) in enumerate(transitions) if state >= oldest_live]
+    assert frame_capacity is None or len(live) < len(transitions)
+
+    for i in live:
+        index = (memory.mem_ctr - len(transitions) + i) % memory.mem_size
+        state, next_state = transitions[i]
+
+        stacked = memory.stack(np.array([memory.state_frame[index], memory.next_state_frame[index]]))
+        assert frame_labels(stacked[0]) == expected_stack(state, previous, frame_stack, oldest_live)
+        assert frame_labels(stacked[1]) == expected_stack(next_state, previous, frame_stack, oldest_live)
+
+
+def test_frame_buffer_samples_only_live_transitions():
+    memory = FrameReplayBuffer(200, (1, 2, 2), 4, frame_stack=4, frame_capacity=210)
+    previous, transitions = play_episodes(memory, 1000)
+    oldest_live = memory.frame_ctr - memory.frame_capacity
+    states_before = {next_state: state for state, next_state in transitions}
+
+    np.random.seed(0)
+    batch, weights, states, actions, rewards, next_states, dones = memory.sample_batch(256)
+
+    assert weights is None
+    for state, next_state in zip(states, next_states):
+        state_labels, next_labels = frame_labels(state), frame_labels(next_state)
+        assert min(state_labels) >= oldest_live
+        assert states_before[next_labels[-1]] == state_labels[-1]
+        assert state_labels == expected_stack(state_labels[-1], previous, 4, oldest_live)
+        assert next_labels == expected_stack(next_labels[-1], previous, 4, oldest_live)
+
+
+def test_disk_buffer_resumes_what_it_flushed(tmp_path):
+    memory = FrameReplayBuffer(200, (1, 2, 2), 4, frame_stack=4)
+    disk = DiskReplayBuffer(200, (1, 2, 2), 4, directory=str(tmp_path), frame_stack=4, flush_every=50)
+    play_episodes(memory, 470)
+    play_episodes(disk, 470)
+    disk.flush()
+    del disk
+
+    resumed = DiskReplayBuffer(200, (1, 2, 2), 4, directory=str(tmp_path), frame_stack=4, flush_every=50)
+    assert resumed.resumed
+    assert (resumed.mem_ctr, resumed.frame_ctr) == (memory.mem_ctr, memory.frame_ctr)
+
+    for name in ("state_frame", "next_state_frame", "action_memory", "reward_memory", "terminal_memory"):
+        assert np.array_equal(getattr(resumed, name), getattr(memory, name))
+
+    ids = np.concatenate([memory.state_frame, memory.next_state_frame])
+    assert np.array_equal(resumed.stack(ids), memory.stack(ids))
+
+    # New transitions go on after the resumed ones.
+    resumed.store_transition(labelled_frame(0), 1, 1.0, labelled_frame(1), True)
+    assert resumed.mem_ctr == 471 and resumed.terminal_memory[470 % 200]
+
+
+@pytest.mark.parametrize("change", [dict(max_size=300), dict(input_shape=(1, 4, 4)), dict(frame_capacity=250)])
+def test_disk_buffer_rejects_a_different_layout(tmp_path, change):
+    disk = DiskReplayBuffer(200, (1, 2, 2), 4, directory=str(tmp_path))
+    play_episodes(disk, 10)
+    disk.flush()
+
+    settings = dict(max_size=200, input_shape=(1, 2, 2), n_actions=4, directory=str(tmp_path))
+    with pytest.raises(ValueError):
+        DiskReplayBuffer(**{**settings, **change})
+
+
+def test_sum_tree_nodes_sum_their_children():
+    rng = np.random.default_rng(0)
+    tree = SumTree(100)
+    tree.update(np.arange(100), rng.random(100))
+
+    # Repeated indices in a batch, and the scalar insert path.
+    tree.update(rng.integers(0, 100, 64), rng.random(64))
+    for index in rng.integers(0, 100, 20):
+        tree.update_one(index, rng.random())
+
+    nodes = np.arange(1, tree.leaves)
+    assert np.allclose(tree.tree[nodes], tree.tree[2 * nodes] + tree.tree[2 * nodes + 1])
+    assert np.isclose(tree.total(), tree.get(np.arange(100)).sum())
+
+
+@pytest.mark.parametrize("capacity", [6, 100])
+def test_sum_tree_samples_in_proportion_to_priority(capacity):
+    rng = np.random.default_rng(capacity)
+    priorities = rng.random(capacity) * (rng.random(capacity) < 0.8)
+    tree = SumTree(capacity)
+    tree.update(np.arange(capacity), priorities)
+
+    np.random.seed(0)
+    samples = np.concatenate([tree.sample(64) for _ in range(2000)])
+    frequencies = np.bincount(samples, minlength=capacity) / len(samples)
+
+    assert samples.max() < capacity
+    assert (frequencies[priorities == 0] == 0).all()
+    assert np.allclose(frequencies, priorities / priorities.sum(), atol=0.01)
+
+    # After an update the draws follow the new priorities.
+    priorities[:capacity // 2] = 0
+    tree.update(np.arange(capacity // 2), np.zeros(capacity // 2))
+    samples = np.concatenate([tree.sample(64) for _ in range(2000)])
+    frequencies = np.bincount(samples, minlength=capacity) / len(samples)
+
+    assert (frequencies[:capacity // 2] == 0).all()
+    assert np.allclose(frequencies, priorities / priorities.sum(), atol=0.01)
+
+
+def test_prioritized_buffer_draws_by_td_error():
+    memory = PrioritizedReplayBuffer(200, (1, 2, 2), 4, frame_capacity=400, alpha=1.0, priority_epsilon=0)
+    play_episodes(memory, 200)
+
+    # Only ten transitions keep a priority, the last of them ten times that of the others.
+    td_errors = np.zeros(200)
+    td_errors[:10] = -1
+    td_errors[9] = 10
+    memory.update_priorities(td_errors, np.arange(200))
+
+    np.random.seed(0)
+    counts = np.zeros(200)
+    for _ in range(500):
+        memory.sample_buffer(64)
+        counts += np.bincount(memory.batch, minlength=200)
+
+    assert counts[10:].sum() == 0
+    assert np.isclose(counts[9] / counts[:9].mean(), 10, rtol=0.1)
+
+    # Importance-sampling weights undo the skew: the most likely transition has the smallest weight.
+    weights = dict(zip(memory.batch.tolist(), memory.weights.tolist()))
+    assert weights[9] == min(weights.values())
@@ -1,6 +1,8 @@
 from util import *
 from game import ZombieShooter
+from env_pool import EnvPool
 from agent import Agent
+from profiler import profiler
 
 episodes = 10000
 max_episode_steps = 10000
@@ -18,20 +20,95 @@ gamma = 0.99
 hidden_layer = 1024
 dropout = 0.2
 
+# Observations stacked per network input; the replay buffer stores each frame once either way.
+frame_stack = 1
+
+# Directory for a memory-mapped replay buffer that survives restarts; None keeps it in RAM.
+replay_dir = None
+
+# Keep replay frames zlib-compressed in RAM (ignored when replay_dir is set).
+compress_replay = False
+
+# Sample transitions in proportion to their TD error (sum-tree prioritized replay). Its frames stay
+# uncompressed in RAM, so it can't be combined with replay_dir or compress_replay.
+prioritized_replay = False
+
+# Gather replay batches on a background thread so updates never wait on sampling.
+prefetch = False
+
+# Updates per env step run by a background learner thread while this one steps the env; None learns inline.
+replay_ratio = None
+
+# Env steps between TensorBoard summaries; losses, Q values, rewards and timings are buffered in between.
+metrics_every = 1000
+
+# Time the env and training phases; prints a per-phase table and writes a Chrome trace to profile_trace
+# when training ends.
+profile = False
+profile_trace = 'runs/profile_trace.json'
+
+# Faster CPU updates: channels_last convolutions, input scaling folded into conv1 and bf16 autocast where
+# the CPU supports it. torch_compile also compiles the update (slower than eager on some small CPUs).
+fast_train = False
+torch_compile = False
+
+# Select actions with an int8 copy of the Q networks (CPU only), requantized on a background thread every
+# quantize_every env steps and saved to models/dqn_int8.pt. Not used by actor-learner training.
+quantized_acting = False
+quantize_every = 5000
+
+# More than one env runs them in an EnvPool of worker processes.
+num_envs = 1
+
+# Actor processes for actor-learner training (0 trains in this process). Each actor plays with its own
+# fixed epsilon; pin_cores pins the learner and every actor to one core each.
+num_actors = 0
+actor_threads = 1
+learner_threads = None
+pin_cores = False
+
 WINDOW_WIDTH, WINDOW_HEIGHT = 1200, 800
 WORLD_WIDTH, WORLD_HEIGHT = 1800, 1200
 FPS = 60
 
-env = ZombieShooter(window_width=WINDOW_WIDTH, window_height=WINDOW_HEIGHT,
-                    world_height=WORLD_HEIGHT, world_width=WORLD_WIDTH,
-                    fps=FPS, sound=False, render_mode="rgb")
+env_kwargs = dict(window_width=WINDOW_WIDTH, window_height=WINDOW_HEIGHT,
+                  world_height=WORLD_HEIGHT, world_width=WORLD_WIDTH,
+                  fps=FPS, sound=False)
 
 summary_writer_suffix = f'dqn_lr={learning_rate}_hl={hidden_layer}_batch_size={batch_size}_dropout={dropout}'
 
-agent = Agent(env, dropout=dropout, hidden_layer=hidden_layer,
-              learning_rate=learning_rate, step_repeat=step_repeat,
-              gamma=gamma)
+# The guard keeps spawned EnvPool workers and actors from re-running training when they import this module.
+if __name__ == "__main__":
+
+    if num_envs > 1:
+        env = EnvPool(num_envs=num_envs, env_kwargs=env_kwargs)
+    else:
+        env = ZombieShooter(render_mode="rgb", **env_kwargs)
+
+    # EnvPool workers must be shut down explicitly, or interpreter exit waits on them forever.
+    try:
+        agent = Agent(env, dropout=dropout, hidden_layer=hidden_layer,
+                      learning_rate=learning_rate, step_repeat=step_repeat,
+                      gamma=gamma, frame_stack=frame_stack, replay_dir=replay_dir,
+                      compress_replay=compress_replay, prioritized_replay=prioritized_replay,
+                      prefetch=prefetch, fast_train=fast_train, torch_compile=torch_compile,
+                      quantized_acting=quantized_acting, quantize_every=quantize_every)
+
+        profiler.enable(profile)
 
-agent.train(episodes=episodes, max_episode_steps=max_episode_steps, summary_writer_suffix=summary_writer_suffix,
-            batch_size=batch_size, epsilon=epsilon, epsilon_decay=epsilon_decay, min_epsilon=min_epsilon)
+        if num_actors > 0:
+            agent.train_distributed(num_actors=num_actors, env_kwargs=env_kwargs, episodes=episodes,
+                                    max_episode_steps=max_episode_steps, summary_writer_suffix=summary_writer_suffix,
+                                    batch_size=batch_size, actor_threads=actor_threads,
+                                    learner_threads=learner_threads, pin_cores=pin_cores)
+        else:
+            agent.train(episodes=episodes, max_episode_steps=max_episode_steps, summary_writer_suffix=summary_writer_suffix,
+                        batch_size=batch_size, epsilon=epsilon, epsilon_decay=epsilon_decay, min_epsilon=min_epsilon,
+                        replay_ratio=replay_ratio, metrics_every=metrics_every)
 
+        if profile:
+            print(profiler.summary())
+            profiler.dump_trace(profile_trace)
+    finally:
+        if num_envs > 1:
+            env.close()
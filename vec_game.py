@@ -0,0 +1,494 @@
+import numpy as np
+import torch
+import gymnasium as gym
+from walls import walls_1, walls_2, walls_3
+from raster import ObservationRasterizer
+
+# N independent ZombieShooter worlds simulated in lockstep. Every entity lives in
+# struct-of-arrays buffers of shape (num_envs,) or (num_envs, slots), so a frame is a
+# fixed number of array operations no matter how many worlds or zombies there are.
+#
+# Differences from ZombieShooter:
+#   - bullets that leave the world are dropped instead of flying forever,
+#   - a bullet touching two zombies on the same frame only kills the first one,
+#   - observations are rasterized straight from state (as in obs_mode="raster"),
+#     with sprite alpha thresholded instead of blended.
+
+UP, DOWN, LEFT, RIGHT = range(4)
+DIRECTIONS = ('up', 'down', 'left', 'right')
+
+DIRECTION_DX = np.array([0, 0, -1, 1])
+DIRECTION_DY = np.array([-1, 1, 0, 0])
+
+LEVEL_GOALS = np.array([5, 15, 30, 30])
+
+
+def overlaps(ax, ay, aw, ah, bx, by, bw, bh):
+    # Same test as pygame.Rect.colliderect, broadcast over arrays.
+    return (ax < bx + bw) & (bx < ax + aw) & (ay < by + bh) & (by < ay + ah)
+
+
+def wall_boxes(levels):
+    # Pads every level to the same wall count with boxes far outside the world.
+    max_walls = max(len(walls) for walls in levels)
+    boxes = np.zeros((len(levels), max_walls, 4), dtype=np.int64)
+    boxes[:, :, :2] = -10 ** 6
+
+    for level, walls in enumerate(levels):
+        for i, wall in enumerate(walls):
+            boxes[level, i] = (wall.x, wall.y, wall.width, wall.height)
+
+    return boxes
+
+
+class VecZombieShooter():
+
+    def __init__(self, num_envs, window_width, window_height, world_height, world_width,
+                 seed=None, max_episode_steps=None, max_bullets=32, obs_size=128):
+
+        self.num_envs = num_envs
+        self.window_width = window_width
+        self.window_height = window_height
+        self.world_width = world_width
+        self.world_height = world_height
+        self.max_episode_steps = max_episode_steps
+
+        self.rng = np.random.default_rng(seed)
+
+        self.action_space = gym.spaces.Discrete(7)
+
+        self.player_size = 50
+        self.player_speed = 5
+        self.zombie_size = 80
+        self.bullet_size = 10
+        self.bullet_speed = 10
+        self.chest_size = 50
+        self.drop_size = 30
+
+        self.level_walls = wall_boxes([walls_1, walls_2, walls_3])
+
+        n = num_envs
+        max_zombies = 5 + 2 * (len(self.level_walls) - 1)
+
+        self.level = np.ones(n, dtype=np.int64)
+        self.level_goal = np.zeros(n, dtype=np.int64)
+        self.max_zombie_count = np.zeros(n, dtype=np.int64)
+        self.zombie_top_speed = np.zeros(n, dtype=np.int64)
+        self.total_frames = np.zeros(n, dtype=np.int64)
+        self.last_bullet_frame = np.zeros(n, dtype=np.int64)
+        self.shotgun_ammo = np.zeros(n, dtype=np.int64)
+        self.episode_steps = np.zeros(n, dtype=np.int64)
+        self.done = np.zeros(n, dtype=bool)
+        self.walls = self.level_walls[self.level - 1]
+
+        self.player_x = np.zeros(n, dtype=np.int64)
+        self.player_y = np.zeros(n, dtype=np.int64)
+        self.player_dir = np.zeros(n, dtype=np.int64)
+        self.health = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+
+        self.zombie_x = np.zeros((n, max_zombies))
+        self.zombie_y = np.zeros((n, max_zombies))
+        self.zombie_speed = np.zeros((n, max_zombies))
+        self.zombie_dir = np.zeros((n, max_zombies), dtype=np.int64)
+        self.zombie_alive = np.zeros((n, max_zombies), dtype=bool)
+
+        self.bullet_x = np.zeros((n, max_bullets))
+        self.bullet_y = np.zeros((n, max_bullets))
+        self.bullet_dx = np.zeros((n, max_bullets))
+        self.bullet_dy = np.zeros((n, max_bullets))
+        self.bullet_alive = np.zeros((n, max_bullets), dtype=bool)
+
+        self.drop_x = np.zeros(n, dtype=np.int64)
+        self.drop_y = np.zeros(n, dtype=np.int64)
+        self.drop_alive = np.zeros(n, dtype=bool)
+
+        self.chest_x = np.zeros(n, dtype=np.int64)
+        self.chest_y = np.zeros(n, dtype=np.int64)
+        self.chest_alive = np.zeros(n, dtype=bool)
+        self.chest_opened = np.zeros(n, dtype=bool)
+
+        self.rasterizer = ObservationRasterizer(window_width, window_height, obs_size)
+        self.obs = np.zeros((n, 1, obs_size, obs_size), dtype=np.uint8)
+
+        self.player_sprites = self.load_sprites([(f'images/player_{d}.png', self.player_size) for d in DIRECTIONS])
+        self.zombie_sprites = self.load_sprites([(f'images/zombie_{d}.png', self.zombie_size) for d in DIRECTIONS])
+        self.chest_sprites = self.load_sprites([("images/chest_closed.png", self.chest_size),
+                                                ("images/chest_opened.png", self.chest_size)])
+        self.drop_sprites = self.load_sprites([("images/heart.png", self.drop_size)])
+
+    def load_sprites(self, paths):
+        grays, opaque = [], []
+
+        for path, size in paths:
+            gray, alpha = self.rasterizer.get_sprite(path, size)
+            grays.append(np.rint(gray).astype(np.uint8))
+            opaque.append(alpha >= 0.5)
+
+        return np.stack(grays), np.stack(opaque)
+
+    def reset(self):
+        worlds = np.arange(self.num_envs)
+
+        self._reset_worlds(worlds)
+        self._draw(worlds)
+
+        return torch.from_numpy(self.obs).float(), self._get_info()
+
+    def step(self, actions, repeat=4):
+        actions = np.array(actions, dtype=np.int64).reshape(self.num_envs)
+
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+
+        for i in range(repeat):
+            active = ~self.done
+
+            if not active.any():
+                break
+
+            rewards += self._step(actions, active)
+
+            actions[(actions == 5) | (actions == 6)] = 0
+
+        dones = self.done.copy()
+
+        self.episode_steps += 1
+
+        if self.max_episode_steps is not None:
+            truncated = ~dones & (self.episode_steps >= self.max_episode_steps)
+        else:
+            truncated = np.zeros(self.num_envs, dtype=bool)
+
+        worlds = np.arange(self.num_envs)
+        self._draw(worlds)
+
+        info = self._get_info()
+
+        # Auto-reset finished worlds; their last frame is kept in the info dict.
+        finished = np.flatnonzero(dones | truncated)
+        info["final_observation"] = torch.from_numpy(self.obs[finished]).float()
+        info["final_index"] = finished
+
+        if len(finished):
+            self._reset_worlds(finished)
+            self._draw(finished)
+
+        return torch.from_numpy(self.obs).float(), rewards, dones, truncated, info
+
+    def _get_info(self):
+        return {
+            "health": self.health.copy(),
+            "score": self.score.copy(),
+            "level": self.level.copy(),
+            "shotgun_ammo": self.shotgun_ammo.copy(),
+            "bullets": self.bullet_alive.sum(1)
+        }
+
+    def _reset_worlds(self, worlds):
+        self.level[worlds] = 1
+        self.level_goal[worlds] = LEVEL_GOALS[0]
+        self.max_zombie_count[worlds] = 5
+        self.zombie_top_speed[worlds] = 1
+        self.total_frames[worlds] = 0
+        self.last_bullet_frame[worlds] = 0
+        self.shotgun_ammo[worlds] = 0
+        self.episode_steps[worlds] = 0
+        self.done[worlds] = False
+        self.walls[worlds] = self.level_walls[0]
+
+        self.zombie_alive[worlds] = False
+        self.bullet_alive[worlds] = False
+        self.drop_alive[worlds] = False
+        self.chest_alive[worlds] = False
+        self.chest_opened[worlds] = False
+
+        self._place_players(worlds)
+
+    def _place_players(self, worlds):
+        self.player_x[worlds] = self.world_width // 2
+        self.player_y[worlds] = self.world_height // 2
+        self.player_dir[worlds] = UP
+        self.health[worlds] = 5
+        self.score[worlds] = 0
+
+        # Random-walk out of any wall, like Player.__init__.
+        while len(worlds):
+            blocked = self._hits_wall(self.player_x[worlds], self.player_y[worlds], self.player_size, self.walls[worlds])
+            worlds = worlds[blocked]
+
+            self.player_x[worlds] += self.rng.integers(-5, 6, len(worlds))
+            self.player_y[worlds] += self.rng.integers(-5, 6, len(worlds))
+
+    def _next_level(self, worlds):
+        self.level[worlds] += 1
+
+        level = self.level[worlds]
+        wall_level = np.minimum(level, len(self.level_walls)) - 1
+
+        self.zombie_alive[worlds] = False
+        self.bullet_alive[worlds] = False
+
+        self.walls[worlds] = self.level_walls[wall_level]
+        self.level_goal[worlds] = LEVEL_GOALS[np.minimum(level, len(LEVEL_GOALS)) - 1]
+
+        self.chest_x[worlds] = self.rng.integers(50, self.world_width - 50 + 1, len(worlds))
+        self.chest_y[worlds] = self.rng.integers(50, self.world_height - 50 + 1, len(worlds))
+        self.chest_alive[worlds] = True
+        self.chest_opened[worlds] = False
+
+        self.zombie_top_speed[worlds] += 1
+        self.max_zombie_count[worlds] += 2
+
+        self._place_players(worlds)
+
+        self.done[worlds[level > len(self.level_walls)]] = True
+
+    def _hits_wall(self, x, y, size, walls):
+        # x, y are (n,) or (n, k) rect corners, each row tested against its own world's walls.
+        walls = walls.reshape(walls.shape[0], *([1] * (x.ndim - 1)), -1, 4)
+
+        return overlaps(x[..., None], y[..., None], size, size,
+                        walls[..., 0], walls[..., 1], walls[..., 2], walls[..., 3]).any(-1)
+
+    def _step(self, actions, active):
+        n = self.num_envs
+        rows = np.arange(n)
+        reward = np.zeros(n, dtype=np.float32)
+
+        self.total_frames += active
+
+        # Firing. Action 5 (switch gun) is disabled in ZombieShooter, so every shot is a single bullet.
+        fire = active & (actions == 6) & (self.total_frames - self.last_bullet_frame > 10)
+        slot = np.argmin(self.bullet_alive, axis=1)
+        shoot = fire & ~self.bullet_alive[rows, slot]
+        w, s = rows[shoot], slot[shoot]
+        self.bullet_x[w, s] = self.player_x[w]
+        self.bullet_y[w, s] = self.player_y[w]
+        self.bullet_dx[w, s] = DIRECTION_DX[self.player_dir[w]] * self.bullet_speed
+        self.bullet_dy[w, s] = DIRECTION_DY[self.player_dir[w]] * self.bullet_speed
+        self.bullet_alive[w, s] = True
+        self.last_bullet_frame[fire] = self.total_frames[fire]
+
+        # Spawning.
+        spawn = active & (self.zombie_alive.sum(1) < self.max_zombie_count) & (self.rng.integers(1, 101, n) < 3)
+        slot = np.argmin(self.zombie_alive, axis=1)
+        w, s = rows[spawn], slot[spawn]
+        edge = self.rng.integers(0, 4, len(w))
+        along_x = self.rng.integers(0, self.world_width - self.zombie_size + 1, len(w))
+        along_y = self.rng.integers(0, self.world_height - self.zombie_size + 1, len(w))
+        self.zombie_x[w, s] = np.select([edge < 2, edge == 2], [along_x, 0], self.world_width - self.zombie_size)
+        self.zombie_y[w, s] = np.select([edge == 0, edge == 1], [0, self.world_height - self.zombie_size], along_y)
+        self.zombie_speed[w, s] = self.rng.integers(1, self.zombie_top_speed[w] + 1)
+        self.zombie_dir[w, s] = UP
+        self.zombie_alive[w, s] = True
+
+        # Player movement, one axis at a time.
+        left, right = active & (actions == 3), active & (actions == 4)
+        up, down = active & (actions == 1), active & (actions == 2)
+
+        new_x = self.player_x + (right.astype(np.int64) - left) * self.player_speed
+        self.player_dir[left] = LEFT
+        self.player_dir[right] = RIGHT
+        moved = (new_x != self.player_x) & (new_x >= 0) & (new_x <= self.world_width - self.player_size) \
+            & ~self._hits_wall(new_x, self.player_y, self.player_size, self.walls)
+        self.player_x = np.where(moved, new_x, self.player_x)
+
+        new_y = self.player_y + (down.astype(np.int64) - up) * self.player_speed
+        self.player_dir[up] = UP
+        self.player_dir[down] = DOWN
+        moved = (new_y != self.player_y) & (new_y >= 0) & (new_y <= self.world_height - self.player_size) \
+            & ~self._hits_wall(self.player_x, new_y, self.player_size, self.walls)
+        self.player_y = np.where(moved, new_y, self.player_y)
+
+        px, py = self.player_x[:, None], self.player_y[:, None]
+
+        # Bullet hits. Each zombie takes the first bullet touching it and each bullet kills one zombie.
+        zx, zy = np.floor(self.zombie_x + 0.5), np.floor(self.zombie_y + 0.5)
+        bx, by = np.floor(self.bullet_x + 0.5), np.floor(self.bullet_y + 0.5)
+
+        hit = overlaps(zx[:, :, None], zy[:, :, None], self.zombie_size, self.zombie_size,
+                       bx[:, None, :], by[:, None, :], self.bullet_size, self.bullet_size)
+        hit &= self.zombie_alive[:, :, None] & self.bullet_alive[:, None, :] & active[:, None, None]
+        hit &= np.cumsum(hit, axis=2) == 1
+        hit &= np.cumsum(hit, axis=1) == 1
+
+        killed = hit.any(2)
+        self.bullet_alive &= ~hit.any(1)
+
+        kills = killed.sum(1)
+        self.score += kills
+        reward += kills
+
+        dropped = killed & (self.rng.integers(1, 101, killed.shape) <= 20)
+        has_drop = dropped.any(1)
+        last = dropped.shape[1] - 1 - np.argmax(dropped[:, ::-1], axis=1)
+        self.drop_x[has_drop] = zx[has_drop, last[has_drop]]
+        self.drop_y[has_drop] = zy[has_drop, last[has_drop]]
+        self.drop_alive |= has_drop
+
+        # Bites. A zombie that reaches the player is used up.
+        bitten = self.zombie_alive & ~killed & active[:, None] & \
+            overlaps(zx, zy, self.zombie_size, self.zombie_size, px, py, self.player_size, self.player_size)
+
+        bites = bitten.sum(1)
+        self.health -= bites
+        reward -= bites
+
+        self.zombie_alive &= ~(killed | bitten)
+
+        # Zombie steering with the axis-separated wall sliding of Zombie.move_toward_player.
+        dx, dy = px - self.zombie_x, py - self.zombie_y
+        distance = np.hypot(dx, dy)
+        distance[distance == 0] = 1
+        dx, dy = dx / distance, dy / distance
+
+        x, y, speed, size = self.zombie_x, self.zombie_y, self.zombie_speed, self.zombie_size
+
+        new_x = x + dx * speed
+        can_move_x = ~self._hits_wall(np.trunc(new_x), np.trunc(y), size, self.walls)
+        slide_y = y + dy * speed * 1.5
+        can_slide_y = ~can_move_x & ~self._hits_wall(np.trunc(x), np.trunc(slide_y), size, self.walls)
+        x = np.where(can_move_x, new_x, x)
+        y = np.where(can_slide_y, slide_y, y)
+
+        new_y = y + dy * speed
+        can_move_y = ~self._hits_wall(np.trunc(x), np.trunc(new_y), size, self.walls)
+        slide_x = x + dx * speed * 1.5
+        can_slide_x = ~can_move_y & ~self._hits_wall(np.trunc(slide_x), np.trunc(y), size, self.walls)
+        y = np.where(can_move_y, new_y, y)
+        x = np.where(can_slide_x, slide_x, x)
+
+        moving = self.zombie_alive & active[:, None]
+        self.zombie_x = np.where(moving, x, self.zombie_x)
+        self.zombie_y = np.where(moving, y, self.zombie_y)
+
+        direction = np.where(np.abs(dx) > np.abs(dy), np.where(dx > 0, RIGHT, LEFT), np.where(dy > 0, DOWN, UP))
+        self.zombie_dir = np.where(moving, direction, self.zombie_dir)
+
+        # Bullets fly, and stop at walls or the world edge.
+        moving = self.bullet_alive & active[:, None]
+        self.bullet_x += np.where(moving, self.bullet_dx, 0)
+        self.bullet_y += np.where(moving, self.bullet_dy, 0)
+
+        bx, by = np.floor(self.bullet_x + 0.5), np.floor(self.bullet_y + 0.5)
+        gone = self._hits_wall(bx, by, self.bullet_size, self.walls) \
+            | (bx + self.bullet_size <= 0) | (bx >= self.world_width) \
+            | (by + self.bullet_size <= 0) | (by >= self.world_height)
+        self.bullet_alive &= ~(moving & gone)
+
+        # Pickups.
+        px, py = self.player_x, self.player_y
+
+        opened = active & self.chest_alive & ~self.chest_opened & \
+            overlaps(px, py, self.player_size, self.player_size, self.chest_x, self.chest_y, self.chest_size, self.chest_size)
+        self.chest_opened |= opened
+        self.shotgun_ammo = np.where(opened, np.minimum(self.shotgun_ammo + 5, 20), self.shotgun_ammo)
+        reward += opened
+
+        picked = active & self.drop_alive & \
+            overlaps(px, py, self.player_size, self.player_size, self.drop_x, self.drop_y, self.drop_size, self.drop_size)
+        self.health = np.where(picked, np.minimum(self.health + 1, 100), self.health)
+        self.drop_alive &= ~picked
+        reward += picked
+
+        self.done |= active & (self.health <= 0)
+
+        level_up = active & (self.score >= self.level_goal)
+        if level_up.any():
+            self._next_level(rows[level_up])
+
+        return reward
+
+    def _get_camera(self, worlds):
+        camera_x = np.clip(self.player_x[worlds] - self.window_width // 2, 0, self.world_width - self.window_width)
+        camera_y = np.clip(self.player_y[worlds] - self.window_height // 2, 0, self.world_height - self.window_height)
+
+        return camera_x, camera_y
+
+    def _draw(self, worlds):
+        r = self.rasterizer
+
+        self.obs[worlds] = r.background
+
+        camera_x, camera_y = self._get_camera(worlds)
+
+        def entities(alive, x, y):
+            # w indexes into worlds, s is the slot of each live entity.
+            w, s = np.nonzero(alive[worlds])
+            return worlds[w], x[worlds][w, s] - camera_x[w], y[worlds][w, s] - camera_y[w], (worlds[w], s)
+
+        w, x, y, _ = entities(self.bullet_alive, np.floor(self.bullet_x + 0.5), np.floor(self.bullet_y + 0.5))
+        self._blit(w, x, y, self.bullet_size, self.bullet_size, value=r.bullet)
+
+        self._blit(worlds, self.player_x[worlds] - camera_x, self.player_y[worlds] - camera_y,
+                   self.player_size, self.player_size, sprites=self.player_sprites, index=self.player_dir[worlds])
+
+        w, x, y, slots = entities(self.zombie_alive, np.trunc(self.zombie_x), np.trunc(self.zombie_y))
+        self._blit(w, x, y, self.zombie_size, self.zombie_size, sprites=self.zombie_sprites, index=self.zombie_dir[slots])
+
+        drop = self.drop_alive[worlds]
+        self._blit(worlds[drop], self.drop_x[worlds][drop] - camera_x[drop], self.drop_y[worlds][drop] - camera_y[drop],
+                   self.drop_size, self.drop_size, sprites=self.drop_sprites, index=np.zeros(drop.sum(), dtype=np.int64))
+
+        # World border, 5 px wide inside the world rect.
+        left, top = -camera_x, -camera_y
+        right, bottom = left + self.world_width - 5, top + self.world_height - 5
+        for x, y, width, height in ((left, top, self.world_width, 5), (left, bottom, self.world_width, 5),
+                                    (left, top, 5, self.world_height), (right, top, 5, self.world_height)):
+            self._blit(worlds, x, y, width, height, value=r.border)
+
+        walls = self.walls[worlds]
+        w, s = np.nonzero(walls[:, :, 2] > 0)
+        self._blit(worlds[w], walls[w, s, 0] - camera_x[w], walls[w, s, 1] - camera_y[w],
+                   walls[w, s, 2], walls[w, s, 3], value=r.wall)
+
+        chest = self.chest_alive[worlds]
+        self._blit(worlds[chest], self.chest_x[worlds][chest] - camera_x[chest], self.chest_y[worlds][chest] - camera_y[chest],
+                   self.chest_size, self.chest_size, sprites=self.chest_sprites,
+                   index=self.chest_opened[worlds][chest].astype(np.int64))
+
+    def _blit(self, worlds, x, y, width, height, value=None, sprites=None, index=None):
+        # Draws one box (or sprite) per entry into self.obs, sampled like cv2 INTER_NEAREST.
+        if len(worlds) == 0:
+            return
+
+        r = self.rasterizer
+        size = r.obs_size
+
+        x, y = np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64)
+        width, height = np.broadcast_to(width, x.shape), np.broadcast_to(height, y.shape)
+
+        j0, j1 = np.searchsorted(r.col_src, x), np.searchsorted(r.col_src, x + width)
+        i0, i1 = np.searchsorted(r.row_src, y), np.searchsorted(r.row_src, y + height)
+
+        visible = (j1 > j0) & (i1 > i0)
+        if not visible.any():
+            return
+
+        if not visible.all():
+            worlds, x, y, j0, j1, i0, i1 = (a[visible] for a in (worlds, x, y, j0, j1, i0, i1))
+            if index is not None:
+                index = index[visible]
+
+        span_w, span_h = int((j1 - j0).max()), int((i1 - i0).max())
+
+        cols = j0[:, None] + np.arange(span_w)
+        rows = i0[:, None] + np.arange(span_h)
+        mask = (rows < i1[:, None])[:, :, None] & (cols < j1[:, None])[:, None, :]
+        cols = np.minimum(cols, size - 1)
+        rows = np.minimum(rows, size - 1)
+
+        if sprites is None:
+            values = np.full(mask.shape, value, dtype=np.uint8)
+        else:
+            gray, opaque = sprites
+            src_r = np.clip(r.row_src[rows] - y[:, None], 0, gray.shape[1] - 1)[:, :, None]
+            src_c = np.clip(r.col_src[cols] - x[:, None], 0, gray.shape[2] - 1)[:, None, :]
+            k = index[:, None, None]
+            values = gray[k, src_r, src_c]
+            mask &= opaque[k, src_r, src_c]
+
+        shape = mask.shape
+        self.obs[np.broadcast_to(worlds[:, None, None], shape)[mask], 0,
+                 np.broadcast_to(rows[:, :, None], shape)[mask],
+                 np.broadcast_to(cols[:, None, :], shape)[mask]] = values[mask]